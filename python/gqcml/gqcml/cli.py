@@ -0,0 +1,76 @@
+import argparse
+from gqcml.data_generators import huckel_dataset
+from gqcml.data import QM9
+
+def int_list(string):
+    """
+    Converts a comma separated string of integers to a list, e.g. "1,1,0" becomes [1,1,0]
+    """
+    return [int(el) for el in string.split(",")]
+
+def huckel(args):
+    """
+    Generates a Hückel dataset from the parsed command line arguments (see generate_huckel_dataset)
+    """
+    huckel_dataset.generate_huckel_dataset(args.output, args.sites, args.triu, args.samples,
+                                           args.alpha, args.beta, diagonal_vector=args.diagonal,
+                                           seed=args.seed, shard_size=args.shard_size, processes=args.processes,
+                                           diagonal_interval=args.diagonal_interval,
+                                           off_diagonal_interval=args.off_diagonal_interval,
+                                           prefix=args.prefix, density=args.density,
+                                           compression=args.compression, verbose=args.verbose)
+
+def qm9(args):
+    """
+    Converts the raw QM9 dataset to a collated graph store from the parsed command line arguments (see QM9.format_dataset)
+    """
+    QM9.format_dataset(args.root_dir, args.target, args.descr, batch_size=args.batch_size,
+                       processes=args.processes, archive=args.archive, cutoff=args.cutoff,
+                       max_neighbours=args.max_neighbours, verbose=args.verbose)
+
+def main(argv=None):
+    """
+    The entry point of the gqcml command line interface
+    """
+    parser = argparse.ArgumentParser(prog="gqcml", description="Ghent Quantum Chemistry Machine Learning")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    huckel_parser = subparsers.add_parser("huckel", help="Sample and solve a Hückel dataset in parallel and store it in HDF5")
+    huckel_parser.add_argument("output", help="The HDF5 file in which the dataset is stored")
+    huckel_parser.add_argument("--sites", type=int, required=True, help="The number of sites in the system")
+    huckel_parser.add_argument("--triu", type=int_list, required=True,
+                               help="Comma separated upper triangle (including the diagonal) of 0's and 1's describing the structure")
+    huckel_parser.add_argument("--diagonal", type=int_list, default=None,
+                               help="Comma separated vertex types, enables inhomogeneous sampling")
+    huckel_parser.add_argument("--samples", type=int, required=True, help="The number of systems in the dataset")
+    huckel_parser.add_argument("--alpha", type=int, required=True, help="The number of alpha electrons")
+    huckel_parser.add_argument("--beta", type=int, required=True, help="The number of beta electrons")
+    huckel_parser.add_argument("--seed", type=int, default=0, help="The random seed of the dataset")
+    huckel_parser.add_argument("--shard-size", type=int, default=100000, help="The number of systems per worker task")
+    huckel_parser.add_argument("--processes", type=int, default=None, help="The number of worker processes (all cores by default)")
+    huckel_parser.add_argument("--diagonal-interval", type=float, nargs=2, default=[-5,0.001])
+    huckel_parser.add_argument("--off-diagonal-interval", type=float, nargs=2, default=[-5,-0.001])
+    huckel_parser.add_argument("--prefix", default="train", help="The prefix of the dataset names, e.g. train_input")
+    huckel_parser.add_argument("--density", action="store_true", help="Store the density matrices as well")
+    huckel_parser.add_argument("--compression", type=int, default=4, help="The gzip compression level")
+    huckel_parser.add_argument("--verbose", action="store_true")
+    huckel_parser.set_defaults(func=huckel)
+
+    qm9_parser = subparsers.add_parser("qm9", help="Convert the raw QM9 xyz files to a collated graph store in parallel")
+    qm9_parser.add_argument("root_dir", help="The directory containing the raw and processed directories")
+    qm9_parser.add_argument("--target", required=True, help="The scalar property used as the target, e.g. U_0")
+    qm9_parser.add_argument("--descr", required=True, help="The description of the target used in the filename of the store")
+    qm9_parser.add_argument("--archive", default=None, help="The raw QM9 tarball, streamed instead of the raw directory")
+    qm9_parser.add_argument("--cutoff", type=float, default=None, help="The radius within which atoms are connected (all pairs by default)")
+    qm9_parser.add_argument("--max-neighbours", type=int, default=None, help="The maximum number of neighbours of an atom")
+    qm9_parser.add_argument("--batch-size", type=int, default=1000, help="The number of molecules per worker task")
+    qm9_parser.add_argument("--processes", type=int, default=None, help="The number of worker processes (all cores by default)")
+    qm9_parser.add_argument("--verbose", action="store_true")
+    qm9_parser.set_defaults(func=qm9)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__=="__main__":
+    main()
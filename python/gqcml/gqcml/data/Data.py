@@ -1,4 +1,58 @@
 import numpy as np
+from functools import lru_cache
+
+@lru_cache(maxsize=None)
+def one_hot_table(num_classes, zero_class=False):
+    """
+    Constructs the lookup table used in the categorical encoding of integer features. Indexing the table
+    with an integer array returns the one-hot vectors of all the elements at once. The tables are cached
+    so that every size is only constructed once
+
+    Arguments
+        :num_classes (int): The number of categories, i.e. the length of the one-hot vectors
+        :zero_class (opt,bool): Option to prepend a row of zeros to the table so that the index 0 is encoded as
+                                the zero vector and the index k as the k-th one-hot vector
+    Returns
+        :table (np.array): A read-only ((num_classes(+1)) x num_classes) numpy array
+    """
+    table = np.eye(num_classes)
+    if zero_class:
+        table = np.concatenate([np.zeros((1, num_classes)), table], 0)
+    table.setflags(write=False)
+    return table
+
+@lru_cache(maxsize=None)
+def triu_indices(graph_dim):
+    """
+    Returns the row and column indices of the upper triangle (including the diagonal) of a (N x N) matrix.
+    The indices are computed once per graph dimension and shared by all conversions between upper triangles
+    and matrices
+
+    Arguments
+        :graph_dim (int): The number of vertices N
+    Returns
+        :row_indices, column_indices (tuple): Two read-only numpy arrays of length N(N+1)/2
+    """
+    indices = np.triu_indices(graph_dim, 0)
+    for index_array in indices:
+        index_array.setflags(write=False)
+    return indices
+
+@lru_cache(maxsize=None)
+def diagonal_indices(graph_dim):
+    """
+    Returns the indices of the diagonal of a (N x N) matrix. Prepend an Ellipsis to index a stack of matrices, i.e.
+    (...,)+diagonal_indices(N). The indices are computed once per graph dimension
+
+    Arguments
+        :graph_dim (int): The number of vertices N
+    Returns
+        :diagonal_indices (tuple): Two read-only numpy arrays of length N
+    """
+    indices = np.diag_indices(graph_dim)
+    for index_array in indices:
+        index_array.setflags(write=False)
+    return indices
 
 class Preprocessor():
     """
@@ -6,73 +60,65 @@ class Preprocessor():
 
     Attributes
         :graph_dim (int): An attribute that describes the graph dimension of the set of graphs that will be processed
+
+    Every method accepts a single (N x N) matrix or a stack of matrices with the dimensions (B x N x N). For a stack
+    the outputs are stacked along the same leading dimension, e.g. node features have the dimensions (B x N x F)
     """
     def __init__(self, graph_dim):
         self.graph_dim = graph_dim
 
-    def __off_diagonal_format(self, matrix):
-        """        
-        A function that copies the given matrix and returns a copy of the matrix with
-        the diagonal of the initial matrix removed
-
-        this function is a utility function
+    def __reciprocal(self, matrix):
         """
-        off_diagonal_matrix = np.copy(matrix)
-        off_diagonal_matrix[np.diag_indices(self.graph_dim)]=0
-        return off_diagonal_matrix.reshape(self.graph_dim, self.graph_dim, 1, 1)
+        A function that inverts the nonzero elements of a matrix while the zero elements remain zero
 
-    def __diagonal_to_matrix(self, matrix, binary_matrix, repeat_along):
+        This function is a utility function that is used in feature construction to average over the neighbour counts
         """
-        A function that extracts the diagonal of the matrix and generates a matrix
-        where the diagonal is repeated as a row of the matrix. In addition to this
-        we multiply this matrix with the binary form to obtain adjacency matrix
-        that describes the graph in terms of the vertex self loops
+        return np.divide(1, matrix, out=np.zeros(matrix.shape), where=matrix!=0)
 
-        This function is a utility function that is used in feature construction
+    def triu_to_matrix(self, triu):
         """
-        if repeat_along=="row":
-            #Repeat the diagonal weight along the row
-            #The columns contain the unique weights
-            neighbourhood_vertex_weights = np.repeat(np.diag(matrix).reshape(1,-1),
-                                                     self.graph_dim, 0).reshape(self.graph_dim, self.graph_dim, 1, 1)
-            #Filter out the matrix elements that are not present in the adjacency matrix
-            neighbourhood_vertex_weights = binary_matrix*neighbourhood_vertex_weights
-            return neighbourhood_vertex_weights
-        else:
-            #Repeat the diagonal weight along the column
-            #The rows contain the unique weights
-            neighbourhood_vertex_weights = np.repeat(np.diag(matrix).reshape(1,-1),
-                                                     self.graph_dim, 1).reshape(self.graph_dim, self.graph_dim, 1, 1)
-            neighbourhood_vertex_weights = binary_matrix*neighbourhood_vertex_weights
-            return neighbourhood_vertex_weights
-
-    def __categorical_matrix(self, categorical_features, binary_matrix, num_degrees=3):
+        Convert a vector of upper triangular values to a full, symmetric matrix.
+
+        Arguments
+            :triu (np.array): A 1D numpy array containing the upper triangle values of a symmetric
+                                matrix or a 2D numpy array containing a stack of upper triangles
+        Returns
+            :matrix (np.array): The matrix form of the upper triangle(s)
         """
-        A function that takes the categorical features and constructs a matrix where this 
-        feature is repeated as a column. The columns are as such equivalent and the rows are the
-        a repetition of the same tensor
+        return self.trius_to_matrices(triu)
 
-        This function is a utility function that is used in feature construction
+    def trius_to_matrices(self, trius, out=None):
         """
-        cat_degree_matrix = np.repeat(categorical_features.reshape(self.graph_dim,1,num_degrees),
-                                      self.graph_dim,1).reshape(self.graph_dim, self.graph_dim, 1, num_degrees)
-        cat_degree_matrix = binary_matrix*cat_degree_matrix
-        return cat_degree_matrix
+        Converts a stack of upper triangles to a stack of full, symmetric matrices. The upper triangle and its
+        mirror image cover every element, so the output buffer does not need to be cleared beforehand
 
-    def triu_to_matrix(self, triu):
+        Arguments
+            :trius (np.array): A (B x N(N+1)/2) numpy array containing the upper triangles
+            :out (opt, np.array): A preallocated (B x N x N) numpy array in which the matrices are written
+        Returns
+            :matrices (np.array): A (B x N x N) numpy array containing the matrices
         """
-        Convert a vector of upper triangular values to a full, symmetric matrix.
+        trius = np.asarray(trius)
+        row_indices, column_indices = triu_indices(self.graph_dim)
+        if out is None:
+            out = np.empty(trius.shape[:-1]+(self.graph_dim, self.graph_dim))
+        out[..., row_indices, column_indices] = trius
+        out[..., column_indices, row_indices] = trius
+        return out
+
+    def matrices_to_trius(self, matrices, out=None):
+        """
+        Extracts the upper triangles (including the diagonal) of a stack of symmetric matrices
 
         Arguments
-            :triu (np.array): A 1D numpy array containing the upper triangle values of a symmetric
-                                matrix
+            :matrices (np.array): A (B x N x N) numpy array containing the matrices
+            :out (opt, np.array): A preallocated (B x N(N+1)/2) numpy array in which the upper triangles are written
         Returns
-            :matrix (np.array): The matrix form of the upper triangle
+            :trius (np.array): A (B x N(N+1)/2) numpy array containing the upper triangles
         """
-        matrix = np.zeros((self.graph_dim, self.graph_dim))
-        matrix[np.triu_indices(self.graph_dim, 0)] = triu
-        matrix.T[np.triu_indices(self.graph_dim, 0)] = triu
-        return matrix
+        row_indices, column_indices = triu_indices(self.graph_dim)
+        flat_matrices = np.reshape(matrices, matrices.shape[:-2]+(-1,))
+        return np.take(flat_matrices, row_indices*self.graph_dim+column_indices, axis=-1, out=out)
 
     def binarize_matrix(self, matrix, diagonal=True):
         """
@@ -86,13 +132,13 @@ class Preprocessor():
         """
         binary_matrix = np.where(matrix!=0, 1, matrix)
         if diagonal:
-            return binary_matrix.reshape(self.graph_dim, self.graph_dim, 1, 1)
+            return binary_matrix.reshape(matrix.shape[:-2]+(self.graph_dim, self.graph_dim, 1, 1))
         else:
-            binary_matrix[np.diag_indices(self.graph_dim)]=0
-            return binary_matrix.reshape(self.graph_dim, self.graph_dim, 1, 1)
+            binary_matrix[(...,)+diagonal_indices(self.graph_dim)]=0
+            return binary_matrix.reshape(matrix.shape[:-2]+(self.graph_dim, self.graph_dim, 1, 1))
     
     def adjacency_matrix(self, matrix, diagonal=None, normalize=False,
-                         negative_weights=False):
+                         negative_weights=False, inplace=False):
         """
         A function to format the matrix into a adjacency matrix format.
         The function has the capability to change the diagonal elements of the matrix
@@ -104,7 +150,7 @@ class Preprocessor():
         .. math::
             Ã=D^{-1/2}AD^{-1/2}
 
-        where the normalized is computed using the absolute value of the adjacency matrix
+        where the normalized is computed using the absolute value of the adjacency matrix (see normalize_matrix)
 
         Arguments
             :matrix (np.array): A numpy array that represents the graph that is currently being processed
@@ -123,31 +169,63 @@ class Preprocessor():
             :negative_weights (opt,bool): A boolean that is used in the determination of the added one to the
                                               diagonal (negative or positive) and how the normalization is
                                               computed
+
+            :inplace (opt,bool): A boolean that determines whether the given matrix is modified instead of a copy.
+                                     A floating point matrix is required when the matrix is normalized
         Returns
             :adjacency_matrix (np.array): The adjacency matrix 
         """
-        adjacency_matrix=np.copy(matrix)
+        if inplace:
+            adjacency_matrix = matrix
+        elif normalize:
+            #The normalization scales the elements so integer matrices are promoted to floating point
+            adjacency_matrix = np.array(matrix, dtype=np.result_type(matrix, float))
+        else:
+            adjacency_matrix = np.copy(matrix)
+        diagonal_elements = (...,)+diagonal_indices(self.graph_dim)
         if diagonal=="ones":
             if normalize:
-                adjacency_matrix[np.diag_indices(self.graph_dim)]=0
-                if negative_weights:
-                    normalization_factor = np.diag(1/np.power(np.sum(np.abs(adjacency_matrix),0),0.5))
-                    return normalization_factor.dot(adjacency_matrix).dot(normalization_factor)+np.eye(self.graph_dim)
-                else:
-                    normalization_factor = np.diag(1/np.power(np.sum(adjacency_matrix,0),0.5))
-                    return normalization_factor.dot(adjacency_matrix).dot(normalization_factor)+np.eye(self.graph_dim)
-            adjacency_matrix[np.diag_indices(self.graph_dim)]=1
+                adjacency_matrix[diagonal_elements]=0
+                self.normalize_matrix(adjacency_matrix, negative_weights=negative_weights, inplace=True)
+                adjacency_matrix[diagonal_elements]+=1
+            else:
+                adjacency_matrix[diagonal_elements]=1
+            return adjacency_matrix
         elif diagonal=="zeros":
-            adjacency_matrix[np.diag_indices(self.graph_dim)]=0
+            adjacency_matrix[diagonal_elements]=0
         if normalize:
-            if negative_weights:
-                normalization_factor = np.diag(1/np.power(np.sum(np.abs(adjacency_matrix),0),0.5))
-                return normalization_factor.dot(adjacency_matrix).dot(normalization_factor)
-            else:
-                normalization_factor = np.diag(1/np.power(np.sum(adjacency_matrix,0),0.5))
-                return normalization_factor.dot(adjacency_matrix).dot(normalization_factor)
+            self.normalize_matrix(adjacency_matrix, negative_weights=negative_weights, inplace=True)
         return adjacency_matrix
 
+    def normalize_matrix(self, matrix, negative_weights=False, inplace=False):
+        """
+        A function that symmetrically normalizes a (stack of) matrices with their degree matrices
+
+        .. math::
+            Ã_{ij}=d_i^{-1/2}A_{ij}d_j^{-1/2}
+
+        The normalization is applied as an elementwise scaling with the outer product of the inverse square roots
+        of the degrees, which avoids the construction of the diagonal degree matrices and the matrix products.
+        Vertices with a zero degree are isolated and their rows and columns are set to zero
+
+        Arguments
+            :matrix (np.array): A (N x N) or (B x N x N) numpy array
+            :negative_weights (opt,bool): A boolean that determines whether the degrees are computed using the
+                                          absolute values of the matrix
+            :inplace (opt,bool): Option to overwrite the given matrix with the normalized matrix. This requires a
+                                 floating point matrix
+        Returns
+            :normalized_matrix (np.array): The normalized (stack of) matrices
+        """
+        degrees = np.sum(np.abs(matrix) if negative_weights else matrix, -2)
+        inverse_sqrt_degrees = np.zeros(degrees.shape)
+        np.power(degrees, -0.5, out=inverse_sqrt_degrees, where=degrees!=0)
+        scaling = inverse_sqrt_degrees[..., :, None]*inverse_sqrt_degrees[..., None, :]
+        if inplace:
+            matrix *= scaling
+            return matrix
+        return matrix*scaling
+
     def weights_nf(self, matrix, edge_weights=False):
         """
         A function that formats the weighted matrix as node_features using the self loop weight 
@@ -164,12 +242,13 @@ class Preprocessor():
             :node_features (np.array): Numpy array where the node features are the self loop
                                weights and possibly the average of the edge weights as well
         """
+        diagonal = np.diagonal(matrix, axis1=-2, axis2=-1)[..., None]
         if edge_weights:
-            edge_weights=np.sum(self.adjacency_matrix(matrix, diagonal="zeros"),0).reshape(-1,1)
-            count = 1/np.sum(self.binarize_matrix(matrix, diagonal=False),0).reshape(-1,1)
-            return np.concatenate([np.diag(matrix).reshape(-1,1),
-                                   count*edge_weights],1)
-        return np.diag(matrix).reshape(-1,1)
+            edge_weights=np.sum(self.adjacency_matrix(matrix, diagonal="zeros"),-2)[..., None]
+            count = 1/np.sum(self.binarize_matrix(matrix, diagonal=False),-4).reshape(matrix.shape[:-2]+(-1,1))
+            return np.concatenate([diagonal,
+                                   count*edge_weights],-1)
+        return diagonal
     
     def vdegree_nf(self, matrix, categorical=True, num_degrees=3):
         """
@@ -189,12 +268,11 @@ class Preprocessor():
         """
         vdegree_features = np.copy(matrix)
         vdegree_features = np.where(vdegree_features!=0, 1, vdegree_features)
-        vdegree_features = np.sum(vdegree_features, 0)-1
+        vdegree_features = np.sum(vdegree_features, -2)-1
         if categorical:
-            return np.array([np.eye(num_degrees)[int(el)-1].flatten().tolist()
-                             for el in vdegree_features.flatten()]).reshape(self.graph_dim,-1)
+            return one_hot_table(num_degrees)[vdegree_features.astype(int)-1]
         else:
-            return vdegree_features.reshape(self.graph_dim, -1)
+            return vdegree_features.reshape(matrix.shape[:-2]+(self.graph_dim, -1))
         
     def vdegree_weighted_nf(self, matrix, neighbourhood=False, weight_method="average"):
         """
@@ -241,39 +319,30 @@ class Preprocessor():
         #Compute the degree vector
         cat_vdegree_features = self.vdegree_nf(matrix)
         #Extract the diagonal weights
-        sl_cat_vdegree_features =  np.diag(matrix).reshape(-1,1)*cat_vdegree_features
+        sl_cat_vdegree_features =  np.diagonal(matrix, axis1=-2, axis2=-1)[..., None]*cat_vdegree_features
         if neighbourhood:
             #Compute the binary form
-            binary_matrix = self.binarize_matrix(matrix, diagonal=False)
+            binary_matrix = self.binarize_matrix(matrix, diagonal=False).reshape(matrix.shape)
             #Extract the edge weights
-            edge_weights = self.__off_diagonal_format(matrix)
-            #Construct a categorical tensor where each edge is substituted with its degree vector
-            cat_degree_matrix = self.__categorical_matrix(cat_vdegree_features, binary_matrix)
+            edge_weights = self.adjacency_matrix(matrix, diagonal="zeros")
+            diagonal = np.diagonal(matrix, axis1=-2, axis2=-1)[..., None]
             if weight_method=="average":
-                #Construct the matrix where the diagonal is repeated at each row
-                neighbourhood_vertex_weights = self.__diagonal_to_matrix(matrix, binary_matrix, "row")
-                cat_degree_count = np.sum(cat_degree_matrix, 1)
-                nonzero_indices = np.nonzero(cat_degree_count)
-                for idx_1, idx_2, idx_3 in zip(nonzero_indices[0], nonzero_indices[1],nonzero_indices[2]):
-                    cat_degree_count[idx_1][idx_2][idx_3] = 1/cat_degree_count[idx_1][idx_2][idx_3]
-                cat_degree_count = cat_degree_count.squeeze(1)
-                edge_weight_sum = np.sum(cat_degree_matrix*edge_weights, 1).squeeze(1)
-                neighbour_vertex_sum = np.sum(cat_degree_matrix*neighbourhood_vertex_weights, 1).squeeze(1)
+                #Every neighbour is counted in the degree class of the central vertex
+                cat_degree_count = self.__reciprocal(np.sum(binary_matrix, -1)[..., None]*cat_vdegree_features)
+                edge_weight_sum = np.sum(edge_weights, -1)[..., None]*cat_vdegree_features
+                neighbour_vertex_sum = np.matmul(binary_matrix, diagonal)*cat_vdegree_features
                 return np.concatenate([sl_cat_vdegree_features,
                                        cat_degree_count*neighbour_vertex_sum,
-                                       cat_degree_count*edge_weight_sum],1)
+                                       cat_degree_count*edge_weight_sum],-1)
             elif weight_method=="linear combination":
-                cat_degree_count = np.sum(cat_degree_matrix, 0)
-                neighbourhood_vertex_weights = self.__diagonal_to_matrix(matrix, binary_matrix, "column")
-                nonzero_indices = np.nonzero(cat_degree_count)
-                for idx_1, idx_2, idx_3 in zip(nonzero_indices[0], nonzero_indices[1],nonzero_indices[2]):
-                    cat_degree_count[idx_1][idx_2][idx_3] = 1/cat_degree_count[idx_1][idx_2][idx_3]
-                cat_degree_count=cat_degree_count.squeeze(1)
-                edge_weight_sum = np.sum(cat_degree_matrix*edge_weights, 0).squeeze(1)
-                neighbour_vertex_sum = np.sum(cat_degree_matrix*neighbourhood_vertex_weights, 0).squeeze(1)
+                #Every neighbour is counted in its own degree class
+                binary_matrix = np.swapaxes(binary_matrix, -1, -2)
+                cat_degree_count = self.__reciprocal(np.matmul(binary_matrix, cat_vdegree_features))
+                edge_weight_sum = np.matmul(np.swapaxes(edge_weights, -1, -2), cat_vdegree_features)
+                neighbour_vertex_sum = np.matmul(binary_matrix, diagonal*cat_vdegree_features)
                 return np.concatenate([sl_cat_vdegree_features,
                                        cat_degree_count*neighbour_vertex_sum,
-                                       cat_degree_count*edge_weight_sum],1)
+                                       cat_degree_count*edge_weight_sum],-1)
         return sl_cat_vdegree_features
 
     def pdegree_weighted_nf(self, matrix, num_degrees):
@@ -297,38 +366,30 @@ class Preprocessor():
         Returns
             :pdegree_features (np.array): A numpy array containing the pair degree features
         """
-        vdegree_features = self.vdegree_nf(matrix, categorical=False)
+        vdegree_features = self.vdegree_nf(matrix, categorical=False).astype(int)
+        if vdegree_features.size>0 and vdegree_features.max()>num_degrees:
+            #The pair classes of a too large degree would overflow into the classes of the next row
+            raise ValueError("The graphs contain a vertex of degree "+str(vdegree_features.max())+
+                             ", which exceeds the number of degrees "+str(num_degrees))
         cat_vdegree_features = self.vdegree_nf(matrix)
-        sl_cat_vdegree_features =  np.diag(matrix).reshape(-1,1)*cat_vdegree_features
-        binary_matrix = self.binarize_matrix(matrix, diagonal=False)
-        degree_pairs = []
-        for central_vertex in range(1, num_degrees+1):
-            for neighbour_vertex in range(1, num_degrees+1):
-                degree_pairs.append((central_vertex, neighbour_vertex))
-        num_degree_pairs = len(degree_pairs)
-        degree_dict = dict(zip(degree_pairs, range(1,num_degree_pairs+1)))
-        pairs = list(zip(np.repeat(vdegree_features, self.graph_dim, 1).flatten(),
-                     np.repeat(vdegree_features.T, self.graph_dim, 0).flatten()))
-        pair_matrix = np.array([degree_dict[pair] for pair in pairs]).reshape(self.graph_dim, self.graph_dim)
-        pair_matrix = np.multiply(binary_matrix.reshape(self.graph_dim, self.graph_dim), pair_matrix)
-        pair_matrix = pair_matrix.flatten()
-        cat_pair_matrix = []
-        for el in pair_matrix:
-            if el==0:
-                cat_pair_matrix.append([0]*num_degree_pairs)
-            else:
-                cat_pair_matrix.append(np.eye(num_degree_pairs)[int(el)-1].flatten().tolist())
-        cat_pair_matrix = np.array(cat_pair_matrix).reshape(self.graph_dim,self.graph_dim,-1)
-        neighbourhood_vertex_weights = self.__diagonal_to_matrix(matrix, binary_matrix, "row").squeeze(2)
-        edge_weights = self.__off_diagonal_format(matrix).squeeze(2)
-        cat_pair_count = np.sum(cat_pair_matrix, 1)
-        nonzero_indices = np.nonzero(cat_pair_count)
-        for idx_1, idx_2 in zip(nonzero_indices[0], nonzero_indices[1]):
-            cat_pair_count[idx_1][idx_2] = 1/cat_pair_count[idx_1][idx_2]
-        cat_pair_count = cat_pair_count
-        edge_weight_sum = np.sum(cat_pair_matrix*edge_weights, 1)
-        neighbour_vertex_sum = np.sum(cat_pair_matrix*neighbourhood_vertex_weights, 1)
+        sl_cat_vdegree_features =  np.diagonal(matrix, axis1=-2, axis2=-1)[..., None]*cat_vdegree_features
+        binary_matrix = self.binarize_matrix(matrix, diagonal=False).reshape(matrix.shape)
+        num_degree_pairs = num_degrees**2
+        #The pair (central degree, connecting degree) is numbered as (d_i-1)*M+d_j, i.e. the pairs
+        #(1,1), (1,2), ..., (2,1), ... are numbered 1, 2, ..., M+1, ...
+        pair_matrix = (vdegree_features-1)*num_degrees+np.swapaxes(vdegree_features, -1, -2)
+        #Every edge is scattered into the pair class of its row, each row of every graph has its own set of classes
+        rows, columns = np.nonzero(binary_matrix.reshape(-1, self.graph_dim))
+        pair_indices = rows*num_degree_pairs+pair_matrix.reshape(-1, self.graph_dim)[rows, columns]-1
+        num_bins = binary_matrix.size//self.graph_dim*num_degree_pairs
+        feature_shape = matrix.shape[:-1]+(num_degree_pairs,)
+        cat_pair_count = np.bincount(pair_indices, minlength=num_bins).reshape(feature_shape)
+        edge_weight_sum = np.bincount(pair_indices, weights=matrix.reshape(-1, self.graph_dim)[rows, columns],
+                                      minlength=num_bins).reshape(feature_shape)
+        diagonal = np.diagonal(matrix, axis1=-2, axis2=-1).reshape(-1, self.graph_dim)
+        neighbour_vertex_sum = np.bincount(pair_indices, weights=diagonal[rows//self.graph_dim, columns],
+                                           minlength=num_bins).reshape(feature_shape)
+        cat_pair_count = self.__reciprocal(cat_pair_count)
         return np.concatenate([sl_cat_vdegree_features,
                                cat_pair_count*neighbour_vertex_sum,
-                               cat_pair_count*edge_weight_sum],1)
-        
+                               cat_pair_count*edge_weight_sum],-1)
@@ -2,11 +2,18 @@ import numpy as np
 import scipy.spatial as spatial
 from h5py import File as f 
 import os
+import time
+import tarfile
+import itertools
+from functools import lru_cache
+from multiprocessing import Pool
 import matplotlib.pyplot as plt
 import math
-#import torch
-#import torch_geometric
+import torch
+import torch_geometric
 from openbabel import pybel
+from gqcml.datasets.collated import append_graphs
+from gqcml.utils.parallel import imap_bounded
 
 #data_dir= "/home/nbilliet/projects/def-stijn/nbilliet/gqcg_data/QM9/data"
 #test_file="dsgdb9nsd_108493.xyz"
@@ -15,6 +22,28 @@ test_smiles = ["COCC(=NC1C(O1)C)CCC(N)C(N(C))CC=O",
                "CC(OO)CN=NCC(F)CC(=O)F",
                "CC(=O)CC(=O)OC(=O)CC(=O)O"]
 
+funcgroup_smarts = ["[CX4]", "[#6]=[#6]", "[#6]#[#6]", "[c]",
+                    "[#6][OX2H]", "[CX3H1](=O)", "[#6][CX3](=O)[#6]",
+                    "[#6]O[#6]", "[#6]OO", "[#6]@O@[#6]", "[#6](=O)O",
+                    "[#6](=O)O[#6]", "[CX3](=[OX1])[OX2][CX3](=[OX1])",
+                    "[NX3][CX3](=[OX1])[#6]","[#6][NX2]",
+                    "[$([CX3]([#6])[#6]),$([CX3H][#6])]=[$([NX2][#6]),$([NX2H])]",
+                    "[$(*-[NX2-]-[NX2+]#[NX1]),$(*-[NX2]=[NX2+]=[NX1-])]",
+                    "[NX2]=[NX2]", "[OX2][CX2]#[NX1]", "[$([NX3](=[OX1])(=[OX1])O),$([NX3+]([OX1-])(=[OX1])O)]",
+                    "[NX1]#[CX2]", "[#6]ON=O", "[$([NX3](=O)=O),$([NX3+](=O)[O-])][!#8]",
+                    "[NX2]=[OX1]", "[#6][F,Cl,Br,I]"]
+
+@lru_cache(maxsize=None)
+def compiled_funcgroup_smarts():
+    """
+    Returns the compiled SMARTS patterns of the functional groups (see funcgroup_smarts). The patterns are compiled
+    once per process, the compiled patterns can not be pickled so every worker compiles its own
+
+    Returns
+        :smarts (tuple): A tuple of pybel.Smarts objects in the order of funcgroup_smarts
+    """
+    return tuple(pybel.Smarts(smarts_code) for smarts_code in funcgroup_smarts)
+
 class ChemIdentifier():
     def __init__(self):
         self.smiles = None
@@ -27,7 +56,7 @@ class ChemIdentifier():
     def read_xyz(self, data_dir, filename):
         filepath=os.path.join(data_dir, filename)
         self.molecule=next(pybel.readfile("xyz", filepath))
-        self.smiles = mol.write(format="smi")
+        self.smiles = self.molecule.write(format="smi")
         self.smiles = self.smiles.split()[0].strip()
         self.atoms = [atom.atomicnum for atom in self.molecule.atoms]
         self.indices = [atom.atomicnum for atom in self.molecule.atoms]
@@ -68,36 +97,53 @@ class ChemIdentifier():
             - Halogen groups
                 -Halo alkane
         """
-        #
-        smarts_codes = ["[CX4]", "[#6]=[#6]", "[#6]#[#6]", "[c]",
-                        "[#6][OX2H]", "[CX3H1](=O)", "[#6][CX3](=O)[#6]",
-                        "[#6]O[#6]", "[#6]OO", "[#6]@O@[#6]", "[#6](=O)O", 
-                        "[#6](=O)O[#6]", "[CX3](=[OX1])[OX2][CX3](=[OX1])",
-                        "[NX3][CX3](=[OX1])[#6]","[#6][NX2]", 
-                        "[$([CX3]([#6])[#6]),$([CX3H][#6])]=[$([NX2][#6]),$([NX2H])]",
-                        "[$(*-[NX2-]-[NX2+]#[NX1]),$(*-[NX2]=[NX2+]=[NX1-])]", 
-                        "[NX2]=[NX2]", "[OX2][CX2]#[NX1]", "[$([NX3](=[OX1])(=[OX1])O),$([NX3+]([OX1-])(=[OX1])O)]", 
-                        "[NX1]#[CX2]", "[#6]ON=O", "[$([NX3](=O)=O),$([NX3+](=O)[O-])][!#8]", 
-                        "[NX2]=[OX1]", "[#6][F,Cl,Br,I]"]
-        smarts = [pybel.Smarts(smarts_code) for smarts_code in smarts_codes]
+        smarts = compiled_funcgroup_smarts()
         nmb_atoms = len([atom for atom in molecule.atoms])
-        functional_groups = [[]*nmb_atoms)]
+        functional_groups = [[] for _ in range(nmb_atoms)]
         for class_idx, smart in enumerate(smarts):    
             indices=smart.findall(molecule)
-            if indices!=[]:
-                for idx in indices:
-                    functional_groups[idx-1].append(class_idx+1)
+            for match in indices:
+                for idx in match:
+                    if class_idx+1 not in functional_groups[idx-1]:
+                        functional_groups[idx-1].append(class_idx+1)
         return functional_groups
 
-def convert_str_to_float(str):
-    if "*^" in str:
-        return float(str.replace("*^", "e"))
-    else:
-        return float(str)
+def funcgroup_vector(molecule):
+    """
+    Determines which functional groups (see funcgroup_smarts) are present in a molecule. Only the first match of every
+    pattern is searched for
 
-def format_xyz(root_dir,filename, atom_dict=dict(zip(["H", "C", "N", "O", "F"], [1,6,7,8,9]))):
+    Arguments
+        :molecule (pybel.Molecule): The molecule
+    Returns
+        :groups (np.array): A boolean numpy array with an element per functional group
     """
-    A function that will process the xyz file which can be split up in the following way according 
+    return np.array([smart.obsmarts.Match(molecule.OBMol, True) for smart in compiled_funcgroup_smarts()], dtype=bool)
+
+def annotate_xyz_batch(texts):
+    """
+    Determines the functional groups of a batch of xyz files. This function is executed by the workers of the process
+    pool in annotate_dataset
+
+    Arguments
+        :texts (list): A list of xyz file contents
+    Returns
+        :indices, groups (tuple): A numpy array with the gdb indices of the molecules and a (batch x ceil(groups/8))
+                                  uint8 numpy array with the bit-packed functional group vectors (see funcgroup_vector)
+    """
+    indices = np.array([int(text.splitlines()[1].split()[1]) for text in texts], dtype=np.int64)
+    groups = np.stack([funcgroup_vector(pybel.readstring("xyz", text.replace("*^", "e"))) for text in texts])
+    return indices, np.packbits(groups, axis=1)
+
+scalar_keys = ["A", "B", "C", "mu", "alpha", "E_h", "E_l", "E_g", "R_sq", "zpve", "U_0", "U", "H", "G", "C_v"]
+#The second line of a xyz file: the tag and the scalar properties
+xyz_property_dtype = np.dtype([("tag", "U32"), ("properties", np.float64, len(scalar_keys))])
+#The atom lines of a xyz file: the element, the position and the Mulliken charge
+xyz_atom_dtype = np.dtype([("atom", "U2"), ("position", np.float64, 3), ("charge", np.float64)])
+
+def parse_xyz(text, atom_dict=dict(zip(["H", "C", "N", "O", "F"], [1,6,7,8,9])), distances=True):
+    """
+    A function that will process the content of a xyz file which can be split up in the following way according 
     to each line
 
         1) Number of atoms (n)
@@ -133,48 +179,296 @@ def format_xyz(root_dir,filename, atom_dict=dict(zip(["H", "C", "N", "O", "F"],
             1) Corina geometry
             2) B3LYP 
 
+    Arguments
+        :text (str): The content of the xyz file
+        :atom_dict (opt, dict): A dictionary that maps the atom strings to the atomic numbers
+        :distances (opt, bool): Option to add the (N x N) matrix of the interatomic distances
+    Returns
+        :mol_dict (dict): A dictionary containing the atoms, positions, distances, charges, vibrational frequencies,
+                          scalar properties, smiles and inchi of the molecule
+    """
+    return parse_xyz_batch([text], atom_dict=atom_dict, distances=distances)[0]
+
+def parse_xyz_batch(texts, atom_dict=dict(zip(["H", "C", "N", "O", "F"], [1,6,7,8,9])), distances=False):
+    """
+    Parses the contents of a batch of xyz files (see parse_xyz). The Mathematica exponents (e.g. 1.5*^-6) are
+    normalized once per file and the numeric fields of all the files are converted at once: the property lines and the
+    atom lines of the batch are each read with a single np.loadtxt call into a structured array (see xyz_property_dtype
+    and xyz_atom_dtype), which is split per molecule afterwards
+
+    Arguments
+        :texts (list): A list of xyz file contents
+        :atom_dict (opt, dict): A dictionary that maps the atom strings to the atomic numbers
+        :distances (opt, bool): Option to add the interatomic distance matrices. They are not needed to construct the
+                                graphs (see radius_graph), standardly they are left out
+    Returns
+        :mol_dicts (list): A list with the dictionary of every molecule, see parse_xyz
+    """
+    property_lines, atom_lines, num_atoms, tails = [], [], [], []
+    for text in texts:
+        lines = text.replace("*^", "e").splitlines()
+        property_lines.append(lines[1])
+        atom_lines.extend(lines[2:-3])
+        num_atoms.append(len(lines)-5)
+        tails.append([line.split("\t") for line in lines[-3:]])
+    properties = np.loadtxt(property_lines, delimiter="\t", dtype=xyz_property_dtype,
+                            usecols=range(1+len(scalar_keys)), ndmin=1)["properties"]
+    atom_table = np.loadtxt(atom_lines, delimiter="\t", dtype=xyz_atom_dtype, usecols=range(5), ndmin=1)
+    atoms = np.array([atom_dict[atom] for atom in atom_table["atom"].tolist()], dtype=np.int64)
+    positions = np.ascontiguousarray(atom_table["position"])
+    charges = np.ascontiguousarray(atom_table["charge"])
+    offsets = np.concatenate([[0], np.cumsum(num_atoms)]).tolist()
+    keys = ["atoms", "positions", "charges", "vibrational frequencies", "scalar properties", "smiles", "inchi"]
+    mol_dicts = []
+    for start, end, mol_properties, (vibrational_freq, smiles, inchi) in zip(offsets[:-1], offsets[1:],
+                                                                              properties.tolist(), tails):
+        values = [atoms[start:end], positions[start:end], charges[start:end], vibrational_freq,
+                  dict(zip(scalar_keys, mol_properties)), dict(zip(["GDB17", "B3LYP"], smiles[:-1])),
+                  dict(zip(["Corina", "B3LYP"], inchi))]
+        mol_dict = dict(zip(keys, values))
+        if distances:
+            mol_dict["distances"] = spatial.distance.cdist(mol_dict["positions"], mol_dict["positions"])
+        mol_dicts.append(mol_dict)
+    return mol_dicts
+
+def format_xyz(root_dir,filename, atom_dict=dict(zip(["H", "C", "N", "O", "F"], [1,6,7,8,9]))):
+    """
+    A function that will process a xyz file in the raw directory of the QM9 dataset (see parse_xyz)
+
     Arguments
         :data_dir (str): The directory where the xyz file is stored
         :filename (str): The filename of the xyz file
     Returns
-        ::
+        :mol_dict (dict): The properties of the molecule, see parse_xyz
     """
     raw_dir = os.path.join(root_dir, "raw")
     filepath = os.path.join(raw_dir, filename)
-    xyz_file = open(filepath, "r")
-    lines = [line[:-1].split("\t") for line in xyz_file]
-    scalar_properties = dict(zip(["A", "B", "C", "mu", "alpha", "E_h", "E_l", "E_g", "R_sq", "zpve", "U_0", "U", "H", "G", "C_v"],
-                                [convert_str_to_float(el) for el in lines[1][1:-1]]))
-    
-    atoms = np.array([atom_dict[line[0]] for line in lines[2:-3]])
-    positions = np.array([[convert_str_to_float(pos) for pos in line[1:-1]] for line in lines[2:-3]])
-    distances = np.array(spatial.distance.cdist(positions, positions))
-    charges = np.array([convert_str_to_float(line[-1]) for line in lines[2:-3]])
-    vibrational_freq = lines[-3]
-    smiles = dict(zip(["GDB17", "B3LYP"], lines[-2][:-1]))
-    inchi = dict(zip(["Corina", "B3LYP"], lines[-1]))
-    keys = ["atoms", "positions", "distances", "charges", "vibrational frequencies", "scalar properties", "smiles", "inchi"]
-    values = [atoms, positions, distances,  charges, vibrational_freq, scalar_properties, smiles, inchi]
-    return dict(zip(keys, values))
-
-def convert_xyz_data(root_dir,filename,target_key):
-    mol_dict = format_xyz(root_dir, filename)
-    edge_indices, edge_weights = torch_geometric.utils.dense_to_sparse(torch.Tensor(mol_dict["distances"]))
-    node_features = np.stack(mol_dict["atoms"], mol_dict["charges"])
-    data = torch_geometric.data.Data(x=torch.Tensor(mol_dict["atoms"]), 
-                                     edge_index=edge_indices, 
-                                     edge_attr=edge_weights,
-                                     pos=torch.Tensor(mol_dict["positions"]),
-                                     y=torch.Tensor([mol_dict["scalar properties"][target_key]]))
+    with open(filepath, "r") as xyz_file:
+        return parse_xyz(xyz_file.read(), atom_dict=atom_dict)
+
+def radius_graph(positions, cutoff=None, max_neighbours=None):
+    """
+    Constructs the edges between the atoms that are within a cutoff radius of each other. The neighbours are found with
+    a KD-tree, so only the pairs within the cutoff are visited and the number of edges scales with the size of the local
+    neighbourhoods instead of quadratically with the number of atoms. Without a cutoff and a maximum number of neighbours
+    every atom is connected to all the other atoms
+
+    Arguments
+        :positions (np.array): A (N x 3) numpy array containing the positions of the atoms
+        :cutoff (opt, float): The radius within which the atoms are connected
+        :max_neighbours (opt, int): The maximum number of neighbours of an atom, only the nearest neighbours within the
+                                    cutoff are kept. The edges point from the neighbours to the atom, so every atom
+                                    receives messages from at most max_neighbours atoms
+    Returns
+        :edge_index, distances (tuple): A (2 x E) numpy array with the source and target atoms of the edges, sorted by
+                                        source and target, and a numpy array with the E interatomic distances
+    """
+    num_atoms = len(positions)
+    cutoff = np.inf if cutoff is None else cutoff
+    if max_neighbours is None and np.isinf(cutoff):
+        sources, targets = np.nonzero(~np.eye(num_atoms, dtype=bool))
+    elif max_neighbours is None:
+        pairs = spatial.cKDTree(positions).query_pairs(cutoff, output_type="ndarray")
+        sources = np.concatenate([pairs[:,0], pairs[:,1]])
+        targets = np.concatenate([pairs[:,1], pairs[:,0]])
+    else:
+        #The nearest neighbour of every atom is the atom itself
+        neighbour_distances, neighbours = spatial.cKDTree(positions).query(positions, k=min(max_neighbours+1, num_atoms),
+                                                                           distance_upper_bound=cutoff)
+        neighbours = neighbours.reshape(num_atoms, -1)
+        neighbour_distances = neighbour_distances.reshape(num_atoms, -1)
+        centers = np.repeat(np.arange(num_atoms)[:, None], neighbours.shape[1], 1)
+        mask = (neighbours!=centers) & np.isfinite(neighbour_distances)
+        sources, targets = neighbours[mask], centers[mask]
+        if mask.sum(1).max(initial=0)>max_neighbours:
+            #Atoms with several neighbours at the same distance can keep their own index among the k nearest
+            keep = np.concatenate([np.flatnonzero(targets==center)[:max_neighbours] for center in range(num_atoms)])
+            sources, targets = sources[keep], targets[keep]
+    order = np.lexsort((targets, sources))
+    edge_index = np.stack([sources[order], targets[order]]).astype(np.int64)
+    distances = np.linalg.norm(positions[edge_index[0]]-positions[edge_index[1]], axis=-1)
+    return edge_index, distances
+
+def xyz_to_graph(mol_dict, target_key, cutoff=None, max_neighbours=None):
+    """
+    Converts the properties of a molecule to the arrays of a graph in which the atoms are connected to the atoms
+    within the cutoff radius, weighted by their distance (see radius_graph)
+
+    Arguments
+        :mol_dict (dict): The properties of the molecule, see parse_xyz
+        :target_key (str): The scalar property that is used as the target of the graph
+        :cutoff (opt, float): The radius within which the atoms are connected. Standardly all the atoms are connected
+        :max_neighbours (opt, int): The maximum number of neighbours of an atom
+    Returns
+        :graph (dict): A dictionary with the node features (x), the edge indices (edge_index), the edge weights (edge_attr),
+                       the positions (pos) and the target (y) as numpy arrays
+    """
+    edge_index, distances = radius_graph(mol_dict["positions"], cutoff=cutoff, max_neighbours=max_neighbours)
+    return {"x":mol_dict["atoms"].astype(np.float32),
+            "edge_index":edge_index,
+            "edge_attr":distances.astype(np.float32),
+            "pos":mol_dict["positions"].astype(np.float32),
+            "y":np.array([mol_dict["scalar properties"][target_key]], dtype=np.float32)}
+
+def convert_xyz_data(root_dir,filename,target_key,cutoff=None,max_neighbours=None):
+    graph = xyz_to_graph(format_xyz(root_dir, filename), target_key, cutoff=cutoff, max_neighbours=max_neighbours)
+    data = torch_geometric.data.Data(**{key:torch.from_numpy(value) for key, value in graph.items()})
     return data
 
-def format_dataset(root_dir, target_key, target_descr):
+def convert_xyz_batch(batch):
+    """
+    Converts a batch of xyz files to graphs. This function is executed by the workers of the process pool in format_dataset
+
+    Arguments
+        :batch (tuple): A tuple containing the list of xyz file contents, the target key, the cutoff radius and the
+                        maximum number of neighbours
+    Returns
+        :graphs (list): A list of graph dictionaries, see xyz_to_graph
+    """
+    texts, target_key, cutoff, max_neighbours = batch
+    return [xyz_to_graph(mol_dict, target_key, cutoff=cutoff, max_neighbours=max_neighbours)
+            for mol_dict in parse_xyz_batch(texts)]
+
+def iterate_xyz(source):
+    """
+    Iterates over the contents of the xyz files of the QM9 dataset. The source is either the directory containing the
+    xyz files, which are read in the order of their filenames, or the raw tarball that is streamed without extracting it,
+    in which case the files are read in the order in which they are stored in the archive
+
+    Arguments
+        :source (str): The directory or the (compressed) tar archive containing the xyz files
+    Returns
+        :texts (generator): A generator that yields the contents of the xyz files
+    """
+    if os.path.isdir(source):
+        for filename in sorted(os.listdir(source)):
+            with open(os.path.join(source, filename), "r") as xyz_file:
+                yield xyz_file.read()
+    else:
+        with tarfile.open(source, "r|*") as archive:
+            for member in archive:
+                if member.isfile() and member.name.endswith(".xyz"):
+                    yield archive.extractfile(member).read().decode()
+
+def xyz_batches(texts, batch_size):
+    """
+    Groups the contents of the xyz files in lists of at most batch_size files
+
+    Arguments
+        :texts (iterable): The contents of the xyz files, see iterate_xyz
+        :batch_size (int): The number of files in a batch
+    Returns
+        :batches (generator): A generator that yields the batches as lists
+    """
+    texts = iter(texts)
+    return iter(lambda: list(itertools.islice(texts, batch_size)), [])
+
+def format_dataset(root_dir, target_key, target_descr, batch_size=1000, processes=None, archive=None,
+                   cutoff=None, max_neighbours=None, verbose=False):
+    """
+    A function that converts the raw xyz files of the QM9 dataset to a single collated graph store
+    (processed/QM9_<target_descr>.h5, see gqcml.datasets.collated) that is read by QM9_dataloader.
+
+    The xyz files are parsed in batches by a pool of worker processes and the graphs are appended to the store as soon
+    as their batch is converted, so only the batches that are being processed are held in memory. The molecules are
+    stored in the order in which they are read (see iterate_xyz)
+
+    Arguments
+        :root_dir (str): The directory containing the raw and processed directories
+        :target_key (str): The scalar property that is stored as the target, see format_xyz
+        :target_descr (str): The description of the target used in the filename of the store
+        :batch_size (opt, int): The number of molecules that are converted by a worker in a single task
+        :processes (opt, int): The number of worker processes. Standardly all the available cores are used
+        :archive (opt, str): The filepath of the raw QM9 tarball. When it is given the xyz files are streamed from the
+                             archive instead of being read from the raw directory
+        :cutoff (opt, float): The radius within which the atoms are connected, see radius_graph
+        :max_neighbours (opt, int): The maximum number of neighbours of an atom, see radius_graph
+        :verbose (opt, bool): Option to print the progress and the throughput after every batch
+    Returns
+        :num_molecules (int): The number of molecules in the store
+    """
     data_name = "QM9_"+str(target_descr)
-    raw_dir = os.path.join(root_dir, "raw")
+    source = os.path.join(root_dir, "raw") if archive is None else archive
     processed_dir = os.path.join(root_dir, "processed")
-    for idx, filename in enumerate(os.listdir(raw_dir)):
-        data = convert_xyz_data(root_dir, filename, target_key)
-        torch.save(data, os.path.join(processed_dir, data_name+"_{}.pt".format(idx)))
+    os.makedirs(processed_dir, exist_ok=True)
+    texts = iterate_xyz(source)
+    processes = os.cpu_count() if processes is None else processes
+    tasks = ((batch, target_key, cutoff, max_neighbours) for batch in xyz_batches(texts, batch_size))
+    num_molecules = 0
+    start_time = time.perf_counter()
+    with f(os.path.join(processed_dir, data_name+".h5"), "w") as h5_file, Pool(processes) as pool:
+        #The number of batches in flight is bounded, so the files are only read at the pace of the workers
+        for graphs in imap_bounded(pool, convert_xyz_batch, tasks, 2*processes):
+            num_molecules = append_graphs(h5_file, graphs)
+            if verbose:
+                elapsed = time.perf_counter()-start_time
+                print(str(num_molecules)+" molecules converted ("+str(round(num_molecules/elapsed))+" molecules/s)")
+    if verbose:
+        elapsed = time.perf_counter()-start_time
+        print("Converted "+str(num_molecules)+" molecules in "+str(round(elapsed, 1))+" s ("+str(round(num_molecules/elapsed))+" molecules/s)")
+    return num_molecules
+
+def annotate_dataset(root_dir, batch_size=1000, processes=None, archive=None, verbose=False):
+    """
+    A function that determines the functional groups of all the molecules of the QM9 dataset and caches them in
+    processed/QM9_funcgroups.h5. The file contains the following datasets
 
+        - index: The gdb index of every molecule
+        - funcgroups: The functional group vectors (see funcgroup_vector), bit-packed along the groups with np.packbits
 
+    The molecules are stored in the order in which they are read (see iterate_xyz), which is the order of the graph
+    stores of format_dataset. The xyz files are annotated in batches by a pool of worker processes that compile the
+    SMARTS patterns once
 
+    Arguments
+        :root_dir (str): The directory containing the raw and processed directories
+        :batch_size (opt, int): The number of molecules that are annotated by a worker in a single task
+        :processes (opt, int): The number of worker processes. Standardly all the available cores are used
+        :archive (opt, str): The filepath of the raw QM9 tarball. When it is given the xyz files are streamed from the
+                             archive instead of being read from the raw directory
+        :verbose (opt, bool): Option to print the progress after every batch
+    Returns
+        :num_molecules (int): The number of annotated molecules
+    """
+    source = os.path.join(root_dir, "raw") if archive is None else archive
+    processed_dir = os.path.join(root_dir, "processed")
+    os.makedirs(processed_dir, exist_ok=True)
+    texts = iterate_xyz(source)
+    processes = os.cpu_count() if processes is None else processes
+    num_bytes = (len(funcgroup_smarts)+7)//8
+    num_molecules = 0
+    with f(os.path.join(processed_dir, "QM9_funcgroups.h5"), "w") as h5_file, Pool(processes) as pool:
+        h5_file.create_dataset("index", shape=(0,), maxshape=(None,), dtype=np.int64, chunks=True)
+        h5_file.create_dataset("funcgroups", shape=(0, num_bytes), maxshape=(None, num_bytes), dtype=np.uint8, chunks=True)
+        h5_file["funcgroups"].attrs["smarts"] = funcgroup_smarts
+        for indices, groups in imap_bounded(pool, annotate_xyz_batch, xyz_batches(texts, batch_size), 2*processes):
+            for key, values in [("index", indices), ("funcgroups", groups)]:
+                h5_file[key].resize(num_molecules+len(values), axis=0)
+                h5_file[key][num_molecules:] = values
+            num_molecules += len(indices)
+            if verbose:
+                print(str(num_molecules)+" molecules annotated")
+    return num_molecules
+
+def load_funcgroups(root_dir, **kwargs):
+    """
+    Loads the functional group vectors of the QM9 dataset from processed/QM9_funcgroups.h5. The molecules are annotated
+    first when the file does not exist or was created with different SMARTS patterns
+
+    Arguments
+        :root_dir (str): The directory containing the raw and processed directories
+        :kwargs (opt): The keyword arguments of annotate_dataset
+    Returns
+        :indices, groups (tuple): A numpy array with the gdb indices of the molecules and a (molecules x groups)
+                                  boolean numpy array with the functional groups of every molecule
+    """
+    filepath = os.path.join(root_dir, "processed", "QM9_funcgroups.h5")
+    if os.path.exists(filepath):
+        with f(filepath, "r") as h5_file:
+            up_to_date = list(h5_file["funcgroups"].attrs["smarts"])==funcgroup_smarts
+    if not os.path.exists(filepath) or not up_to_date:
+        annotate_dataset(root_dir, **kwargs)
+    with f(filepath, "r") as h5_file:
+        indices = np.array(h5_file["index"])
+        groups = np.unpackbits(np.array(h5_file["funcgroups"]), axis=1, count=len(funcgroup_smarts)).astype(bool)
+    return indices, groups
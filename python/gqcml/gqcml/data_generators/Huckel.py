@@ -1,6 +1,72 @@
 import numpy as np
 import scipy as sp
 
+def density_matrix(eigenvecs, ONV, dtype=None, exact=False):
+    """
+    Computes the density matrix P = C.diag(n).C^T of a single spin component from the molecular orbitals
+    and their occupation numbers. The contraction is performed for a single system or for a whole batch at once
+
+    Arguments
+        :eigenvecs (np.array): A (N x N) or (B x N x N) numpy array where the columns contain the molecular orbitals
+        :ONV (np.array): A (N) or (B x N) numpy array that contains the occupation number of each molecular orbital
+        :dtype (opt, np.dtype): The floating point type in which the contraction is performed, e.g. np.float32
+                                to halve the memory and bandwidth. Standardly the precision of the input is kept
+        :exact (opt, bool): Accumulate the occupied orbital densities one by one in the same order as the reference
+                            implementation. This reproduces previous results bit for bit and is intended for regression
+                            testing. Standardly a single matrix contraction is used
+    Returns
+        :P (np.array): A (N x N) or (B x N x N) numpy array containing the density matrix
+    """
+    if dtype is not None:
+        eigenvecs = eigenvecs.astype(dtype, copy=False)
+        ONV = ONV.astype(dtype, copy=False)
+    if exact:
+        P = np.zeros(eigenvecs.shape, dtype=np.result_type(eigenvecs, ONV))
+        for eigenvec_idx in range(eigenvecs.shape[-1]):
+            MO = eigenvecs[..., :, eigenvec_idx]
+            P += ONV[..., eigenvec_idx, None, None]*(MO[..., :, None]*MO[..., None, :])
+        return P
+    return np.matmul(eigenvecs*ONV[..., None, :], np.swapaxes(eigenvecs, -1, -2))
+
+def occupation_numbers(eigenvals, electrons, rtol=1e-05, atol=1e-08):
+    """
+    Fills the lowest orbitals with the given number of electrons and spreads the electrons evenly over degenerate orbitals.
+    The degenerate shells are found by sorting the eigenvalues and comparing each eigenvalue with its predecessor, which
+    avoids the (N x N) comparison of all eigenvalue pairs
+
+    Arguments
+        :eigenvals (np.array): A (N) or (B x N) numpy array containing the orbital energies
+        :electrons (int/list): The number of electrons that are placed in the orbitals. When a list of electron numbers is
+                               given the degenerate shells are determined once and an occupation is returned for every number
+        :rtol (opt, float): The relative tolerance under which two eigenvalues are considered degenerate (see np.isclose)
+        :atol (opt, float): The absolute tolerance under which two eigenvalues are considered degenerate (see np.isclose)
+    Returns
+        :occupations (np.array/list): A numpy array with the same dimensions as eigenvals that contains the (fractional)
+                                      occupation of each orbital or a list of such arrays when a list of electrons is given
+    """
+    eigenvals = np.asarray(eigenvals)
+    batch = eigenvals.reshape(-1, eigenvals.shape[-1])
+    B, N = batch.shape
+    order = np.argsort(batch, -1, kind="stable")
+    sorted_eigenvals = np.take_along_axis(batch, order, -1)
+    #Every eigenvalue that differs from its predecessor starts a new shell
+    new_shell = np.ones((B, N), dtype=bool)
+    new_shell[:, 1:] = ~np.isclose(sorted_eigenvals[:, 1:], sorted_eigenvals[:, :-1], rtol=rtol, atol=atol)
+    #Number the shells uniquely over the whole batch so they can be counted with a single bincount
+    shells = np.cumsum(new_shell, -1)-1+N*np.arange(B).reshape(-1, 1)
+    shells = shells.ravel()
+    shell_size = np.bincount(shells, minlength=B*N)[shells]
+    occupations = []
+    for nmb_electrons in np.atleast_1d(electrons):
+        occupied = np.tile(np.arange(N) < nmb_electrons, B)
+        shell_occupation = np.bincount(shells, weights=occupied, minlength=B*N)[shells]
+        occupation = np.empty((B, N))
+        np.put_along_axis(occupation, order, (shell_occupation/shell_size).reshape(B, N), -1)
+        occupations.append(occupation.reshape(eigenvals.shape))
+    if np.ndim(electrons)==0:
+        return occupations[0]
+    return occupations
+
 class HuckelSolver():
     """
     A class that provides the utilities to solve the Schrödinger equation
@@ -21,6 +87,12 @@ class HuckelSolver():
                                The standard value for this attribute is 0
         :P (np.array): An attribute that stores the total density matrix of the last computed system.
                              The standard value for this attribute is 0
+        :occupied (tuple): An attribute that stores the number of alpha and beta electrons and the shape of the
+                           eigenvalues (the batch and basis size) for which the ONVs of the last computed system were
+                           constructed. The standard value for this attribute is None
+
+    All the solvers accept a single (N x N) Hamiltonian or a stacked (B x N x N) batch of Hamiltonians.
+    When a batch is solved the attributes contain the stacked results, e.g. eigenvals has the dimension (B x N)
         """
     def __init__(self):
         self.eigenvals=0
@@ -30,6 +102,7 @@ class HuckelSolver():
         self.P_a = 0
         self.P_b = 0
         self.P = 0
+        self.occupied = None
 
     def ONV(self, eigenvals, N, N_a, N_b):
         """
@@ -37,23 +110,17 @@ class HuckelSolver():
         spin orbitals. This functions takes degenerate states into account as well
 
         Arguments
-            :eigenvals (np.array): A 1D array containing the eigenvalues of the system
+            :eigenvals (np.array): A 1D array containing the eigenvalues of the system or a (B x N) array
+                                   containing the eigenvalues of a batch of systems
             :N (int): The amount of spin orbitals in the system, i.e. the maximum number
-                            of electrons in the ONV
+                            of electrons in the ONV. This is the last dimension of eigenvals
             :N_a (int): The amount of alpha electrons in the system
             :N_b (int): The amount of beta electrons in the system
         Returns
             :ONV (np.array): The occupation number vector for both alpha and beta are updated
         """
-        #Search for the degenerate eigenvalues. This results in blocks in the occuptation matrix
-        weight_matrix = np.isclose(np.repeat(eigenvals.reshape(-1,1), N, axis=1),
-                                   np.repeat(eigenvals.reshape(1,-1), N, axis=0)).astype(int)
-        #Determine the degeneracy of the eigenvalues
-        degeneracy = np.diag(1/np.sum(weight_matrix, 0))
-        #Weigh the elements of the occupation matrix with the degeneracy factor
-        weight_matrix = degeneracy.dot(weight_matrix)
-        self.ONV_a= np.array([1]*N_a+[0]*(N-N_a)).dot(weight_matrix)
-        self.ONV_b = np.array([1]*N_b+[0]*(N-N_b)).dot(weight_matrix)
+        self.ONV_a, self.ONV_b = occupation_numbers(eigenvals, [N_a, N_b])
+        self.occupied = (N_a, N_b, np.shape(eigenvals))
         return None
 
     def solve_ndo(self, H):
@@ -62,12 +129,13 @@ class HuckelSolver():
         
         Arguments
             :H (np.array): A (N x N) numpy array that represents the system that needs to be computed
+                           or a (B x N x N) stack of such systems
         Returns
             :None: The function does computes the eigenvalues and eigenvectors of the given matrix H
                       using the eigh function from numpy. These solutions are stored in the corresponding attributes
         """
-        N = H.shape[0]
         self.eigenvals, self.eigenvecs = np.linalg.eigh(H)
+        self.occupied = None
         return None
 
     def solve_general(self, H, S):
@@ -76,13 +144,25 @@ class HuckelSolver():
 
         Arguments
             :H (np.array): A (N x N) numpy array that represents the system that needs to be computed
+                           or a (B x N x N) stack of such systems
             :S (np.array): A (N x N) numpy array that contains the overlap values associated with the 
-                           given H
+                           given H. For a stack of systems this is either a single (N x N) overlap shared
+                           by all systems or a (B x N x N) stack of overlaps
         Returns
             :None: The function does computes the eigenvalues and eigenvectors of the given matrix H
                     using the eigh function from scipy. These solutions are stored in the corresponding attributes
         """
-        self.eigenvals, self.eigenvecs = sp.linalg.eigh(H, S, eigvals_only=False)
+        if H.ndim==2:
+            self.eigenvals, self.eigenvecs = sp.linalg.eigh(H, S, eigvals_only=False)
+            self.occupied = None
+            return None
+        #Reduce HC=SCe to a standard eigenvalue problem with the Cholesky factor S=LL^T,
+        #which numpy can solve for the whole stack at once
+        L_inv = np.linalg.inv(np.linalg.cholesky(S))
+        L_inv_T = np.swapaxes(L_inv, -1, -2)
+        self.eigenvals, eigenvecs = np.linalg.eigh(np.matmul(L_inv, np.matmul(H, L_inv_T)))
+        self.eigenvecs = np.matmul(L_inv_T, eigenvecs)
+        self.occupied = None
         return None
 
     def compute_energy(self, N_a, N_b):
@@ -96,38 +176,60 @@ class HuckelSolver():
             :N_b (int): The number of beta electrons
         Returns
             :E (float): A floating point value that corresponds to the total energy of the system
-                               when contain N_a and N_b electrons
+                               when contain N_a and N_b electrons. For a batch of systems a (B) array
+                               of energies is returned
         """
-        N = len(self.eigenvals)
-        self.ONV(self.eigenvals, N, N_a, N_b)
-        E = self.eigenvals.dot(self.ONV_a)+self.eigenvals.dot(self.ONV_b)
+        #The ONVs are shared between the energy and the density of the same system
+        if self.occupied!=(N_a, N_b, np.shape(self.eigenvals)):
+            self.ONV(self.eigenvals, self.eigenvals.shape[-1], N_a, N_b)
+        E = np.sum(self.eigenvals*self.ONV_a, -1)+np.sum(self.eigenvals*self.ONV_b, -1)
         return E                
 
-    def compute_density_matrix(self, N_a, N_b):
+    def compute_density_matrix(self, N_a, N_b, dtype=None, exact=False):
         """
         Computes the groundstate density of based on the ONV
         
         Arguments
             :N_a (int): The number of alpha electrons.
             :N_b (int): The number of beta electrons.
+            :dtype (opt, np.dtype): The floating point type of the density matrices, see density_matrix
+            :exact (opt, bool): Reproduce the orbital by orbital accumulation of the reference implementation
+                                bit for bit, see density_matrix
         Returns
             :P (np.array): A (N x N) numpy array that represents the total electron density matrix from the system
-                                  when it contains N_a and  N_b electrons
+                                  when it contains N_a and  N_b electrons. For a batch of systems a (B x N x N)
+                                  stack of density matrices is returned
         """
-        N = len(self.eigenvals)
-        self.ONV(self.eigenvals, N, N_a, N_b)
-        P_a = np.zeros((N, N))
-        P_b = np.zeros((N, N))
-        for eigenvec_idx in range(len(self.eigenvals)):
-            #Columns of the eigenvector matrix represent the eigenvectors
-            MO = self.eigenvecs[:,eigenvec_idx]
-            #Construct the density of the MO
-            P_MO = MO.reshape(-1,1)*MO.reshape(1,-1)
-            #Compute the spin components of the density
-            P_a += self.ONV_a[eigenvec_idx]*P_MO
-            P_b += self.ONV_b[eigenvec_idx]*P_MO
-        self.P_a = P_a
-        self.P_b = P_b
+        #The ONVs are shared between the energy and the density of the same system
+        if self.occupied!=(N_a, N_b, np.shape(self.eigenvals)):
+            self.ONV(self.eigenvals, self.eigenvals.shape[-1], N_a, N_b)
+        #Compute the spin components of the density
+        self.P_a = density_matrix(self.eigenvecs, self.ONV_a, dtype=dtype, exact=exact)
+        self.P_b = density_matrix(self.eigenvecs, self.ONV_b, dtype=dtype, exact=exact)
         #The total density is the sum of the spin component densities
-        self.P = P_a+P_b
-        return P_a+P_b
+        self.P = self.P_a+self.P_b
+        return self.P
+
+    def solve_batch(self, H, N_a, N_b, S=None, dtype=None):
+        """
+        Solves a stack of Hamiltonians in one go and returns the energies and density matrices of the
+        whole batch. The eigenvalue problems are solved with a stacked eigh so that no work is done per system
+
+        Arguments
+            :H (np.array): A (B x N x N) numpy array containing the stack of systems that need to be computed
+            :N_a (int): The number of alpha electrons
+            :N_b (int): The number of beta electrons
+            :S (opt, np.array): The overlap(s) associated with H, either a single (N x N) array or a (B x N x N)
+                                stack. When no overlap is given the systems are solved under the assumption of
+                                non-differential overlap
+            :dtype (opt, np.dtype): The floating point type of the density matrices, see density_matrix
+        Returns
+            :E, P (tuple): A (B) array with the energies and a (B x N x N) array with the total density matrices
+        """
+        if S is None:
+            self.solve_ndo(H)
+        else:
+            self.solve_general(H, S)
+        E = self.compute_energy(N_a, N_b)
+        P = self.compute_density_matrix(N_a, N_b, dtype=dtype)
+        return E, P
@@ -1,2 +1,3 @@
 from .Huckel import *
 from .graph_sampler import *
+from .huckel_dataset import *
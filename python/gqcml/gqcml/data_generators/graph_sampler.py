@@ -1,5 +1,35 @@
+import math
 import numpy as np
-from itertools import permutations, combinations
+from itertools import combinations
+from gqcml.data.Data import triu_indices
+
+def multiset_permutations(elements):
+    """
+    A generator that yields every unique ordering of a multiset exactly once in lexicographic order.
+    In contrast to filtering itertools.permutations the work is proportional to the number of unique
+    orderings, since the next ordering is constructed directly from the previous one
+
+    Arguments
+        :elements (list): The elements of the multiset, e.g. [1,1,2,2]
+    Returns
+        :permutation (list): The unique orderings of the elements, starting with the sorted ordering
+    """
+    permutation = sorted(elements)
+    n = len(permutation)
+    while True:
+        yield list(permutation)
+        #Find the rightmost position that is smaller than its successor
+        pivot = n-2
+        while pivot>=0 and permutation[pivot]>=permutation[pivot+1]:
+            pivot -= 1
+        if pivot<0:
+            return
+        #Swap it with the rightmost larger element and restore the ascending order of the suffix
+        successor = n-1
+        while permutation[successor]<=permutation[pivot]:
+            successor -= 1
+        permutation[pivot], permutation[successor] = permutation[successor], permutation[pivot]
+        permutation[pivot+1:] = permutation[:pivot:-1]
 
 class graph_sampler():
     """
@@ -12,25 +42,189 @@ class graph_sampler():
     def __init__(self, sites):
         self.sites = sites
 
-    def generate_diagonal_vector(self, nmb_el_type):
+    def automorphisms(self, triu_vector, max_automorphisms=100000):
+        """
+        Determines the automorphisms of the graph described by an upper triangle, i.e. all the vertex
+        orderings that leave the binary adjacency matrix unchanged. The orderings are constructed by
+        backtracking, where a vertex can only be mapped onto a vertex with the same degree and self loop
+        and the mapping has to preserve the edges with all the previously mapped vertices.
+
+        The automorphism group of a highly symmetric graph is very large, e.g. a complete graph or a star has
+        N! or (N-1)! automorphisms, the enumeration is therefore limited to max_automorphisms orderings
+
+        Arguments
+            :triu_vector (np.array): An upper triangle vector describing the structure of the graph
+            :max_automorphisms (opt, int): The maximum number of automorphisms, None disables the limit
+        Returns
+            :automorphisms (np.array): A (P x N) numpy array where every row is an automorphism, the first row is the identity
+        """
+        adjacency_matrix = self.convert_triu_to_mat(triu_vector)!=0
+        degrees = np.sum(adjacency_matrix, 0)
+        automorphisms = []
+        mapping = []
+        def extend(vertex):
+            if vertex==self.sites:
+                if max_automorphisms is not None and len(automorphisms)==max_automorphisms:
+                    raise ValueError("The graph has more than "+str(max_automorphisms)+" automorphisms")
+                automorphisms.append(list(mapping))
+                return
+            for image in range(self.sites):
+                if image in mapping or degrees[image]!=degrees[vertex]:
+                    continue
+                if adjacency_matrix[image, image]!=adjacency_matrix[vertex, vertex]:
+                    continue
+                if any(adjacency_matrix[mapping[prev], image]!=adjacency_matrix[prev, vertex] for prev in range(vertex)):
+                    continue
+                mapping.append(image)
+                extend(vertex+1)
+                mapping.pop()
+        extend(0)
+        return np.array(automorphisms)
+
+    def generate_diagonal_vector(self, nmb_el_type, triu_vector=None, lazy=False):
         """
         A function that generates a set of vectors that specifies all possible combinations of the diagonal elements of the adjacency matrix. 
+        The unique orderings are generated directly (see multiset_permutations) instead of deduplicating all permutations.
         
         Arguments
             :nmb_el_type (list): A list that contains the number of occurence of each unique element, 
                                    e.g. suppose we have a diagonal of length 4 with 2 unique elements in equal occurence then this would 
                                    correspond with [2,2]
+            :triu_vector (opt, np.array): An upper triangle vector describing the structure of the graph. When it is given only
+                                          a single representative of all the diagonals that are equivalent under a symmetry of
+                                          the graph (see automorphisms) is generated, namely the lexicographically smallest one.
+                                          The representatives are generated directly, without visiting the equivalent diagonals
+                                          (see __canonical_diagonals)
+            :lazy (opt, bool): Option to return a generator instead of a list
         Returns
             :List of lists: A set of vectors that contain all possible permutations of a vector that has the 
                             specified ratios of these elements. E.g. for 2 unique elements in a diagonal of length 4 (equal ratios)
                             this would return [[1,1,2,2],[1,2,1,2], [2,1,1,2] 
         """
-        diagonals = []
-        for idx, nmb in enumerate(nmb_el_type):
-            diagonals += [idx+1]*nmb
-        #Generate all permutations of the starting diagonal and filter out the redundant set using the set data type
-        diagonals = set(list(permutations(diagonals)))
-        return [list(diagonal) for diagonal in diagonals]
+        if triu_vector is None:
+            diagonals = []
+            for idx, nmb in enumerate(nmb_el_type):
+                diagonals += [idx+1]*nmb
+            diagonals = multiset_permutations(diagonals)
+        else:
+            diagonals = self.__canonical_diagonals(nmb_el_type, triu_vector)
+        if lazy:
+            return diagonals
+        return list(diagonals)
+
+    def __canonical_diagonals(self, nmb_el_type, triu_vector, max_automorphisms=5000):
+        """
+        A generator that yields the diagonals that are lexicographically the smallest among all their images under the
+        automorphisms of the graph, in lexicographic order. The diagonals are built vertex by vertex and a prefix is cut
+        as soon as an automorphism maps it onto a smaller prefix, since every completion of such a prefix has a smaller
+        image as well. In addition the value of a vertex can not be smaller than the value of a preceding twin (a vertex
+        whose transposition with it is an automorphism). The work is therefore proportional to the number of canonical
+        diagonals instead of the number of orderings, e.g. a complete graph only visits the sorted diagonal.
+
+        When the graph has at most max_automorphisms automorphisms a prefix is compared with its images under all of them
+        at once, larger groups are never enumerated and the smaller prefix is searched for instead (see
+        __search_smaller_prefix)
+
+        This function is a utility function of generate_diagonal_vector
+        """
+        adjacency_matrix = self.convert_triu_to_mat(triu_vector)!=0
+        #Two vertices are twins when they have the same self loop and the same edges to all the other vertices
+        same_edges = adjacency_matrix[:, None, :]==adjacency_matrix[None, :, :]
+        vertices = np.arange(self.sites)
+        same_edges[vertices[:, None], vertices[None, :], vertices[:, None]] = True
+        same_edges[vertices[:, None], vertices[None, :], vertices[None, :]] = True
+        self_loops = np.diagonal(adjacency_matrix)
+        twins = np.all(same_edges, -1) & (self_loops[:, None]==self_loops[None, :])
+        preceding_twins = [np.flatnonzero(twins[vertex, :vertex]) for vertex in range(self.sites)]
+        #The permutations of every class of twins are automorphisms, a group that is certainly too large is not enumerated
+        twin_classes = {tuple(np.flatnonzero(row)) for row in twins}
+        automorphisms = None
+        if math.prod(math.factorial(len(twin_class)) for twin_class in twin_classes)<=max_automorphisms:
+            try:
+                automorphisms = self.automorphisms(triu_vector, max_automorphisms=max_automorphisms)
+            except ValueError:
+                pass
+        if automorphisms is None:
+            smaller_prefix = self.__search_smaller_prefix(adjacency_matrix, twins)
+        else:
+            rows = np.arange(len(automorphisms))
+            #The images of the prefix of every length, the images that are not assigned yet point to the first vertex
+            assigned = [automorphisms[:, :length]<length for length in range(self.sites+1)]
+            images = [np.where(assigned[length], automorphisms[:, :length], 0) for length in range(self.sites+1)]
+            def smaller_prefix(diagonal, length):
+                #Compare every image with the prefix at the first position where they differ or where the image is
+                #not assigned yet, only an assigned smaller value there proves a smaller prefix
+                image_values = diagonal[images[length]]
+                stop = ~assigned[length] | (image_values!=diagonal[:length])
+                first = stop.argmax(1)
+                return (stop[rows, first] & assigned[length][rows, first] & (image_values[rows, first]<diagonal[first])).any()
+        counts = list(nmb_el_type)
+        diagonal = np.zeros(self.sites, dtype=np.int64)
+
+        def extend(vertex):
+            if vertex==self.sites:
+                yield diagonal.tolist()
+                return
+            lowest = diagonal[preceding_twins[vertex]].max(initial=1)
+            for value in range(lowest, len(counts)+1):
+                if counts[value-1]==0:
+                    continue
+                diagonal[vertex] = value
+                if smaller_prefix(diagonal, vertex+1):
+                    continue
+                counts[value-1] -= 1
+                yield from extend(vertex+1)
+                counts[value-1] += 1
+
+        yield from extend(0)
+
+    def __search_smaller_prefix(self, adjacency_matrix, twins):
+        """
+        Returns a function that determines whether a prefix of a diagonal is mapped onto a smaller prefix by an
+        automorphism, without enumerating the automorphisms. The automorphisms are searched by backtracking, where
+        the images of the assigned vertices are only followed while the image equals the prefix. Once the image is
+        smaller the mapping only has to be completed to an automorphism. Twins are tried once per stage, which prunes
+        the factorial number of branches of e.g. complete graphs and stars
+
+        This function is a utility function of __canonical_diagonals
+        """
+        degrees = np.sum(adjacency_matrix, 0)
+        self_loops = np.diagonal(adjacency_matrix)
+        mapping = []
+        used = np.zeros(self.sites, dtype=bool)
+
+        def candidates(vertex):
+            #The image has to preserve the edges with all the previously mapped vertices
+            mask = ~used & (degrees==degrees[vertex]) & (self_loops==self_loops[vertex])
+            mask &= np.all(adjacency_matrix[mapping]==adjacency_matrix[:vertex, vertex, None], 0)
+            return np.flatnonzero(mask).tolist()
+
+        def extend(vertex, diagonal, length, free):
+            #Returns True when the mapping can be extended to an automorphism whose image of the prefix is smaller,
+            #once the image is smaller (free) any extension suffices
+            if vertex==self.sites:
+                return free
+            images = candidates(vertex)
+            if not free:
+                if vertex==length:
+                    return False
+                images = sorted([image for image in images if image<length and diagonal[image]<=diagonal[vertex]],
+                                key=lambda image: diagonal[image])
+            tried = []
+            for image in images:
+                if any(twins[image, other] and (free or diagonal[image]==diagonal[other]) for other in tried):
+                    continue
+                tried.append(image)
+                mapping.append(image)
+                used[image] = True
+                found = extend(vertex+1, diagonal, length, free or diagonal[image]<diagonal[vertex])
+                mapping.pop()
+                used[image] = False
+                if found:
+                    return True
+            return False
+
+        return lambda diagonal, length: extend(0, diagonal, length, False)
 
     def convert_triu_to_mat(self, triu_vector):
         """
@@ -41,9 +235,10 @@ class graph_sampler():
         Returns
             :adjacency_matrix (np.array): The matrix form of the input triu
         """
-        adjacency_matrix = np.zeros((self.sites, self.sites))
-        adjacency_matrix[np.triu_indices(self.sites,0)]=triu_vector
-        adjacency_matrix.T[np.triu_indices(self.sites,0)]=triu_vector
+        row_indices, column_indices = triu_indices(self.sites)
+        adjacency_matrix = np.empty((self.sites, self.sites))
+        adjacency_matrix[row_indices, column_indices]=triu_vector
+        adjacency_matrix[column_indices, row_indices]=triu_vector
         return adjacency_matrix
 
     def permutate_matrix(self, matrix, permutations):
@@ -55,15 +250,41 @@ class graph_sampler():
             :matrix (np.array): The matrix that is to be permutated
             :permutations (list): A list of lists where each sublist contains the order of the rows and columns
         Returns
-            :permutated_matrices (list): A list of all the permutated matrices
+            :permutated_matrices (np.array): A (P x N x N) numpy array containing all the permutated matrices
+        """
+        permutations = np.asarray(permutations)
+        return matrix[permutations[:, :, None], permutations[:, None, :]]
+
+    def permutate_matrices(self, matrices, permutations):
+        """
+        Applies every permutation to every matrix of a stack with a single gather. The permutation changes the order
+        of the rows and columns in the same way
+
+        Arguments
+            :matrices (np.array): A (B x N x N) numpy array containing the matrices that are to be permutated
+            :permutations (np.array): A (P x N) numpy array where each row contains the order of the rows and columns
+        Returns
+            :permutated_matrices (np.array): A (B x P x N x N) numpy array where element [b, p] is matrix b
+                                             permutated by permutation p
+        """
+        permutations = np.asarray(permutations)
+        return matrices[:, permutations[:, :, None], permutations[:, None, :]]
+
+    def __sample_chunks(self, sample_function, amount_samples, chunk_size, *args, **kwargs):
         """
-        permutated_matrices = []
-        for perm in permutations:
-            permutated_matrices.append(np.take(np.take(matrix, perm, axis=0), perm, axis=1))
-        return permutated_matrices
+        A generator that calls the given sampling function repeatedly to sample the requested amount
+        of samples in chunks of at most chunk_size samples. Every chunk draws its diagonal and off-diagonal samples
+        from the numpy random state in turn, so the random numbers are consumed in a different order than when all
+        the samples are drawn at once: with the same seed the chunked samples differ from the unchunked ones, but they
+        follow the same distribution and are reproducible for the same chunk_size
+
+        This function is a utility function for the chunked sampling mode
+        """
+        for start in range(0, amount_samples, chunk_size):
+            yield sample_function(*args, min(chunk_size, amount_samples-start), **kwargs)
 
     def sample_homogeneous_matrix(self, triu_vector, amount_samples,
-                                  diagonal_interval=[-5,0.001], off_diagonal_interval=[-5,-0.001]):
+                                  diagonal_interval=[-5,0.001], off_diagonal_interval=[-5,-0.001], chunk_size=None):
         """        
         A function that takes a upper triangle of a homogeneous systems, i.e. a graph consisting of a single
         vertex type, and generates an amount of samples within the specified sampling ranges
@@ -78,22 +299,30 @@ class graph_sampler():
             :off_diagonal_interval (opt, list): A list of floats that determines the lower and upper range
                                                 of the uniform random distribution used in the generation of the samples
                                                 for the off-diagonal elements of the adjacency matrix
+            :chunk_size (opt, int): When given a generator is returned that yields the samples in arrays of at most
+                                    chunk_size samples, so that large amounts of samples never have to be stored at once.
+                                    With the same seed the chunked samples differ from the unchunked ones, the samples
+                                    are only reproducible for the same chunk_size
         Returns
-            :sampled_trius (list): A list of numpy arrays containing the upper triangle vector sampled randomly
+            :sampled_trius (np.array): A (amount_samples x N(N+1)/2) numpy array containing the upper triangle vectors sampled randomly
         """
+        if chunk_size is not None:
+            return self.__sample_chunks(self.sample_homogeneous_matrix, amount_samples, chunk_size, triu_vector,
+                                        diagonal_interval=diagonal_interval, off_diagonal_interval=off_diagonal_interval)
         diagonal_distribution=np.random.uniform(diagonal_interval[0], diagonal_interval[1], amount_samples)
         off_diagonal_distribution=np.random.uniform(off_diagonal_interval[0], off_diagonal_interval[1], amount_samples)
-        adjacency_matrix = self.convert_triu_to_mat(triu_vector)
-        sampled_trius=[]
-        for diagonal_el, off_diagonal_el in zip(diagonal_distribution, off_diagonal_distribution):
-            sampled_matrix = np.copy(adjacency_matrix)
-            sampled_matrix = np.where(sampled_matrix==1, off_diagonal_el, sampled_matrix)
-            sampled_matrix[np.diag_indices(self.sites)]=diagonal_el
-            sampled_trius.append(sampled_matrix[np.triu_indices(self.sites,0)])
+        triu_vector = np.asarray(triu_vector, dtype=float)
+        #Locate the diagonal elements in the upper triangle
+        row_indices, column_indices = triu_indices(self.sites)
+        diagonal_mask = row_indices==column_indices
+        #Every weight in the template is replaced by the off-diagonal sample of the corresponding system
+        sampled_trius = np.where((triu_vector==1) & ~diagonal_mask,
+                                 off_diagonal_distribution.reshape(-1,1), triu_vector)
+        sampled_trius[:, diagonal_mask] = diagonal_distribution.reshape(-1,1)
         return sampled_trius
 
     def sample_inhomogeneous_matrix(self, diagonal_vector, triu_vector, amount_samples,
-                      diagonal_interval=[-5,0.001], off_diagonal_interval=[-5,-0.001]):
+                      diagonal_interval=[-5,0.001], off_diagonal_interval=[-5,-0.001], chunk_size=None):
         """
         Constructs a weighted adjacency matrix sampled uniformly based on the symbolic assignment of the elements
             - The diagonal elements are assigned symbolic through integers. These integers will be replaced by random values
@@ -113,37 +342,29 @@ class graph_sampler():
             :off_diagonal_interval (opt, list): A list of floats that determines the lower and upper range
                                                       of the uniform random distribution used in the generation of the samples
                                                       for the off-diagonal elements of the adjacency matrix
+            :chunk_size (opt, int): When given a generator is returned that yields the samples in arrays of at most
+                                    chunk_size samples, which bounds the memory needed for large amounts of samples.
+                                    With the same seed the chunked samples differ from the unchunked ones, the samples
+                                    are only reproducible for the same chunk_size
         Returns
-            :sampled_trius (list): A list of numpy arrays containing the upper triangle vector sampled randomly
+            :sampled_trius (np.array): A (amount_samples x N(N+1)/2) numpy array containing the upper triangle vectors sampled randomly
         """
-        #We repeat the symbolic diagonal along the row axis
-        row_matrix = np.repeat(np.array([diagonal_vector]), self.sites, 0)
-        adjacency_matrix = self.convert_triu_to_mat(triu_vector)
-        #Converts the row matrix into a sparse matrix based on the adjacency_matrix
-        row_matrix = np.multiply(adjacency_matrix, row_matrix)
-        
+        if chunk_size is not None:
+            return self.__sample_chunks(self.sample_inhomogeneous_matrix, amount_samples, chunk_size, diagonal_vector, triu_vector,
+                                        diagonal_interval=diagonal_interval, off_diagonal_interval=off_diagonal_interval)
+        diagonal_vector = np.asarray(diagonal_vector)
         number_distributions = max(diagonal_vector)
-        sampled_adjacency_matrices=[]
         off_diagonal_samples = np.random.uniform(off_diagonal_interval[0], off_diagonal_interval[1], (number_distributions, amount_samples))
-        for rand_idx in range(amount_samples):
-            sampled_row_matrix =np.copy(row_matrix)
-            for	idx in range(number_distributions):
-                sampled_row_matrix=np.where(sampled_row_matrix==idx+1, off_diagonal_samples[idx][rand_idx],sampled_row_matrix)
-            #We average the sampled row matrix with its transposed form. When doing this we ensure that sites that describe the same type
-            #i.e those that have the same integer in the diagonal have the a different value than the coupling between two vertices with different
-            #integers.
-            sampled_adjacency_matrices.append(0.5*(sampled_row_matrix+sampled_row_matrix.T))
-
         diagonal_samples = np.random.uniform(diagonal_interval[0], diagonal_interval[1], (number_distributions, amount_samples))
-        sampled_diagonals = []
-        for rand_idx in range(amount_samples):
-            sampled_diagonal = np.array(diagonal_vector)
-            for idx in range(number_distributions):
-                sampled_diagonal=np.where(sampled_diagonal==idx+1, diagonal_samples[idx][rand_idx],sampled_diagonal) 
-            sampled_diagonals.append(sampled_diagonal)
-
-        sampled_trius = []
-        for diagonal, adjacency in zip(sampled_diagonals, sampled_adjacency_matrices):
-            adjacency[np.diag_indices(self.sites)]=diagonal
-            sampled_trius.append(adjacency[np.triu_indices(self.sites, 0)])
+        row_indices, column_indices = triu_indices(self.sites)
+        diagonal_mask = row_indices==column_indices
+        #The edge between vertex i and j is the average of the samples of the vertex types of i and j. Edges
+        #that connect vertices of the same type as such get a different value than edges between different types.
+        #The samples are padded with a zero column so that the type 0, i.e. no edge, gathers a zero weight
+        off_diagonal_samples = np.concatenate([np.zeros((amount_samples, 1)), off_diagonal_samples.T], 1)
+        edges = np.asarray(triu_vector)!=0
+        row_types = np.where(edges, diagonal_vector[row_indices], 0)
+        column_types = np.where(edges, diagonal_vector[column_indices], 0)
+        sampled_trius = 0.5*(off_diagonal_samples[:, column_types]+off_diagonal_samples[:, row_types])
+        sampled_trius[:, diagonal_mask] = diagonal_samples.T[:, diagonal_vector-1]
         return sampled_trius
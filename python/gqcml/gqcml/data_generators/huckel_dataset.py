@@ -0,0 +1,153 @@
+import os
+import numpy as np
+from multiprocessing import Pool
+from h5py import File as f
+from gqcml.data_generators.Huckel import HuckelSolver
+from gqcml.data_generators.graph_sampler import graph_sampler
+from gqcml.data.Data import Preprocessor
+from gqcml.utils.parallel import imap_bounded
+
+def shard_seed(seed, shard_idx):
+    """
+    Derives the random seed of a shard from the seed of the dataset. The seed only depends on the
+    shard index so a shard is sampled identically regardless of the worker that processes it
+
+    Arguments
+        :seed (int): The random seed of the complete dataset
+        :shard_idx (int): The index of the shard
+    Returns
+        :shard_seed (int): The random seed used to sample the shard
+    """
+    return int(np.random.SeedSequence([seed, shard_idx]).generate_state(1)[0])
+
+def solve_shard(shard):
+    """
+    Samples and solves a single shard of a Hückel dataset. This function is executed by the workers
+    of the process pool in generate_huckel_dataset
+
+    Arguments
+        :shard (tuple): A tuple containing the shard index, the number of samples in the shard and the
+                        dictionary with the settings of the dataset (see generate_huckel_dataset)
+    Returns
+        :shard_idx, trius, energies, densities (tuple): The index of the shard, the sampled upper triangles,
+                                                        the energies and the upper triangles of the density matrices.
+                                                        The densities are None when they were not requested
+    """
+    shard_idx, amount_samples, settings = shard
+    sites = settings["sites"]
+    np.random.seed(shard_seed(settings["seed"], shard_idx))
+    sampler = graph_sampler(sites)
+    if settings["diagonal_vector"] is None:
+        trius = sampler.sample_homogeneous_matrix(settings["triu_vector"], amount_samples,
+                                                  diagonal_interval=settings["diagonal_interval"],
+                                                  off_diagonal_interval=settings["off_diagonal_interval"])
+    else:
+        trius = sampler.sample_inhomogeneous_matrix(settings["diagonal_vector"], settings["triu_vector"], amount_samples,
+                                                    diagonal_interval=settings["diagonal_interval"],
+                                                    off_diagonal_interval=settings["off_diagonal_interval"])
+    preprocessor = Preprocessor(sites)
+    hamiltonians = preprocessor.trius_to_matrices(trius)
+    solver = HuckelSolver()
+    solver.solve_ndo(hamiltonians)
+    energies = solver.compute_energy(settings["N_a"], settings["N_b"])
+    densities = None
+    if settings["density"]:
+        densities = preprocessor.matrices_to_trius(solver.compute_density_matrix(settings["N_a"], settings["N_b"]))
+    return shard_idx, trius, energies, densities
+
+def generate_huckel_dataset(filepath, sites, triu_vector, amount_samples, N_a, N_b,
+                            diagonal_vector=None, seed=0, shard_size=100000, processes=None,
+                            diagonal_interval=[-5,0.001], off_diagonal_interval=[-5,-0.001],
+                            prefix="train", density=False, compression=4, verbose=False):
+    """
+    Generates a Hückel dataset by sampling and solving shards of systems in a process pool. The results
+    are streamed into a chunked and compressed HDF5 file in the order of the shards. The number of shards in flight is
+    bounded to twice the number of processes, so only the shards that are being processed or written are held in memory. The file contains the following datasets
+
+        - <prefix>_input: The upper triangles of the sampled systems
+        - <prefix>_energy: The energies of the sampled systems
+        - <prefix>_density (opt): The upper triangles of the total density matrices
+
+    Every shard is sampled with its own seed derived from the dataset seed, which makes the dataset reproducible.
+    When the generation is interrupted calling this function again with the same arguments resumes it from the last
+    shard that was written completely.
+
+    Arguments
+        :filepath (str): The filepath of the HDF5 file in which the dataset is stored
+        :sites (int): The number of sites in the system
+        :triu_vector (np.array): A upper triangle np array consisting of 0's and 1's that describes the structure of the system
+        :amount_samples (int): The total number of systems in the dataset
+        :N_a (int): The number of alpha electrons
+        :N_b (int): The number of beta electrons
+        :diagonal_vector (opt, list): A list of integers that symbolic denotes the type of each vertex. When it is given the
+                                      systems are sampled with sample_inhomogeneous_matrix, otherwise with sample_homogeneous_matrix
+        :seed (opt, int): The random seed of the dataset
+        :shard_size (opt, int): The number of systems sampled and solved by a worker in a single task. This is also the
+                                chunk size of the HDF5 datasets
+        :processes (opt, int): The number of worker processes. Standardly all the available cores are used
+        :diagonal_interval (opt, list): The lower and upper bound of the uniform distribution of the diagonal elements
+        :off_diagonal_interval (opt, list): The lower and upper bound of the uniform distribution of the off-diagonal elements
+        :prefix (opt, str): The prefix of the dataset names
+        :density (opt, bool): Option to store the density matrices as well
+        :compression (opt, int): The gzip compression level of the datasets
+        :verbose (opt, bool): Option to print the progress after every shard
+    Returns
+        :None: The dataset is written to the HDF5 file
+    """
+    settings = {"sites":sites,
+                "triu_vector":np.array(triu_vector),
+                "diagonal_vector":None if diagonal_vector is None else list(diagonal_vector),
+                "diagonal_interval":list(diagonal_interval),
+                "off_diagonal_interval":list(off_diagonal_interval),
+                "N_a":N_a,
+                "N_b":N_b,
+                "seed":seed,
+                "density":density}
+    shard_sizes = [min(shard_size, amount_samples-start) for start in range(0, amount_samples, shard_size)]
+    triu_dim = sites*(sites+1)//2
+    #These attributes determine the content of the dataset, a file can only be resumed when they match
+    attributes = {"sites":sites, "triu_vector":settings["triu_vector"],
+                  "diagonal_vector":[0] if diagonal_vector is None else settings["diagonal_vector"],
+                  "diagonal_interval":settings["diagonal_interval"],
+                  "off_diagonal_interval":settings["off_diagonal_interval"],
+                  "N_a":N_a, "N_b":N_b, "seed":seed, "shard_size":shard_size, "amount_samples":amount_samples,
+                  "density":density}
+    datasets = {prefix+"_input":(triu_dim,), prefix+"_energy":()}
+    if density:
+        datasets[prefix+"_density"] = (triu_dim,)
+    with f(filepath, "a") as h5_file:
+        if prefix+"_input" in h5_file:
+            missing = [name for name in datasets if name not in h5_file]
+            if missing:
+                raise ValueError("The file "+filepath+" does not contain the datasets "+str(missing)+", it can not be resumed")
+            for key, value in attributes.items():
+                if key not in h5_file[prefix+"_input"].attrs or not np.array_equal(h5_file[prefix+"_input"].attrs[key], value):
+                    raise ValueError("The file "+filepath+" contains a dataset generated with a different "+key)
+            completed_shards = int(h5_file[prefix+"_input"].attrs["completed_shards"])
+            #Discard the rows of a shard that was being written when the generation was interrupted
+            for name in datasets:
+                h5_file[name].resize(sum(shard_sizes[:completed_shards]), axis=0)
+        else:
+            for name, shape in datasets.items():
+                h5_file.create_dataset(name, shape=(0,)+shape, maxshape=(None,)+shape, dtype="f8",
+                                       chunks=(min(shard_size, amount_samples),)+shape, compression="gzip",
+                                       compression_opts=compression)
+            h5_file[prefix+"_input"].attrs.update(attributes)
+            completed_shards = 0
+        h5_file[prefix+"_input"].attrs["completed_shards"] = completed_shards
+        shards = [(shard_idx, shard_sizes[shard_idx], settings) for shard_idx in range(completed_shards, len(shard_sizes))]
+        processes = os.cpu_count() if processes is None else processes
+        with Pool(processes) as pool:
+            #The shards are written in order and the number of shards in flight is bounded, so finished shards do
+            #not pile up in memory while the file is being written
+            for shard_idx, trius, energies, densities in imap_bounded(pool, solve_shard, shards, 2*processes):
+                results = {prefix+"_input":trius, prefix+"_energy":energies, prefix+"_density":densities}
+                for name in datasets:
+                    start = h5_file[name].shape[0]
+                    h5_file[name].resize(start+len(trius), axis=0)
+                    h5_file[name][start:] = results[name]
+                h5_file[prefix+"_input"].attrs["completed_shards"] = shard_idx+1
+                h5_file.flush()
+                if verbose:
+                    print("Shard "+str(shard_idx+1)+"/"+str(len(shard_sizes))+" written to "+filepath)
+    return None
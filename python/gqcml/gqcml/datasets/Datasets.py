@@ -1,12 +1,21 @@
 import os
+import hashlib
+import tempfile
 import torch
 import torch_geometric
 import numpy as np
 from gqcml.data import Data
+from gqcml.datasets.hdf5 import HDF5Dataset
+from gqcml.datasets.collated import CollatedGraphDataset
+from gqcml.utils.precision import get_default_dtype
 from h5py import File as f
 from sklearn.model_selection import train_test_split
 
-def bin_values(target_values, num_bins):
+#The version of the processed inputs in the feature cache (see feature_cache_key). It is incremented whenever the
+#preprocessor methods change their output, which invalidates the entries that were cached by older versions
+feature_cache_version = 1
+
+def bin_values(target_values, num_bins, chunk_size=None):
     """
     A function to partition a continuous target variable into discrete bins. This function is intended
     to work together with the train_test_split functionality from sklearn.model_selection to partition the
@@ -17,15 +26,75 @@ def bin_values(target_values, num_bins):
         :target_values (np.array): A 2D numpy array containing the continuous target values of the dataset.
                                      Each row represents the target value of a datapoint
         :num_bins (int): An integer that determines the number of output classes that the function returns
+        :chunk_size (opt,int): The number of rows that are processed at once. When it is given the target values are
+                                 streamed in chunks, e.g. from an HDF5 dataset, instead of being loaded at once
     Returns
         :binned_values (np.array): A 2D array where the values of the input array have been classified into
                                       discrete bins determined by the minimum and maximum of the input array.
     """
-    min_value = np.amin(target_values)
-    max_value = np.amax(target_values)
+    if chunk_size is None:
+        min_value = np.amin(target_values)
+        max_value = np.amax(target_values)
+    else:
+        chunks = [slice(start, start+chunk_size) for start in range(0, len(target_values), chunk_size)]
+        min_value = min(np.amin(target_values[chunk]) for chunk in chunks)
+        max_value = max(np.amax(target_values[chunk]) for chunk in chunks)
     #A small perturbation is added to the boundary values to ensure that all bins contain more than 1 datapoint
     bins = np.linspace(min_value-(0.001*min_value),max_value+(0.001*max_value),num_bins)
-    return np.digitize(target_values, bins)
+    if chunk_size is None:
+        return np.digitize(target_values, bins)
+    return np.concatenate([np.digitize(target_values[chunk], bins) for chunk in chunks])
+
+def take_rows(values, indices):
+    """
+    Selects rows from a numpy array, a list or an HDF5 dataset in the given order. An HDF5 dataset only supports reading
+    increasing indices, the rows are therefore read in sorted order and reordered in memory
+
+    Arguments
+        :values (np.array, list or h5py.Dataset): The array from which the rows are selected
+        :indices (np.array): The indices of the rows
+    Returns
+        :rows (np.array or list): The selected rows, a list when the values are a list
+    """
+    if isinstance(values, np.ndarray):
+        return values[indices]
+    if isinstance(values, (list, tuple)):
+        return [values[idx] for idx in indices]
+    unique_indices, inverse = np.unique(indices, return_inverse=True)
+    return values[unique_indices][inverse.reshape(-1)]
+
+def split_indices(target_values, data_frac, seed, stratify=True, num_bins=10, shuffle=True, chunk_size=None):
+    """
+    A function that splits the indices of a dataset into a training, validation and test set. Only the target values
+    are required, so the inputs are never copied: the index arrays can be used to slice the inputs or passed to a
+    sampler that reads the datapoints lazily. The same seed reproduces the split of split_dataset
+
+    Arguments
+        :target_values (np.array or h5py.Dataset): An array containing the continuous target values of the dataset.
+                                                     Each row represents the target value of a datapoint.
+        :data_frac (float): The fraction of the dataset that should be reserved for the validation and test set. 
+                              This fraction will be split in half for both these sets.
+        :seed (int): The random seed used to determine the split of the dataset.
+        :stratify (opt,bool): Option to partition the dataset according to the distribution of the target values. This option
+                                       ensures that all the sets follow the same distribution in their target.
+        :num_bins (opt,int): An integer that determines the number of output classes
+        :shuffle (opt,bool): Option to shuffle the dataset before partitioning it into a training, validation and test set.
+        :chunk_size (opt,int): The number of target values that are binned at once (see bin_values)
+    Returns
+        :train_indices, val_indices, test_indices (tuple): The indices of the datapoints in the training, validation and test set
+    """
+    indices = np.arange(len(target_values))
+    if stratify is True:
+        binned_target = bin_values(target_values, num_bins, chunk_size=chunk_size)
+        train_indices, valtest_indices = train_test_split(indices, test_size=data_frac, random_state=seed,
+                                                          stratify=binned_target, shuffle=shuffle)
+        binned_valtest = bin_values(take_rows(target_values, valtest_indices), num_bins)
+        val_indices, test_indices = train_test_split(valtest_indices, test_size=0.5, stratify=binned_valtest,
+                                                     random_state=seed, shuffle=shuffle)
+    else:
+        train_indices, valtest_indices = train_test_split(indices, test_size=data_frac, random_state=seed, shuffle=shuffle)
+        val_indices, test_indices = train_test_split(valtest_indices, test_size=0.5, random_state=seed, shuffle=shuffle)
+    return train_indices, val_indices, test_indices
 
 def split_dataset(input_values, target_values, data_frac, seed,
                   stratify=True, num_bins=10, shuffle=True, return_output=True):
@@ -33,7 +102,7 @@ def split_dataset(input_values, target_values, data_frac, seed,
     A function that splits a dataset into a training, validation and test set.
 
     Arguments
-        :input_values (np.array): A 2D numpy array containing the input values of the dataset. Each row represents an input vector of the dataset.
+        :input_values (np.array or list): A 2D numpy array containing the input values of the dataset. Each row represents an input vector of the dataset.
         :output_values (np.array): A 2D numpy array containing the continuous target values of the dataset.
                                      Each row represents the target value of a datapoint.
         :data_frac (float): The fraction of the dataset that should be reserved for the validation and test set. 
@@ -47,29 +116,12 @@ def split_dataset(input_values, target_values, data_frac, seed,
         :inputs, outputs (tuple): The function returns a tuple of the split dataset in the order of input data followed by output data.
                                      The order in which this happens is training, validation and test set
     """
-    if stratify is True:
-        binned_target = bin_values(target_values, num_bins)
-        train_input, valtest_input, train_output, valtest_output = train_test_split(input_values, target_values,
-                                                                                    test_size=data_frac, random_state=seed,
-                                                                                    stratify=binned_target, shuffle=shuffle)
-        binned_valtest = bin_values(valtest_output, num_bins)
-        val_input, test_input, val_output, test_output = train_test_split(valtest_input, valtest_output, test_size=0.5,
-                                                                          stratify=binned_valtest, random_state=seed,
-                                                                          shuffle=shuffle)
-        if return_output:
-            return train_input, val_input, test_input, train_output, val_output, test_output
-        else:
-            return train_input, val_input, test_input
+    split = split_indices(target_values, data_frac, seed, stratify=stratify, num_bins=num_bins, shuffle=shuffle)
+    inputs = tuple(take_rows(input_values, indices) for indices in split)
+    if return_output:
+        return inputs+tuple(take_rows(target_values, indices) for indices in split)
     else:
-        train_input, valtest_input, train_output, valtest_output = train_test_split(input_values, target_values,
-                                                                                    test_size=data_frac, random_state=seed,
-                                                                                    shuffle=shuffle)
-        val_input, test_input, val_output, test_output = train_test_split(valtest_input, valtest_output, test_size=0.5,
-                                                                          random_state=seed, shuffle=shuffle)
-        if return_output:
-            return train_input, val_input, test_input, train_output, val_output, test_output
-        else:
-            return train_input, val_input, test_input
+        return inputs
 
 def QM9_index_splitter(indices, seed, data_frac, shuffle=True):
     train_indices, valtest_indices = train_test_split(indices, test_size=data_frac, random_state=seed, shuffle=shuffle)
@@ -77,14 +129,50 @@ def QM9_index_splitter(indices, seed, data_frac, shuffle=True):
     return train_indices, val_indices, test_indices
 
 def QM9_dataloader(root_dir, indices, target_descr, batch_size, shuffle=True):
+    """
+    A function that constructs a torch_geometric DataLoader over a subset of the QM9 dataset. The molecules are read
+    from the collated graph store constructed by gqcml.data.QM9.format_dataset, the file is read once and the subset
+    is selected with the index array
+
+    Arguments
+        :root_dir (str): The directory containing the processed directory
+        :indices (np.array): The indices of the molecules in the subset (see QM9_index_splitter)
+        :target_descr (str): The description of the target used in the filename of the store
+        :batch_size (int): The number of molecules in each batch
+        :shuffle (opt, bool): A boolean that enables the option to shuffle the data during batch iteration
+    Returns
+        :loader (torch_geometric.data.DataLoader): A DataLoader object that returns batch objects
+    """
     data_name = "QM9_"+target_descr
     processed_dir = os.path.join(root_dir, "processed")
-    filenames = [os.path.join(processed_dir, data_name+"_{}.pt".format(idx)) for idx in indices]
-    dataset = [torch.load(filename) for filename in filenames]
+    dataset = CollatedGraphDataset(os.path.join(processed_dir, data_name+".h5"))
+    dataset = torch.utils.data.Subset(dataset, np.asarray(indices).tolist())
     return torch_geometric.data.DataLoader(dataset, batch_size=batch_size, shuffle=shuffle)
 
+def feature_cache_key(trius, preprocessor, am_args, preprocessor_nf_method, nf_args):
+    """
+    Computes the key of the cache entry of a processed dataset (see trius_to_inputs). The key is the SHA-1 hash of
+    the content of the trius together with the graph dimension, the name of the node feature method, the
+    arguments of the adjacency matrix and node feature methods and the version of the cache (feature_cache_version)
+
+    Arguments
+        :trius (np.array): A numpy array containing the trius of the graphs that are to be processed
+        :preprocessor (gqcml.data.Data.Preprocessor): The preprocessor that processes the trius
+        :am_args (list): The list of function arguments for the adjacency_matrix method
+        :preprocessor_nf_method (gqcml.data.Data.Preprocessor): The node feature method of the preprocessor
+        :nf_args (list): The list of function arguments for the node feature method
+    Returns
+        :cache_key (str): The hexadecimal hash that identifies the processed dataset
+    """
+    trius = np.ascontiguousarray(trius)
+    cache_hash = hashlib.sha1()
+    cache_hash.update(repr((feature_cache_version, trius.dtype.str, trius.shape, preprocessor.graph_dim,
+                            preprocessor_nf_method.__name__, list(am_args), list(nf_args))).encode())
+    cache_hash.update(trius.data)
+    return cache_hash.hexdigest()
+
 def trius_to_inputs(trius, preprocessor, am_args,
-                    preprocessor_nf_method, nf_args):
+                    preprocessor_nf_method, nf_args, cache_dir=None):
     """
     A function that interacts with the preprocessor class defined in the Data section of gqcml.
     The function takes as stack of upper triangle values and converts them to their matrix representation.
@@ -111,20 +199,37 @@ def trius_to_inputs(trius, preprocessor, am_args,
         :nf_args (list): The list of function arguments (excluding the input matrix) for the nf_method.
                            When no arguments need to specified the input should be an empty list
         :args (list): The arguments for the preprocessor_method excluding the matrix to be processed.
+        :cache_dir (opt, str): A directory in which the processed inputs are cached as .npy files. The cache entries
+                               are keyed on the content of the trius, the node feature method and the arguments (see
+                               feature_cache_key). When the inputs were processed before, they are loaded as memory
+                               mapped arrays instead of being recomputed
     Returns
         :node_features, adjacency_matrices: Returns the processed node features and the adjacency matrices
     """
-    matrices = np.array([preprocessor.triu_to_matrix(triu) for triu in trius])
-    node_features, adjacency_matrices  = [], []
-    for matrix in matrices:
-        am = preprocessor.adjacency_matrix(matrix, *am_args)
-        nf = preprocessor_nf_method(matrix, *nf_args)
-        node_features.append(nf)
-        adjacency_matrices.append(am)
-    return np.array(node_features), np.array(adjacency_matrices)
+    if cache_dir is not None:
+        cache_key = feature_cache_key(trius, preprocessor, am_args, preprocessor_nf_method, nf_args)
+        cache_files = [os.path.join(cache_dir, cache_key+"_"+name+".npy") for name in ["node_features", "adjacency_matrices"]]
+        if all(os.path.exists(cache_file) for cache_file in cache_files):
+            #Copy-on-write memory maps, the arrays are only read from disk when they are accessed
+            node_features, adjacency_matrices = [np.load(cache_file, mmap_mode="c") for cache_file in cache_files]
+            return node_features, adjacency_matrices
+    #The preprocessor methods process the whole stack of matrices at once
+    matrices = preprocessor.triu_to_matrix(trius)
+    adjacency_matrices = preprocessor.adjacency_matrix(matrices, *am_args)
+    node_features = preprocessor_nf_method(matrices, *nf_args)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        for cache_file, array in zip(cache_files, [node_features, adjacency_matrices]):
+            #The array is written to a temporary file first so an interrupted write never leaves a corrupt entry
+            file_descriptor, temporary_file = tempfile.mkstemp(suffix=".npy", dir=cache_dir)
+            with os.fdopen(file_descriptor, "wb") as cache_stream:
+                np.save(cache_stream, array)
+            os.replace(temporary_file, cache_file)
+    return node_features, adjacency_matrices
     
 def DataLoader_constructor(input_tensors, output_tensors, batch_size, shuffle=True,
-                           pin_memory=False, num_workers=0):
+                           pin_memory=False, num_workers=0, hdf5_file=None, read_ahead=0,
+                           batch_fetch=None, drop_last=False):
     """
     A function that takes in a set of input tensors and a set of output tensor and 
     constructs a data loader that can be used in the optimization of network.
@@ -132,28 +237,49 @@ def DataLoader_constructor(input_tensors, output_tensors, batch_size, shuffle=Tr
     Arguments
         :input_tensors (list of torch.Tensor): A list of input tensors
         :output_tensors (torch.Tensor): A tensor that contains the corresponding output tensors
-        :batch_size (int): An integer that determines the number of tensors in each batch 
+        :batch_size (int): An integer that determines the number of tensors in each batch. The tensors are converted to
+                             the floating point type of gqcml (see gqcml.utils.precision)
         :shuffle (opt, bool): A boolean that enables the option to shuffle the data during batch iteration
         :pin_memory (opt, bool): A boolean that enables the option to pin memory in the GPUs utilized during training.
                                    This allows for faster data transfer
         :num_workers (opt, int): An integer that controls how many subprocesses to use for data loading. 
                                    0 means that the data will be loaded in the main process
+        :hdf5_file (opt, str): The filepath of an HDF5 file. When it is given the input_tensors and output_tensors are the
+                                 names of the datasets in this file and the data is read lazily from the file instead of
+                                 being loaded into memory (see HDF5Dataset)
+        :read_ahead (opt, int): The number of additional chunks that are read from the HDF5 file at once
+        :batch_fetch (opt, bool): Option to retrieve every batch from the dataset at once. The sampler draws the indices of
+                                    a complete batch and every tensor is sliced with a single indexing operation, instead of
+                                    retrieving the datapoints one by one and stacking them. Standardly the batches are
+                                    fetched at once when shuffled data is read from an HDF5 file, which reads every
+                                    batch with a single file access (see HDF5Dataset.read_batch)
+        :drop_last (opt, bool): Option to drop the last batch when it is smaller than the batch size
     Returns
         :loader (torch.data.DataLoader): A DataLoader object that returns batch objects  
     """
-    if type(input_tensors) is list:
-        input_tensors = [torch.from_numpy(stack).double() for stack in input_tensors]
-        output_tensors = torch.from_numpy(output_tensors).double().reshape(-1,1)
+    if hdf5_file is not None:
+        dataset = HDF5Dataset(hdf5_file, input_tensors, output_tensors, read_ahead=read_ahead)
+    elif type(input_tensors) is list:
+        input_tensors = [torch.from_numpy(stack).to(get_default_dtype()) for stack in input_tensors]
+        output_tensors = torch.from_numpy(output_tensors).to(get_default_dtype()).reshape(-1,1)
         dataset = torch.utils.data.TensorDataset(*input_tensors, output_tensors)
-        loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=shuffle,
-                                             pin_memory=pin_memory, num_workers=num_workers)
-        return loader
     else:
-        input_tensors = torch.from_numpy(input_tensors).double()
-        output_tensors = torch.from_numpy(output_tensors).double().reshape(-1,1)
+        input_tensors = torch.from_numpy(input_tensors).to(get_default_dtype())
+        output_tensors = torch.from_numpy(output_tensors).to(get_default_dtype()).reshape(-1,1)
         dataset = torch.utils.data.TensorDataset(input_tensors, output_tensors)
-        loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=shuffle,
+    if batch_fetch is None:
+        batch_fetch = hdf5_file is not None and shuffle
+    if batch_fetch:
+        #The datasets are indexed with the list of indices of a batch, the automatic batching is disabled
+        if shuffle:
+            sampler = torch.utils.data.RandomSampler(dataset)
+        else:
+            sampler = torch.utils.data.SequentialSampler(dataset)
+        batch_sampler = torch.utils.data.BatchSampler(sampler, batch_size=batch_size, drop_last=drop_last)
+        loader = torch.utils.data.DataLoader(dataset, batch_size=None, sampler=batch_sampler,
                                              pin_memory=pin_memory, num_workers=num_workers)
         return loader
-
+    loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, drop_last=drop_last,
+                                         pin_memory=pin_memory, num_workers=num_workers)
+    return loader
 
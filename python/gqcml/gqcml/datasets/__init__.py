@@ -1,2 +1,3 @@
 from .Datasets import *
-
+from .hdf5 import *
+from .collated import *
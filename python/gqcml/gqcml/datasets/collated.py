@@ -0,0 +1,102 @@
+import torch
+import torch_geometric
+import numpy as np
+from h5py import File as f
+
+graph_keys = ["x", "pos", "edge_index", "edge_attr", "y"]
+
+def append_graphs(h5_file, graphs, compression=4):
+    """
+    Appends a list of graphs to a collated graph store. All the graphs are concatenated in a single array per
+    attribute, the node and edge pointers contain the offsets of each graph in these arrays
+
+        - x: The node features of all the graphs (num_nodes x ...)
+        - pos: The positions of the nodes (num_nodes x 3)
+        - edge_index: The edges of all graphs (num_edges x 2), numbered with the node indices within the graph
+        - edge_attr: The edge features (num_edges x ...)
+        - y: The graph targets (num_graphs x ...), every graph has a target with a leading dimension of one
+        - node_ptr, edge_ptr: The offsets of the graphs in the node and edge arrays (num_graphs+1)
+
+    The datasets are created when the first graphs are appended, afterwards they are resized to append the graphs
+
+    Arguments
+        :h5_file (h5py.File): The opened HDF5 file (or group) in which the graphs are stored
+        :graphs (list): A list of torch_geometric.data.Data objects or dictionaries that contain (a subset of) the
+                        attributes x, pos, edge_index, edge_attr and y as numpy arrays or tensors
+        :compression (opt, int): The gzip compression level of the datasets created by this call
+    Returns
+        :num_graphs (int): The number of graphs in the store
+    """
+    if len(graphs)==0:
+        return len(h5_file["node_ptr"])-1 if "node_ptr" in h5_file else 0
+    keys = [key for key in graph_keys if key in graphs[0] and graphs[0][key] is not None]
+    arrays = {key:[np.asarray(graph[key]) for graph in graphs] for key in keys}
+    if "edge_index" in arrays:
+        arrays["edge_index"] = [edge_index.T for edge_index in arrays["edge_index"]]
+    num_nodes = np.array([len(graph["x"] if "x" in keys else graph["pos"]) for graph in graphs])
+    if "edge_index" in arrays:
+        num_edges = np.array([len(edge_index) for edge_index in arrays["edge_index"]])
+    else:
+        num_edges = np.zeros(len(graphs), dtype=np.int64)
+    if "y" in arrays:
+        #Graph targets are stored with a leading dimension of one, as in the torch_geometric batches
+        arrays["y"] = [y if y.ndim>0 and y.shape[0]==1 else y[None] for y in arrays["y"]]
+    if "node_ptr" not in h5_file:
+        for key, values in arrays.items():
+            shape = values[0].shape[1:]
+            h5_file.create_dataset(key, shape=(0,)+shape, maxshape=(None,)+shape, dtype=values[0].dtype,
+                                   chunks=True, compression="gzip", compression_opts=compression)
+        for key in ["node_ptr", "edge_ptr"]:
+            h5_file.create_dataset(key, data=np.zeros(1, dtype=np.int64), maxshape=(None,), chunks=True)
+    for key, values in arrays.items():
+        values = np.concatenate(values, 0)
+        start = h5_file[key].shape[0]
+        h5_file[key].resize(start+len(values), axis=0)
+        h5_file[key][start:] = values
+    for key, counts in [("node_ptr", num_nodes), ("edge_ptr", num_edges)]:
+        start = h5_file[key].shape[0]
+        h5_file[key].resize(start+len(counts), axis=0)
+        h5_file[key][start:] = h5_file[key][start-1]+np.cumsum(counts)
+    return len(h5_file["node_ptr"])-1
+
+class CollatedGraphDataset(torch.utils.data.Dataset):
+    """
+    A graph dataset that is read from a collated graph store (see append_graphs). The store is read with a single
+    file access, afterwards every graph is retrieved by slicing the concatenated arrays with its offsets, which avoids
+    storing and deserializing a file per graph. This dataset can be used in torch.utils.data.Subset and the
+    torch_geometric DataLoader like a list of Data objects
+
+    Attributes
+        :filepath (str): The filepath of the HDF5 file containing the collated graphs
+        :transform (opt, callable): A function that is applied to every retrieved Data object
+    """
+    def __init__(self, filepath, transform=None):
+        self.filepath = filepath
+        self.transform = transform
+        with f(filepath, "r") as h5_file:
+            self.arrays = {key:np.array(h5_file[key]) for key in graph_keys if key in h5_file}
+            self.node_ptr = np.array(h5_file["node_ptr"])
+            self.edge_ptr = np.array(h5_file["edge_ptr"])
+
+    def __len__(self):
+        return len(self.node_ptr)-1
+
+    def __getitem__(self, idx):
+        if idx<0:
+            idx += len(self)
+        node_slice = slice(self.node_ptr[idx], self.node_ptr[idx+1])
+        edge_slice = slice(self.edge_ptr[idx], self.edge_ptr[idx+1])
+        attributes = {}
+        for key, values in self.arrays.items():
+            if key=="edge_index":
+                attributes[key] = torch.from_numpy(np.ascontiguousarray(values[edge_slice].T)).long()
+            elif key=="edge_attr":
+                attributes[key] = torch.from_numpy(values[edge_slice])
+            elif key=="y":
+                attributes[key] = torch.from_numpy(values[idx:idx+1])
+            else:
+                attributes[key] = torch.from_numpy(values[node_slice])
+        data = torch_geometric.data.Data(**attributes)
+        if self.transform is not None:
+            data = self.transform(data)
+        return data
@@ -0,0 +1,155 @@
+import os
+import torch
+import numpy as np
+from h5py import File as f
+from gqcml.utils.precision import get_default_dtype
+
+class HDF5Dataset(torch.utils.data.Dataset):
+    """
+    A dataset that reads its datapoints lazily from the datasets in an HDF5 file, so the data never has to be loaded
+    into memory as a whole. During sequential iteration the rows are read per block of HDF5 chunks: retrieving a
+    datapoint reads the complete chunk(s) that contain it and the following datapoints are served from this block,
+    which makes sequential iteration as fast as the chunked storage allows. A datapoint that is not the successor of
+    the previous one (e.g. with a shuffling sampler) is read on its own, shuffled data is best read per batch with
+    read_batch. The decompressed chunks are kept in the HDF5 chunk cache, which is enlarged so that random reads do not
+    decompress the same large chunk over and over.
+
+    The file is opened lazily in the process that reads from it, every DataLoader worker therefore has its own file
+    handle. A handle is never shared between processes, the dataset can be pickled to spawned workers. The file is
+    closed when the dataset is deleted.
+
+    Every datapoint is a tuple of tensors in the order of the input keys followed by the output key, equal to the
+    datapoints of the TensorDataset constructed by DataLoader_constructor. Indexing the dataset with a list of indices
+    returns the complete batch (see read_batch)
+
+    Attributes
+        :filepath (str): The filepath of the HDF5 file
+        :input_keys (list): The names of the datasets that contain the inputs
+        :output_key (str): The name of the dataset that contains the targets
+        :read_ahead (opt, int): The number of chunks that are read in addition to the chunk containing the requested
+                                datapoint
+        :chunk_size (opt, int): The number of rows in a chunk. Standardly the chunk size of the HDF5 datasets is used
+                                or 1024 rows for contiguous datasets
+        :transform (opt, callable): A function that converts a list of numpy arrays with a block of rows of the input
+                                    datasets to a list of processed input arrays, e.g. trius to node features and
+                                    adjacency matrices (see trius_to_inputs)
+        :cache_size (opt, int): The size in bytes of the HDF5 chunk cache of every dataset
+    """
+    def __init__(self, filepath, input_keys, output_key, read_ahead=0, chunk_size=None, transform=None,
+                 cache_size=64*2**20):
+        self.filepath = filepath
+        self.input_keys = [input_keys] if type(input_keys) is str else list(input_keys)
+        self.output_key = output_key
+        self.read_ahead = read_ahead
+        self.transform = transform
+        self.cache_size = cache_size
+        with f(filepath, "r") as h5_file:
+            lengths = {len(h5_file[key]) for key in self.input_keys+[output_key]}
+            if len(lengths)!=1:
+                raise ValueError("The datasets "+str(self.input_keys+[output_key])+" in "+filepath+" have different lengths")
+            self.length = lengths.pop()
+            if chunk_size is None:
+                chunks = h5_file[self.input_keys[0]].chunks
+                chunk_size = 1024 if chunks is None else chunks[0]
+        self.chunk_size = chunk_size
+        self._file = None
+        self.__reset()
+
+    def __del__(self):
+        self.__close()
+
+    def __close(self):
+        """
+        Closes the file when it was opened by the current process. A handle inherited from the parent process is only
+        dropped, the parent keeps using it
+        """
+        if getattr(self, "_file", None) is not None and self._pid==os.getpid():
+            self._file.close()
+        self._file = None
+
+    def __reset(self):
+        """
+        Closes the file and removes the dataset handles and the block of rows that was read last
+        """
+        self.__close()
+        self._datasets = None
+        self._pid = None
+        self._block_start = 0
+        self._block = None
+        self._last_idx = -1
+
+    def __getstate__(self):
+        #An open HDF5 file can not be pickled, every worker opens the file itself
+        state = self.__dict__.copy()
+        state.update({"_file":None, "_datasets":None, "_pid":None, "_block_start":0, "_block":None, "_last_idx":-1})
+        return state
+
+    def __datasets(self):
+        """
+        Returns the dataset handles of the current process, the file is (re)opened after a fork. The handles are kept
+        open because the chunk cache of a dataset is discarded when it is closed
+        """
+        if self._datasets is None or self._pid!=os.getpid():
+            self.__close()
+            self._file = f(self.filepath, "r", rdcc_nbytes=self.cache_size)
+            self._datasets = {key:self._file[key] for key in self.input_keys+[self.output_key]}
+            self._pid = os.getpid()
+            self._block = None
+        return self._datasets
+
+    def __read(self, selection):
+        """
+        Reads a selection of rows (a slice or an increasing array of indices) from all the datasets and converts them
+        to the tensors of the datapoints
+        """
+        datasets = self.__datasets()
+        inputs = [datasets[key][selection] for key in self.input_keys]
+        if self.transform is not None:
+            inputs = list(self.transform(inputs))
+        output = datasets[self.output_key][selection]
+        tensors = [torch.from_numpy(np.asarray(array)).to(get_default_dtype()) for array in inputs]
+        tensors.append(torch.from_numpy(np.asarray(output)).to(get_default_dtype()).reshape(-1,1))
+        return tensors
+
+    def read_batch(self, indices):
+        """
+        Reads a batch of datapoints at once. The rows are read in increasing order and reordered afterwards, consecutive
+        indices are read as a single slice
+
+        Arguments
+            :indices (list or np.array): The indices of the datapoints in the batch
+        Returns
+            :batch (tuple): A tuple of tensors with the batch as the leading dimension
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        unique_indices, inverse = np.unique(indices, return_inverse=True)
+        if unique_indices[-1]-unique_indices[0]+1==len(unique_indices):
+            tensors = self.__read(slice(int(unique_indices[0]), int(unique_indices[-1])+1))
+        else:
+            tensors = self.__read(unique_indices)
+        if len(unique_indices)!=len(indices) or np.any(np.diff(indices)<0):
+            inverse = torch.from_numpy(inverse.reshape(-1))
+            tensors = [tensor[inverse] for tensor in tensors]
+        return tuple(tensors)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, idx):
+        if np.ndim(idx)>0:
+            #A list of indices retrieves a complete batch (see DataLoader_constructor)
+            return self.read_batch(idx)
+        idx = int(idx)
+        if idx<0:
+            idx += self.length
+        sequential = idx==self._last_idx+1
+        self._last_idx = idx
+        if self._block is None or self._pid!=os.getpid() or not (self._block_start<=idx<self._block_start+len(self._block[-1])):
+            if not sequential:
+                #A random access only reads the requested row, reading a complete block would be wasted
+                return tuple(tensor[0] for tensor in self.__read(slice(idx, idx+1)))
+            #Read the chunk containing the datapoint and the read-ahead chunks
+            self._block_start = (idx//self.chunk_size)*self.chunk_size
+            block_end = min(self._block_start+(1+self.read_ahead)*self.chunk_size, self.length)
+            self._block = self.__read(slice(self._block_start, block_end))
+        return tuple(tensor[idx-self._block_start] for tensor in self._block)
@@ -1,5 +1,6 @@
 import torch
 import numpy as np
+from gqcml.utils.precision import get_default_dtype
 
 class GraphConv(torch.nn.Module):
     """GraphConv
@@ -92,14 +93,14 @@ class GaussianExpansion(torch.nn.Module):
     """
     def __init__(self, lower, upper, num_gaussians, variance=None):
         super(GaussianExpansion, self).__init__()
-        self.means = torch.nn.parameter.Parameter(torch.from_numpy(np.linspace(lower, upper, num_gaussians)),
+        self.means = torch.nn.parameter.Parameter(torch.from_numpy(np.linspace(lower, upper, num_gaussians)).to(get_default_dtype()),
                                                   requires_grad=False)
         if variance:
-            self.precision = torch.nn.parameter.Parameter(torch.tensor(1/(2*variance)), requires_grad=False)
+            self.precision = torch.nn.parameter.Parameter(torch.tensor(1/(2*variance), dtype=get_default_dtype()), requires_grad=False)
         else:
             diff = np.linspace(lower, upper, num_gaussians)[1]-np.linspace(lower, upper, num_gaussians)[0]
             variance = -(diff)**2/(2*np.log(0.5))
-            self.precision = torch.nn.parameter.Parameter(torch.tensor(1/(2*variance)), requires_grad=False)
+            self.precision = torch.nn.parameter.Parameter(torch.tensor(1/(2*variance), dtype=get_default_dtype()), requires_grad=False)
         self.num_gaussians = num_gaussians
         self.lower = lower
         self.upper = upper
@@ -114,7 +115,7 @@ class GaussianExpansion(torch.nn.Module):
         Returns
             :expanded tensor (torch.Tensor): A (B x N x M) tensor where M is the number of Gaussians
         """
-        return torch.exp(-1*self.precision*torch.pow(inp-self.means,2)).double()
+        return torch.exp(-1*self.precision*torch.pow(inp-self.means,2)).to(get_default_dtype())
 
     def meta(self):
         """
@@ -157,7 +158,7 @@ class GaussianEmbedding(torch.nn.Module):
     def __init__(self, lower, upper, num_gaussians, emb_dim, variance=None, emb_bias=False):
         super(GaussianEmbedding, self).__init__()
         self.GaussExp = GaussianExpansion(lower, upper, num_gaussians, variance=variance)
-        self.embedding = torch.nn.Linear(num_gaussians, emb_dim, bias=emb_bias).double()
+        self.embedding = torch.nn.Linear(num_gaussians, emb_dim, bias=emb_bias).to(get_default_dtype())
 
     def forward(self, inp):
         """
@@ -5,6 +5,7 @@ import torch
 import torch_geometric
 import h5py
 from gqcml.datasets import Datasets
+from gqcml.utils.precision import get_default_dtype
 
 def graph_to_Data(nf, am, output):
     """
@@ -16,13 +17,14 @@ def graph_to_Data(nf, am, output):
         :output (torch.Tensor): The graph property tensor associated with the graphs
     Returns
         :dp (torch_geometric.data.Data): A data object where the node features are stored in the x attribute of Data.
-                                         The adjacency matrix is split into the indices and weights and are stored in their respective attributes
+                                         The adjacency matrix is split into the indices and weights and are stored in their respective attributes.
+                                         The floating point attributes have the type of gqcml (see gqcml.utils.precision)
     """
     edge_index, edge_attr = torch_geometric.utils.dense_to_sparse(am)
-    dp = torch_geometric.data.Data(x=nf.double(),
+    dp = torch_geometric.data.Data(x=nf.to(get_default_dtype()),
                                    edge_index=edge_index.long(),
-                                   edge_attr=edge_attr.double(),
-                                   y=output.double())
+                                   edge_attr=edge_attr.to(get_default_dtype()),
+                                   y=output.to(get_default_dtype()))
     return dp
 
 def TriuDataset(dim, trius, output_values, residual=False):
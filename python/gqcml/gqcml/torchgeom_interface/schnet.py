@@ -91,7 +91,7 @@ class SchNet(torch.nn.Module):
         self.prop = gqcml.nn.models.DNN([hidden_channels, hidden_channels//2, 1], ShiftedSoftplus())
     
     def forward(self, data):
-        x, edge_idx, edge_attr, batch = data.x.long(), data.edge_index, data.edge_attr.double(), data.batch
+        x, edge_idx, edge_attr, batch = data.x.long(), data.edge_index, gqcml.utils.precision.to_default_dtype(data.edge_attr), data.batch
         edge_attr=edge_attr.view(-1,1)
         nf = self.embedding(x)
         for int in self.int_blocks:
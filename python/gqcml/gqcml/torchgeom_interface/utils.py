@@ -6,9 +6,10 @@ import torch_geometric
 import matplotlib.pyplot as plt
 import functools
 import operator
+from gqcml.utils.precision import autocast, grad_scaler, to_default_dtype
 
 def train_model(device, model, nmb_epochs, train_loader, val_loader,
-                loss_fn, optimizer, model_logger, scheduler=None, verbose=False, reduction="mean"):
+                loss_fn, optimizer, model_logger, scheduler=None, verbose=False, reduction="mean", mixed_precision=False):
   """
   A function that trains a given neural network
 
@@ -23,20 +24,26 @@ def train_model(device, model, nmb_epochs, train_loader, val_loader,
     :optimizer (torch.optim): The optimizer that is used during the training of the model
     :model_logger (gqcml.utils.train): The model logger class that registers the training progress and saves the best model
     :scheduler (opt, torch.optim.lr_scheduler): A scheduler for decreasing the learning rate
+    :mixed_precision (opt, bool): Option to compute the forward pass and the loss in mixed precision
+                                  (see gqcml.utils.precision.autocast),
+                                  which requires the float32 default type
   Returns
     :model (torch.nn.Module): The optimized model
   """
   nmb_train_dp = len(train_loader.dataset)
   nmb_val_dp = len(val_loader.dataset)
+  scaler = grad_scaler(device, enabled=mixed_precision)
   for epoch in range(1, nmb_epochs+1):
     training_loss = []
     for batch_idx, data in enumerate(train_loader):
       data = data.to(device)
       optimizer.zero_grad()
-      prediction=model(data)
-      loss = loss_fn(prediction, data.y)
-      loss.backward()
-      optimizer.step()
+      with autocast(device, enabled=mixed_precision):
+        prediction=model(data)
+        loss = loss_fn(prediction, data.y)
+      scaler.scale(loss).backward()
+      scaler.step(optimizer)
+      scaler.update()
       if reduction=="mean":
         training_loss.append(loss.item()*data.num_graphs)
       elif reduction=="sum":
@@ -44,8 +51,9 @@ def train_model(device, model, nmb_epochs, train_loader, val_loader,
     validation_loss = []
     for batch_idx, batch in enumerate(val_loader):
       data = data.to(device)
-      prediction=model(data)
-      loss = loss_fn(prediction, data.y)
+      with autocast(device, enabled=mixed_precision):
+        prediction=model(data)
+        loss = loss_fn(prediction, data.y)
       if reduction=="mean":
         validation_loss.append(loss.item()*data.num_graphs)
       elif reduction=="sum":
@@ -61,7 +69,7 @@ def train_model(device, model, nmb_epochs, train_loader, val_loader,
   return model
 
 def train_SchNet(device, model, nmb_epochs, train_loader, val_loader,
-                loss_fn, optimizer, model_logger, scheduler=None, verbose=False, reduction="mean"):
+                loss_fn, optimizer, model_logger, scheduler=None, verbose=False, reduction="mean", mixed_precision=False):
   """
   A function that trains a given neural network
 
@@ -76,20 +84,26 @@ def train_SchNet(device, model, nmb_epochs, train_loader, val_loader,
     :optimizer (torch.optim): The optimizer that is used during the training of the model
     :model_logger (gqcml.utils.train): The model logger class that registers the training progress and saves the best model
     :scheduler (opt, torch.optim.lr_scheduler): A scheduler for decreasing the learning rate
+    :mixed_precision (opt, bool): Option to compute the forward pass and the loss in mixed precision
+                                  (see gqcml.utils.precision.autocast),
+                                  which requires the float32 default type
   Returns
     :model (torch.nn.Module): The optimized model
   """
   nmb_train_dp = len(train_loader.dataset)
   nmb_val_dp = len(val_loader.dataset)
+  scaler = grad_scaler(device, enabled=mixed_precision)
   for epoch in range(1, nmb_epochs+1):
     training_loss = []
     for batch_idx, data in enumerate(train_loader):
       data = data.to(device)
       optimizer.zero_grad()
-      prediction=model(data)
-      loss = loss_fn(prediction, data.y.double())
-      loss.backward()
-      optimizer.step()
+      with autocast(device, enabled=mixed_precision):
+        prediction=model(data)
+        loss = loss_fn(prediction, to_default_dtype(data.y))
+      scaler.scale(loss).backward()
+      scaler.step(optimizer)
+      scaler.update()
       if reduction=="mean":
         training_loss.append(loss.item()*data.num_graphs)
       elif reduction=="sum":
@@ -97,8 +111,9 @@ def train_SchNet(device, model, nmb_epochs, train_loader, val_loader,
     validation_loss = []
     for batch_idx, batch in enumerate(val_loader):
       data = data.to(device)
-      prediction=model(data)
-      loss = loss_fn(prediction, data.y.double())
+      with autocast(device, enabled=mixed_precision):
+        prediction=model(data)
+        loss = loss_fn(prediction, to_default_dtype(data.y))
       if reduction=="mean":
         validation_loss.append(loss.item()*data.num_graphs)
       elif reduction=="sum":
@@ -207,7 +222,7 @@ def evaluate_SchNet(model_path, error_path, modelname, model,
       for data in loader:
         data = data
         prediction=model(data)
-        error = data.y.double()-prediction
+        error = to_default_dtype(data.y)-prediction
         errors.append(error.abs().detach().numpy().flatten())
       errors = functools.reduce(operator.iconcat, errors, [])
       print(len(errors))
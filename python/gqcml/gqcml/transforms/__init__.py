@@ -1,2 +1,3 @@
 from .adjacency import *
 from .node_feat import *
+from .permutation import *
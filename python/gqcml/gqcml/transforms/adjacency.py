@@ -18,6 +18,31 @@ def binarize(adjacency_matrices):
     binary_adj_matrices[binary_adj_matrices!=0]=1.0
     return binary_adj_matrices
 
+def inverse_sqrt_degree(adjacency_matrices, self_loops=True):
+    """
+    Compute the degrees of the vertices raised to the -1/2 as a vector. Vertices with a zero degree are given a zero
+    instead of an infinite value so they remain isolated after normalization. Dense tensors and sparse COO/CSR tensors
+    are supported and the result is computed on the device of the adjacency matrices
+
+    :param adjacency_matrices (torch.tensor): A tensor containing adjacency matrices (weighted or unweighted)
+                                              that has the dimensions (B x N x N) where B is the batch size/number of graphs
+                                              (optional dimension) and N is the number of vertices/nodes in each graph
+
+    :param self_loops (bool): Option to add self loops to the adjacency matrix, i.e. the unit matrix
+
+    :return inverse_sqrt_degrees (torch.tensor): A tensor with the dimensions (B x N) containing the degrees raised to the -1/2
+    """
+    if adjacency_matrices.is_sparse or adjacency_matrices.layout==torch.sparse_csr:
+        degrees = torch.sparse.sum(_sparse_coo(adjacency_matrices), -1).to_dense()
+    else:
+        degrees = torch.sum(adjacency_matrices, -1)
+    if self_loops is True:
+        degrees = degrees+1
+    inverse_sqrt_degrees = torch.zeros_like(degrees)
+    nonzero = degrees!=0
+    inverse_sqrt_degrees[nonzero] = torch.rsqrt(degrees[nonzero])
+    return inverse_sqrt_degrees
+
 def degree(adjacency_matrices, self_loops=True):
     """
     Compute the D^(-1/2) matrix based on the adjacency matrices given
@@ -30,16 +55,77 @@ def degree(adjacency_matrices, self_loops=True):
 
     :return degrees (torch.tensor): The diagonal degrees matrices raised to the -1/2 
     """
+    return torch.diag_embed(inverse_sqrt_degree(adjacency_matrices, self_loops=self_loops))
+
+def _sparse_coo(adjacency_matrices):
+    """
+    Converts a sparse CSR tensor to a coalesced sparse COO tensor. The non-zero elements of both formats are ordered
+    row by row, so the values of the COO tensor are in the same order as the values of the CSR tensor
+    """
+    if adjacency_matrices.layout==torch.sparse_csr:
+        adjacency_matrices = adjacency_matrices.to_sparse_coo()
+    return adjacency_matrices.coalesce()
+
+def _sparse_csr(adjacency_matrices):
+    """
+    Converts a coalesced sparse COO tensor with the dimensions (N x N) or (B x N x N) to a sparse CSR tensor. A
+    batched CSR tensor stores the same number of non-zero elements for every graph, a ValueError is raised when the
+    graphs of the stack have different numbers of non-zero elements
+    """
+    if adjacency_matrices.dim()==2:
+        return adjacency_matrices.to_sparse_csr()
+    batch_size, num_vertices = adjacency_matrices.shape[0], adjacency_matrices.shape[-1]
+    batch_indices, row_indices, column_indices = adjacency_matrices.indices()
+    nnz = torch.bincount(batch_indices, minlength=batch_size)
+    if batch_size>0 and (nnz!=nnz[0]).any():
+        raise ValueError("The graphs have "+str(nnz.tolist())+" non-zero elements, a batched sparse CSR tensor "
+                         "requires the same number for every graph. Normalize a sparse COO tensor instead")
+    #Stack the rows of all graphs in a single matrix, the row pointers of the graphs are slices of its row pointers
+    stacked_matrix = torch.sparse_coo_tensor(torch.stack([batch_indices*num_vertices+row_indices, column_indices]),
+                                             adjacency_matrices.values(), (batch_size*num_vertices, num_vertices))
+    row_pointers = stacked_matrix.coalesce().to_sparse_csr().crow_indices()
+    pointer_indices = torch.arange(batch_size, device=row_pointers.device).unsqueeze(-1)*num_vertices+\
+                      torch.arange(num_vertices+1, device=row_pointers.device)
+    row_pointers = row_pointers[pointer_indices]-row_pointers[pointer_indices[:, :1]]
+    return torch.sparse_csr_tensor(row_pointers, column_indices.view(batch_size, -1),
+                                   adjacency_matrices.values().view(batch_size, -1), adjacency_matrices.shape)
+
+def _sparse_identity(adjacency_matrices):
+    """
+    Constructs a sparse COO tensor containing a unit matrix for every graph in the sparse stack of adjacency matrices
+    """
+    ones = torch.ones(adjacency_matrices.shape[:-1], dtype=adjacency_matrices.dtype, device=adjacency_matrices.device)
+    indices = ones.nonzero().T
+    indices = torch.cat([indices, indices[-1:]], 0)
+    return torch.sparse_coo_tensor(indices, ones.flatten(), adjacency_matrices.shape)
+
+def _normalize_sparse(adjacency_matrices, self_loops=True, inplace=False):
+    """
+    Normalizes a sparse COO or CSR stack of adjacency matrices by scaling the non-zero values
+    """
+    layout = adjacency_matrices.layout
+    coo_matrices = _sparse_coo(adjacency_matrices)
     if self_loops is True:
-        degrees = torch.sum(adjacency_matrices+torch.eye(adjacency_matrices.shape[-1]),
-                            len(adjacency_matrices.shape)-1)
-    else:
-        degrees = torch.sum(adjacency_matrices,len(adjacency_matrices.shape)-1)
-    degrees = (1/torch.sqrt(degrees)).view(adjacency_matrices.shape[0], -1, 1)
-    degrees = torch.mul(degrees, torch.eye(adjacency_matrices.shape[-1]))
-    return degrees
+        if inplace:
+            raise ValueError("Self loops change the sparsity pattern, a sparse tensor can not be normalized in place with self_loops=True")
+        coo_matrices = (coo_matrices+_sparse_identity(coo_matrices)).coalesce()
+    inverse_sqrt_degrees = inverse_sqrt_degree(coo_matrices, self_loops=False)
+    indices = coo_matrices.indices()
+    scaling = inverse_sqrt_degrees[tuple(indices[:-1])]*inverse_sqrt_degrees[tuple(indices[:-2])+(indices[-1],)]
+    if inplace:
+        if layout==torch.sparse_csr:
+            adjacency_matrices.values().mul_(scaling.view(adjacency_matrices.values().shape))
+        else:
+            if not adjacency_matrices.is_coalesced():
+                raise ValueError("Only a coalesced sparse COO tensor can be normalized in place")
+            adjacency_matrices.values().mul_(scaling)
+        return adjacency_matrices
+    normalized = torch.sparse_coo_tensor(indices, coo_matrices.values()*scaling, coo_matrices.shape).coalesce()
+    if layout==torch.sparse_csr:
+        return _sparse_csr(normalized)
+    return normalized
 
-def normalize(adjacency_matrices, self_loops=True):
+def normalize(adjacency_matrices, self_loops=True, inplace=False):
     """
     Normalizes the adjacency matrices based on the formulas presented in 
     
@@ -56,20 +142,92 @@ def normalize(adjacency_matrices, self_loops=True):
     Where A_ij is 1 when there exists an edge between vertex i and j, e_ij is the edge weight (1 if unweighted) and 
     d_i is the degree for vertex i.
 
+    The degree matrices are never constructed, the elements are scaled with the outer product of the vectors d^(-1/2)
+    instead. Sparse COO and CSR tensors are normalized by scaling their non-zero values.
+
     :param adjacency_matrix (torch.tensor): A tensor containing adjacency matrices (weighted or unweighted)
                                             that has the dimensions (B x N x N) where B is the batch size/number of graphs
                                             and N is the number of vertices/nodes in each graph
     :param (opt) residual (bool): Option to add self loops to the adjacency matrix resulting in the +1 term in Ã_ii and Ã_ij.
+    :param (opt) inplace (bool): Option to overwrite the given adjacency matrices instead of allocating new ones.
+                                 Sparse tensors can only be normalized in place without self loops
+
+    A batched sparse CSR tensor has the same number of non-zero elements for every graph. When the added self loops
+    give the graphs different numbers of non-zero elements a ValueError is raised
 
     :return adjacency_matrix (torch.tensor): A tensor containing the normalized adjacency matrices
     """
-    
-    degree_tensor = degree(adjacency_matrices, self_loops=self_loops)
+    if adjacency_matrices.is_sparse or adjacency_matrices.layout==torch.sparse_csr:
+        return _normalize_sparse(adjacency_matrices, self_loops=self_loops, inplace=inplace)
     if self_loops is True:
-        #Matrix multiplication D^(-1/2).(A+I).D^(-1/2)
-        return torch.matmul(degree_tensor,
-                            torch.matmul(adjacency_matrices+torch.eye(adjacency_matrices.shape[-1]), degree_tensor))
-    else:
-        #D^(-1/2).(A).D^(-1/2)
-        return torch.matmul(degree_tensor,torch.matmul(adjacency_matrices, degree_tensor))
-                            
+        if not inplace:
+            adjacency_matrices = adjacency_matrices.clone()
+        adjacency_matrices.diagonal(dim1=-2, dim2=-1).add_(1)
+        inplace = True
+    inverse_sqrt_degrees = inverse_sqrt_degree(adjacency_matrices, self_loops=False)
+    scaling = inverse_sqrt_degrees.unsqueeze(-1)*inverse_sqrt_degrees.unsqueeze(-2)
+    if inplace:
+        return adjacency_matrices.mul_(scaling)
+    return adjacency_matrices*scaling
+
+class NormalizeAdjacency():
+    """
+    A transform that normalizes the graphs in a dataset (see normalize), which moves the normalization from the
+    training step to the data loading. The transform can be passed as the transform of a torch_geometric dataset
+    or applied to the batches of a loader.
+
+    When the adjacency attribute is given the (dense or sparse) adjacency matrices stored under this attribute are
+    normalized. Otherwise the scalar edge weights stored under the edge_weight attribute are normalized, the missing
+    self loops are appended to the edges when self_loops is True. Standardly the edge weights are the edge_attr, which
+    the gqcml models use as edge weights. Graphs with edge features (e.g. the QM9 distances) should use a separate
+    attribute, e.g. edge_weight="edge_weight", which is initialized with ones when it is absent. The edge features of
+    the appended self loops are zero
+
+    Attributes
+        :self_loops (opt, bool): Option to add self loops to the adjacency matrices
+        :adjacency (opt, str): The attribute containing the adjacency matrices. Standardly the edges are normalized
+        :edge_weight (opt, str): The attribute containing the scalar edge weights, a tensor of shape (E) or (E x 1)
+    """
+    def __init__(self, self_loops=True, adjacency=None, edge_weight="edge_attr"):
+        self.self_loops = self_loops
+        self.adjacency = adjacency
+        self.edge_weight = edge_weight
+
+    def __call__(self, data):
+        if self.adjacency is not None:
+            data[self.adjacency] = normalize(data[self.adjacency], self_loops=self.self_loops)
+            return data
+        edge_index = data.edge_index
+        edge_weight = data[self.edge_weight] if self.edge_weight in data else None
+        if edge_weight is None:
+            edge_weight = torch.ones(edge_index.shape[1], device=edge_index.device)
+        shape = edge_weight.shape
+        if edge_weight.dim()>2 or (edge_weight.dim()==2 and shape[1]!=1) or edge_weight.numel()!=edge_index.shape[1]:
+            raise ValueError("The "+self.edge_weight+" attribute should contain a scalar weight per edge, received a "
+                             "tensor of shape "+str(tuple(shape))+" for "+str(edge_index.shape[1])+" edges. Store the "
+                             "edge weights in a separate attribute (see the edge_weight option)")
+        edge_weight = edge_weight.view(-1)
+        if self.self_loops is True:
+            vertices = torch.arange(data.num_nodes, device=edge_index.device)
+            has_loop = torch.zeros(data.num_nodes, dtype=torch.bool, device=edge_index.device)
+            has_loop[edge_index[0][edge_index[0]==edge_index[1]]] = True
+            edge_weight = edge_weight.clone()
+            edge_weight[edge_index[0]==edge_index[1]] += 1
+            missing = vertices[~has_loop]
+            edge_index = torch.cat([edge_index, missing.repeat(2, 1)], 1)
+            edge_weight = torch.cat([edge_weight, torch.ones(len(missing), dtype=edge_weight.dtype, device=edge_weight.device)])
+            if self.edge_weight!="edge_attr" and data.edge_attr is not None:
+                data.edge_attr = torch.cat([data.edge_attr, data.edge_attr.new_zeros((len(missing),)+data.edge_attr.shape[1:])])
+        degrees = torch.zeros(data.num_nodes, dtype=edge_weight.dtype, device=edge_weight.device)
+        degrees.index_add_(0, edge_index[0], edge_weight)
+        inverse_sqrt_degrees = torch.zeros_like(degrees)
+        nonzero = degrees!=0
+        inverse_sqrt_degrees[nonzero] = torch.rsqrt(degrees[nonzero])
+        edge_weight = inverse_sqrt_degrees[edge_index[0]]*edge_weight*inverse_sqrt_degrees[edge_index[1]]
+        data.edge_index = edge_index
+        data[self.edge_weight] = edge_weight.view(-1, *shape[1:])
+        return data
+
+    def __repr__(self):
+        return "{}(self_loops={}, adjacency={}, edge_weight={})".format(self.__class__.__name__, self.self_loops,
+                                                                        self.adjacency, self.edge_weight)
@@ -0,0 +1,52 @@
+import torch
+
+def permute(node_features, adjacency_matrices, permutations):
+    """
+    Reorders the vertices of a (stack of) graph(s). The rows of the node features and the rows and columns of
+    the adjacency matrices are reordered in the same way, so the permuted graphs describe the same systems
+
+    :param node_features (torch.tensor): A tensor with the dimensions (B x N x F) where B is the batch size/number of graphs
+                                         (optional dimension), N the number of vertices and F the number of node features
+
+    :param adjacency_matrices (torch.tensor): A tensor with the dimensions (B x N x N) containing the adjacency matrices
+
+    :param permutations (torch.tensor): A tensor with the dimensions (B x N) containing the new order of the vertices of each graph
+
+    :return node_features, adjacency_matrices (tuple): The permuted node features and adjacency matrices
+    """
+    permutations = permutations.to(adjacency_matrices.device).long()
+    node_features = torch.gather(node_features, -2,
+                                 permutations.unsqueeze(-1).expand(node_features.shape))
+    adjacency_matrices = torch.gather(adjacency_matrices, -2,
+                                      permutations.unsqueeze(-1).expand(adjacency_matrices.shape))
+    adjacency_matrices = torch.gather(adjacency_matrices, -1,
+                                      permutations.unsqueeze(-2).expand(adjacency_matrices.shape))
+    return node_features, adjacency_matrices
+
+class RandomPermutation(torch.utils.data.Dataset):
+    """
+    A dataset wrapper that reorders the vertices of every graph randomly each time it is retrieved. The augmentation
+    is as such performed on the fly, e.g. in the DataLoader workers, and the permuted graphs never have to be stored.
+    The random orderings are drawn from the torch random number generator, which the DataLoader seeds for every worker
+
+    Attributes
+        :dataset (torch.utils.data.Dataset): The dataset that returns tuples of tensors, e.g. a TensorDataset
+                                             constructed by DataLoader_constructor
+        :node_feature_idx (opt, int): The position of the (N x F) node features in the tuple
+        :adjacency_idx (opt, int): The position of the (N x N) adjacency matrix in the tuple
+    """
+    def __init__(self, dataset, node_feature_idx=0, adjacency_idx=1):
+        self.dataset = dataset
+        self.node_feature_idx = node_feature_idx
+        self.adjacency_idx = adjacency_idx
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        datapoint = list(self.dataset[idx])
+        adjacency_matrix = datapoint[self.adjacency_idx]
+        permutation = torch.randperm(adjacency_matrix.shape[-1])
+        datapoint[self.node_feature_idx], datapoint[self.adjacency_idx] = permute(datapoint[self.node_feature_idx],
+                                                                                  adjacency_matrix, permutation)
+        return tuple(datapoint)
@@ -1,2 +1,4 @@
 from .train import *
 from .test import *
+from .precision import *
+from .parallel import *
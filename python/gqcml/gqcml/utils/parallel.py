@@ -0,0 +1,26 @@
+import collections
+
+__all__ = ["imap_bounded"]
+
+def imap_bounded(pool, function, tasks, max_pending):
+    """
+    Applies a function to the tasks in a process pool and yields the results in the order of the tasks. At most
+    max_pending tasks are in flight: a new task is only drawn from the tasks when the oldest result has been retrieved.
+    A lazy iterable of tasks is as such read at the pace of the workers and the finished results do not pile up in
+    memory while they are being written, unlike Pool.imap, which submits all the tasks at once
+
+    Arguments
+        :pool (multiprocessing.Pool): The pool of worker processes
+        :function (callable): The function that is applied to every task, the task is its only argument
+        :tasks (iterable): The tasks, e.g. a generator of batches
+        :max_pending (int): The maximum number of tasks that are submitted but whose results have not been yielded
+    Returns
+        :results (generator): A generator that yields the results of the tasks in order
+    """
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(pool.apply_async(function, (task,)))
+        if len(pending)>=max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
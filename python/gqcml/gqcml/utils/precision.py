@@ -0,0 +1,100 @@
+import torch
+
+__all__ = ["set_default_dtype", "get_default_dtype", "to_default_dtype", "autocast_dtype", "autocast", "grad_scaler"]
+
+_dtypes = {"float64":torch.float64, "double":torch.float64,
+           "float32":torch.float32, "float":torch.float32,
+           "bfloat16":torch.bfloat16, "float16":torch.float16, "half":torch.float16}
+_default_dtype = torch.float64
+
+def set_default_dtype(dtype, torch_default=True):
+    """
+    Sets the floating point type used throughout gqcml. The data loaders, the torch_geometric interface and the layers
+    that fix their precision convert their tensors and parameters to this type. Standardly gqcml works in float64
+
+    Arguments
+        :dtype (torch.dtype or str): The floating point type, e.g. torch.float32 or "float32"
+        :torch_default (opt, bool): Option to set the default floating point type of torch as well, so that the
+                                    parameters of the layers created afterwards have the same type
+    Returns
+        :None: The policy is set for the complete package
+    """
+    global _default_dtype
+    if type(dtype) is str:
+        if dtype not in _dtypes:
+            raise ValueError("Unknown floating point type "+dtype+", choose from "+str(list(_dtypes)))
+        dtype = _dtypes[dtype]
+    if not dtype.is_floating_point:
+        raise ValueError("The default type should be a floating point type, received "+str(dtype))
+    _default_dtype = dtype
+    if torch_default:
+        torch.set_default_dtype(dtype)
+
+def get_default_dtype():
+    """
+    Returns the floating point type used throughout gqcml (see set_default_dtype)
+    """
+    return _default_dtype
+
+def to_default_dtype(tensor):
+    """
+    Converts a tensor to the floating point type used throughout gqcml, a tensor that already has this type is
+    returned without copying
+    """
+    return tensor.to(_default_dtype)
+
+def _check_mixed_precision(enabled):
+    """
+    Raises a ValueError when mixed precision is requested while the default type is float64. Autocasting only reduces
+    the precision of float32 operations, in float64 it would silently have no effect
+    """
+    if enabled and _default_dtype==torch.float64:
+        raise ValueError("Mixed precision has no effect when the default type is float64, set the default type to "
+                         "float32 first (see set_default_dtype)")
+
+def autocast_dtype(device):
+    """
+    Returns the reduced precision type used in mixed precision training on a device: bfloat16 on the CPU and float16
+    on the GPU
+
+    Arguments
+        :device (str or torch.device): The device on which the model is trained
+    Returns
+        :dtype (torch.dtype): The reduced precision floating point type
+    """
+    device_type = torch.device(device).type
+    return torch.float16 if device_type=="cuda" else torch.bfloat16
+
+def autocast(device, enabled=True):
+    """
+    Returns the context in which the forward pass and the loss are computed in mixed precision. The operations that
+    benefit from a reduced precision (e.g. matrix multiplications) are performed in autocast_dtype(device), while the
+    parameters and the accumulation remain in the default type. Mixed precision requires the float32 default type,
+    a ValueError is raised when it is requested in float64
+
+    Arguments
+        :device (str or torch.device): The device on which the model is trained
+        :enabled (opt, bool): Option to enable the mixed precision, when False the context has no effect
+    Returns
+        :context (torch.autocast): The autocast context manager
+    """
+    _check_mixed_precision(enabled)
+    return torch.autocast(torch.device(device).type, dtype=autocast_dtype(device), enabled=enabled)
+
+def grad_scaler(device, enabled=True):
+    """
+    Returns the gradient scaler that accompanies the autocast context. The scaler prevents the underflow of the
+    float16 gradients on the GPU, with bfloat16 on the CPU no scaling is required and the scaler is disabled
+
+    Arguments
+        :device (str or torch.device): The device on which the model is trained
+        :enabled (opt, bool): Option to enable the mixed precision, which requires the float32 default type
+    Returns
+        :scaler (torch.amp.GradScaler): The gradient scaler, which passes the loss and the optimizer step through
+                                        unchanged when it is disabled
+    """
+    _check_mixed_precision(enabled)
+    enabled = enabled and autocast_dtype(device)==torch.float16
+    if hasattr(torch, "amp") and hasattr(torch.amp, "GradScaler"):
+        return torch.amp.GradScaler(torch.device(device).type, enabled=enabled)
+    return torch.cuda.amp.GradScaler(enabled=enabled)
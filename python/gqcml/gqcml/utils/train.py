@@ -2,6 +2,7 @@ import os
 import torch
 import numpy as np
 import random
+from gqcml.utils.precision import autocast, grad_scaler
 
 def random_seed(seed_value, use_cuda):
   """random seed
@@ -117,7 +118,7 @@ class model_logger():
     return history_dict
     
 def train_model(device, model, nmb_epochs, train_loader, val_loader,
-                loss_fn, optimizer, model_logger, scheduler=None, verbose=False):
+                loss_fn, optimizer, model_logger, scheduler=None, verbose=False, mixed_precision=False):
   """train model
 
   A function that trains a given neural network
@@ -142,24 +143,32 @@ def train_model(device, model, nmb_epochs, train_loader, val_loader,
       :param model_logger (gqcml.utils.train): The model logger class that registers the training progress and saves the best model
 
       :param (optional) scheduler (torch.optim.lr_scheduler): A scheduler for decreasing the learning rate
+
+      :param (optional) mixed_precision (bool): Option to compute the forward pass and the loss in mixed precision
+                                                (see gqcml.utils.precision.autocast), which requires the float32
+                                                default type
   """
   nmb_train_dp = len(train_loader.dataset)
   nmb_val_dp = len(val_loader.dataset)
+  scaler = grad_scaler(device, enabled=mixed_precision)
   for epoch in range(1, nmb_epochs+1):
     training_loss = []
     for batch_idx, batch in enumerate(train_loader):
       batch = [tensor_stack.to(device) for tensor_stack in batch]
       optimizer.zero_grad()
-      prediction=model(*batch[:-1])
-      loss = loss_fn(prediction, batch[-1])
-      loss.backward()
-      optimizer.step()
+      with autocast(device, enabled=mixed_precision):
+        prediction=model(*batch[:-1])
+        loss = loss_fn(prediction, batch[-1])
+      scaler.scale(loss).backward()
+      scaler.step(optimizer)
+      scaler.update()
       training_loss.append(loss.item()*batch[0].shape[0])
     validation_loss = []
     for batch_idx, batch in enumerate(val_loader):
       batch = [tensor_stack.to(device) for tensor_stack in batch]
-      prediction=model(*batch[:-1])
-      loss = loss_fn(prediction, batch[-1])
+      with autocast(device, enabled=mixed_precision):
+        prediction=model(*batch[:-1])
+        loss = loss_fn(prediction, batch[-1])
       validation_loss.append(loss.item()*batch[0].shape[0])
       if scheduler:
         scheduler.step(sum(validation_loss)/nmb_val_dp)
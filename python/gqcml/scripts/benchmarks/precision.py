@@ -0,0 +1,93 @@
+import sys
+sys.path.append("../..")
+
+import time
+import argparse
+import tempfile
+import torch
+import numpy as np
+import gqcml
+
+class GraphConvNet(torch.nn.Module):
+    """
+    A small graph convolution network that predicts the energy of a Hückel system from its node features and
+    adjacency matrix
+    """
+    def __init__(self, num_features, hidden_dim, num_convs):
+        super(GraphConvNet, self).__init__()
+        self.embedding = torch.nn.Linear(num_features, hidden_dim)
+        self.convs = torch.nn.ModuleList([gqcml.nn.layers.GraphConv(hidden_dim, hidden_dim, torch.nn.ReLU())
+                                          for _ in range(num_convs)])
+        self.node_prop = gqcml.nn.models.DNN([hidden_dim, hidden_dim, 1], torch.nn.ReLU())
+
+    def forward(self, node_feat, adj_matrix):
+        node_emb = self.embedding(node_feat)
+        for conv in self.convs:
+            node_emb = conv(node_emb, adj_matrix)
+        return torch.sum(self.node_prop(node_emb), 1)
+
+def huckel_data(sites, amount_samples, seed):
+    """
+    Samples cyclic Hückel systems at half filling and converts them to node features and adjacency matrices
+    """
+    np.random.seed(seed)
+    triu_vector = gqcml.data.Data.Preprocessor(sites).matrices_to_trius(np.eye(sites)+np.roll(np.eye(sites), 1, 0)+np.roll(np.eye(sites), -1, 0))
+    trius = gqcml.data_generators.graph_sampler(sites).sample_homogeneous_matrix(triu_vector, amount_samples)
+    preprocessor = gqcml.data.Data.Preprocessor(sites)
+    solver = gqcml.data_generators.HuckelSolver()
+    solver.solve_ndo(preprocessor.trius_to_matrices(trius))
+    energies = solver.compute_energy(sites//2, sites//2)
+    node_features, adjacency_matrices = gqcml.datasets.Datasets.trius_to_inputs(trius, preprocessor, [None, True, True],
+                                                                                preprocessor.vdegree_weighted_nf,
+                                                                                [True, "linear combination"])
+    return node_features, adjacency_matrices, energies
+
+def benchmark(dtype, mixed_precision, data, args):
+    """
+    Trains the network in a precision mode and returns the training throughput and the test error
+    """
+    gqcml.utils.precision.set_default_dtype(dtype)
+    gqcml.utils.train.random_seed(args.seed, False)
+    node_features, adjacency_matrices, energies = data
+    train_size = int(0.8*len(energies))
+    train_loader = gqcml.datasets.Datasets.DataLoader_constructor([node_features[:train_size], adjacency_matrices[:train_size]],
+                                                                  energies[:train_size], args.batch_size, batch_fetch=True)
+    test_loader = gqcml.datasets.Datasets.DataLoader_constructor([node_features[train_size:], adjacency_matrices[train_size:]],
+                                                                 energies[train_size:], args.batch_size, shuffle=False, batch_fetch=True)
+    model = GraphConvNet(node_features.shape[-1], args.hidden_dim, args.num_convs).to(args.device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    with tempfile.TemporaryDirectory() as log_dir:
+        logger = gqcml.utils.train.model_logger(log_dir, log_dir, "benchmark", "MSELoss")
+        start = time.perf_counter()
+        gqcml.utils.train.train_model(args.device, model, args.epochs, train_loader, test_loader,
+                                      torch.nn.MSELoss(), optimizer, logger, mixed_precision=mixed_precision)
+        elapsed = time.perf_counter()-start
+        logger.metrics_file.close()
+    #The test error is always evaluated in full precision
+    errors = []
+    with torch.no_grad():
+        for node_feat, adj_matrix, energy in test_loader:
+            prediction = model.double()(node_feat.double().to(args.device), adj_matrix.double().to(args.device))
+            errors.append((prediction-energy.double().to(args.device)).abs().cpu().numpy())
+    #Every epoch passes the training samples forward and backward and the test samples forward
+    throughput = args.epochs*len(energies)/elapsed
+    return throughput, np.mean(np.concatenate(errors))
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Training throughput and accuracy of gqcml in different floating point precisions")
+    parser.add_argument("--sites", type=int, default=6)
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--hidden-dim", type=int, default=64)
+    parser.add_argument("--num-convs", type=int, default=3)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    data = huckel_data(args.sites, args.samples, args.seed)
+    modes = [("float64", False), ("float32", False), ("float32", True)]
+    print("{:<10}{:<18}{:>16}{:>14}".format("dtype", "mixed precision", "samples/s", "test MAE"))
+    for dtype, mixed_precision in modes:
+        throughput, mae = benchmark(dtype, mixed_precision, data, args)
+        print("{:<10}{:<18}{:>16.0f}{:>14.5f}".format(dtype, str(mixed_precision), throughput, mae))
+    gqcml.utils.precision.set_default_dtype("float64")
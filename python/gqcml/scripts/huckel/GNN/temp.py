@@ -18,7 +18,8 @@ preprocessor_func=preprocessor.vdegree_weighted_nf
 opt_arg=[True, "linear combination"]
 diagonal_format=[]
 train_nf, train_am = gqcml.datasets.Datasets.trius_to_inputs(train_input, preprocessor,
-                                              diagonal_format, preprocessor_func, opt_arg)
+                                              diagonal_format, preprocessor_func, opt_arg,
+                                              cache_dir=os.path.join(data_dir, "cache"))
 train_nf, train_am = torch.from_numpy(train_nf), torch.from_numpy(train_am)
 datapoints = []
 for nf, am, e in zip(train_nf, train_am, train_output):
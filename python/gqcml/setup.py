@@ -33,4 +33,5 @@ setup(
     extras_require={'test': tests_require},
     packages=find_packages(),
     include_package_data=True,
+    entry_points={'console_scripts': ['gqcml=gqcml.cli:main']},
 )
\ No newline at end of file
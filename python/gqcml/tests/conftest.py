@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+def ring_matrix(sites, chord=False):
+    """
+    The binary adjacency matrix of a ring including the self loops. The optional chord connects the vertices 0 and
+    sites//2, which gives these two vertices a degree of 3
+    """
+    matrix = np.eye(sites)
+    vertices = np.arange(sites)
+    matrix[vertices, (vertices+1)%sites] = matrix[(vertices+1)%sites, vertices] = 1
+    if chord:
+        matrix[0, sites//2] = matrix[sites//2, 0] = 1
+    return matrix
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+@pytest.fixture
+def ring():
+    """
+    A factory of ring matrices, see ring_matrix
+    """
+    return ring_matrix
+
+@pytest.fixture
+def hamiltonians(rng):
+    """
+    A stack of 60 random symmetric (6 x 6) Hamiltonians, including a complete graph, a ring and integer valued systems
+    that have degenerate orbitals
+    """
+    H = rng.uniform(-5, 0, (60, 6, 6))
+    H = 0.5*(H+np.swapaxes(H, 1, 2))
+    H[0] = -(np.ones((6, 6))-np.eye(6))
+    H[1] = -(ring_matrix(6)-np.eye(6))
+    integer_H = rng.integers(-2, 1, (20, 6, 6))
+    H[2:22] = integer_H+np.swapaxes(integer_H, 1, 2)
+    return H
+
+@pytest.fixture
+def weighted_graphs(rng):
+    """
+    A factory of stacks of random symmetric weights on a ring of 6 vertices with a chord, so that the vertices have a
+    degree of 2 or 3. The weights are negative unless positive is given
+    """
+    def sample(amount_samples=40, positive=False):
+        weights = rng.uniform(-5, -0.001, (amount_samples, 6, 6))
+        weights = ring_matrix(6, chord=True)*0.5*(weights+np.swapaxes(weights, 1, 2))
+        return np.abs(weights) if positive else weights
+    return sample
@@ -0,0 +1,91 @@
+import torch
+import pytest
+from torch_geometric.data import Data
+from torch_geometric.utils import dense_to_sparse, to_dense_adj
+from gqcml.transforms import normalize, NormalizeAdjacency
+
+def reference_normalize(adjacency_matrices, self_loops=True):
+    """
+    The normalization as it was computed with the matrix products D^(-1/2).(A+I).D^(-1/2)
+    """
+    eye = torch.eye(adjacency_matrices.shape[-1], dtype=adjacency_matrices.dtype)
+    if self_loops is True:
+        adjacency_matrices = adjacency_matrices+eye
+    degree_matrices = torch.diag_embed(1/torch.sqrt(torch.sum(adjacency_matrices, -1)))
+    return torch.matmul(degree_matrices, torch.matmul(adjacency_matrices, degree_matrices))
+
+@pytest.fixture
+def adjacency_matrices(weighted_graphs):
+    """
+    A stack of positively weighted adjacency matrices that share their sparsity pattern and self loops
+    """
+    return torch.tensor(weighted_graphs(4, positive=True))
+
+@pytest.mark.parametrize("self_loops", [True, False])
+def test_normalize_dense(adjacency_matrices, self_loops):
+    reference = reference_normalize(adjacency_matrices, self_loops)
+    assert torch.allclose(normalize(adjacency_matrices, self_loops), reference)
+    assert torch.allclose(normalize(adjacency_matrices[0], self_loops), reference[0])
+    inplace = adjacency_matrices.clone()
+    normalized = normalize(inplace, self_loops, inplace=True)
+    assert normalized.data_ptr()==inplace.data_ptr()
+    assert torch.allclose(normalized, reference)
+
+def to_layout(adjacency_matrices, layout):
+    return adjacency_matrices.to_sparse().coalesce() if layout=="coo" else adjacency_matrices.to_sparse_csr()
+
+@pytest.mark.parametrize("self_loops", [True, False])
+@pytest.mark.parametrize("layout", ["coo", "csr"])
+def test_normalize_sparse(adjacency_matrices, self_loops, layout):
+    reference = reference_normalize(adjacency_matrices, self_loops)
+    normalized = normalize(to_layout(adjacency_matrices, layout), self_loops)
+    assert normalized.layout==to_layout(adjacency_matrices, layout).layout
+    assert torch.allclose(normalized.to_dense(), reference)
+    assert torch.allclose(normalize(to_layout(adjacency_matrices[0], layout), self_loops).to_dense(), reference[0])
+
+@pytest.mark.parametrize("layout", ["coo", "csr"])
+def test_normalize_sparse_self_loops(layout):
+    #Both graphs have 6 non-zero elements, the first graph lacks all four self loops and the second graph two of them,
+    #which gives them 10 and 8 non-zero elements after adding the self loops
+    adjacency_matrices = torch.zeros(2, 4, 4, dtype=torch.float64)
+    adjacency_matrices[0, [0, 1, 2], [1, 2, 3]] = adjacency_matrices[0, [1, 2, 3], [0, 1, 2]] = 1
+    adjacency_matrices[1, [0, 1, 0, 1], [0, 1, 1, 0]] = 1
+    adjacency_matrices[1, [2, 3], [3, 2]] = 2
+    sparse_matrices = to_layout(adjacency_matrices, layout)
+    if layout=="csr":
+        with pytest.raises(ValueError):
+            normalize(sparse_matrices)
+    else:
+        assert torch.allclose(normalize(sparse_matrices).to_dense(), reference_normalize(adjacency_matrices))
+    assert torch.allclose(normalize(sparse_matrices, self_loops=False).to_dense(),
+                          reference_normalize(adjacency_matrices, self_loops=False))
+
+@pytest.mark.parametrize("layout", ["coo", "csr"])
+def test_normalize_sparse_inplace(adjacency_matrices, layout):
+    sparse_matrices = to_layout(adjacency_matrices, layout)
+    normalize(sparse_matrices, self_loops=False, inplace=True)
+    assert torch.allclose(sparse_matrices.to_dense(), reference_normalize(adjacency_matrices, False))
+    with pytest.raises(ValueError):
+        normalize(sparse_matrices, self_loops=True, inplace=True)
+
+def test_normalize_isolated_vertex():
+    adjacency_matrix = torch.zeros(1, 3, 3)
+    adjacency_matrix[0, 0, 1] = adjacency_matrix[0, 1, 0] = 1
+    normalized = normalize(adjacency_matrix, self_loops=False)
+    assert torch.isfinite(normalized).all()
+    assert torch.equal(normalized[0, 2], torch.zeros(3))
+
+@pytest.mark.parametrize("self_loops", [True, False])
+def test_normalize_adjacency_transform(adjacency_matrices, self_loops):
+    #Only the second vertex keeps its self loop
+    adjacency_matrix = adjacency_matrices[0]*(1-torch.eye(6, dtype=torch.float64))
+    adjacency_matrix[1, 1] = 2
+    edge_index, edge_weight = dense_to_sparse(adjacency_matrix)
+    edge_attr = torch.rand(len(edge_weight), 3)
+    data = Data(x=torch.zeros(6, 1), edge_index=edge_index, edge_attr=edge_attr, edge_weight=edge_weight)
+    data = NormalizeAdjacency(self_loops, edge_weight="edge_weight")(data)
+    dense = to_dense_adj(data.edge_index, edge_attr=data.edge_weight, max_num_nodes=6)
+    assert torch.allclose(dense, reference_normalize(adjacency_matrix.unsqueeze(0), self_loops))
+    #The edge features of the appended self loops are zero
+    assert torch.equal(data.edge_attr[:len(edge_attr)], edge_attr)
+    assert not data.edge_attr[len(edge_attr):].any()
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+import torch
+import torch_geometric
+from h5py import File as f
+from gqcml.datasets import append_graphs, CollatedGraphDataset
+
+@pytest.fixture
+def graphs(rng):
+    """
+    Molecule-like graphs of different sizes with node features, positions, edge features and a scalar target
+    """
+    graphs = []
+    for num_nodes in rng.integers(1, 8, 12):
+        edge_index = np.array([[i, j] for i in range(num_nodes) for j in range(num_nodes) if i!=j]).reshape(-1, 2).T
+        graphs.append(torch_geometric.data.Data(x=torch.tensor(rng.uniform(size=(num_nodes, 3))),
+                                                pos=torch.tensor(rng.uniform(size=(num_nodes, 3))),
+                                                edge_index=torch.tensor(edge_index),
+                                                edge_attr=torch.tensor(rng.uniform(size=(edge_index.shape[1], 2))),
+                                                y=torch.tensor(rng.uniform(size=(1, 4)))))
+    return graphs
+
+def test_append_graphs(tmp_path, graphs):
+    filepath = str(tmp_path/"graphs.h5")
+    with f(filepath, "w") as h5_file:
+        assert append_graphs(h5_file, [])==0
+        assert append_graphs(h5_file, graphs[:5])==5
+        assert append_graphs(h5_file, graphs[5:])==12
+        assert append_graphs(h5_file, [])==12
+        assert h5_file["edge_index"].shape==(sum(graph.num_edges for graph in graphs), 2)
+    dataset = CollatedGraphDataset(filepath)
+    assert len(dataset)==12
+    for idx, graph in enumerate(graphs):
+        for stored in [dataset[idx], dataset[idx-12]]:
+            assert sorted(stored.keys())==sorted(graph.keys())
+            for key in graph.keys():
+                assert torch.equal(stored[key], graph[key])
+    #The graphs are batched like a list of Data objects
+    loader = torch_geometric.loader.DataLoader(torch.utils.data.Subset(dataset, [3, 0, 7]), batch_size=3)
+    batch = next(iter(loader))
+    reference = torch_geometric.data.Batch.from_data_list([graphs[3], graphs[0], graphs[7]])
+    for key in ["x", "edge_index", "edge_attr", "y", "batch"]:
+        assert torch.equal(batch[key], reference[key])
+
+def test_scalar_targets(tmp_path, graphs):
+    #A target without a leading dimension is stored as a target of one graph
+    filepath = str(tmp_path/"graphs.h5")
+    with f(filepath, "w") as h5_file:
+        append_graphs(h5_file, [{"x":graph.x.numpy(), "y":float(idx)} for idx, graph in enumerate(graphs)])
+    dataset = CollatedGraphDataset(filepath, transform=lambda data: data.x.shape)
+    assert [dataset[idx] for idx in range(12)]==[graph.x.shape for graph in graphs]
+    assert torch.equal(CollatedGraphDataset(filepath)[4].y, torch.tensor([4.], dtype=torch.float64))
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from h5py import File as f
+from sklearn.model_selection import train_test_split
+from gqcml.data import Preprocessor
+from gqcml.datasets import Datasets, bin_values, feature_cache_key, split_dataset, split_indices, trius_to_inputs
+
+@pytest.fixture
+def trius(weighted_graphs):
+    return Preprocessor(6).matrices_to_trius(weighted_graphs())
+
+def test_trius_to_inputs_cache(tmp_path, trius):
+    preprocessor = Preprocessor(6)
+    arguments = (trius, preprocessor, ["ones", True, True], preprocessor.vdegree_weighted_nf, [True])
+    node_features, adjacency_matrices = trius_to_inputs(*arguments)
+    #The first call computes and stores the inputs, the second call maps the stored inputs
+    for _ in range(2):
+        cached_features, cached_matrices = trius_to_inputs(*arguments, cache_dir=str(tmp_path))
+        assert np.array_equal(cached_features, node_features)
+        assert np.array_equal(cached_matrices, adjacency_matrices)
+    assert isinstance(cached_features, np.memmap) and isinstance(cached_matrices, np.memmap)
+    assert len(list(tmp_path.iterdir()))==2
+    #Other inputs miss the cache
+    other_features, _ = trius_to_inputs(trius[:10], *arguments[1:], cache_dir=str(tmp_path))
+    assert not isinstance(other_features, np.memmap)
+    assert np.array_equal(other_features, node_features[:10])
+    assert len(list(tmp_path.iterdir()))==4
+
+def test_feature_cache_key(monkeypatch, trius):
+    preprocessor = Preprocessor(6)
+    key = lambda trius=trius, am_args=["ones"], method=preprocessor.vdegree_weighted_nf, nf_args=[True]: \
+              feature_cache_key(trius, preprocessor, am_args, method, nf_args)
+    reference = key()
+    assert key(trius=np.copy(trius))==reference
+    changed_trius = np.copy(trius)
+    changed_trius[3, 4] += 1
+    keys = [key(trius=changed_trius), key(trius=trius.astype(np.float32)), key(trius=trius[:-1]),
+            key(am_args=["zeros"]), key(method=preprocessor.pdegree_weighted_nf), key(nf_args=[False])]
+    monkeypatch.setattr(Datasets, "feature_cache_version", Datasets.feature_cache_version+1)
+    keys.append(key())
+    assert len(set(keys+[reference]))==len(keys)+1
+
+def reference_split_dataset(input_values, target_values, data_frac, seed, stratify=True):
+    """
+    The split as it was computed by passing the inputs and targets through train_test_split twice
+    """
+    bins = lambda values: bin_values(values, 10) if stratify else None
+    train_input, valtest_input, train_output, valtest_output = train_test_split(
+        input_values, target_values, test_size=data_frac, random_state=seed, stratify=bins(target_values))
+    val_input, test_input, val_output, test_output = train_test_split(
+        valtest_input, valtest_output, test_size=0.5, random_state=seed, stratify=bins(valtest_output))
+    return train_input, val_input, test_input, train_output, val_output, test_output
+
+@pytest.fixture
+def dataset(rng):
+    return rng.uniform(-5, 0, (500, 21)), rng.uniform(1, 10, (500, 1))
+
+@pytest.mark.parametrize("stratify", [True, False])
+@pytest.mark.parametrize("seed", [0, 42])
+def test_split_dataset(dataset, stratify, seed):
+    inputs, targets = dataset
+    split = split_dataset(inputs, targets, 0.2, seed, stratify=stratify)
+    reference = reference_split_dataset(inputs, targets, 0.2, seed, stratify=stratify)
+    assert len(split)==6
+    for values, reference_values in zip(split, reference):
+        assert np.array_equal(values, reference_values)
+    assert len(split_dataset(inputs, targets, 0.2, seed, stratify=stratify, return_output=False))==3
+    #The rows of a list are selected as a list
+    list_split = split_dataset(list(inputs), targets, 0.2, seed, stratify=stratify)
+    for values, reference_values in zip(list_split[:3], reference[:3]):
+        assert isinstance(values, list)
+        assert np.array_equal(values, reference_values)
+
+def test_split_indices(tmp_path, dataset):
+    inputs, targets = dataset
+    split = split_indices(targets, 0.2, 0)
+    for indices, reference_input in zip(split, reference_split_dataset(inputs, targets, 0.2, 0)):
+        assert np.array_equal(inputs[indices], reference_input)
+    #The targets can be binned in chunks and read from an HDF5 file
+    with f(str(tmp_path/"targets.h5"), "w") as h5_file:
+        h5_file.create_dataset("targets", data=targets)
+        for chunked_split in [split_indices(targets, 0.2, 0, chunk_size=64),
+                              split_indices(h5_file["targets"], 0.2, 0, chunk_size=64)]:
+            for indices, chunked_indices in zip(split, chunked_split):
+                assert np.array_equal(indices, chunked_indices)
@@ -0,0 +1,145 @@
+import time
+from itertools import permutations
+import numpy as np
+import pytest
+from gqcml.data_generators import graph_sampler
+
+def triu(matrix):
+    return matrix[np.triu_indices(len(matrix))]
+
+def reference_automorphisms(matrix):
+    """
+    The automorphisms of a small graph by checking every permutation of its vertices
+    """
+    return [permutation for permutation in permutations(range(len(matrix)))
+            if np.array_equal(matrix[np.ix_(permutation, permutation)], matrix)]
+
+def reference_canonical_diagonals(nmb_el_type, matrix):
+    """
+    The lexicographically smallest diagonal of every orbit of the diagonals under the automorphisms
+    """
+    diagonal = sum([[idx+1]*nmb for idx, nmb in enumerate(nmb_el_type)], [])
+    automorphisms = reference_automorphisms(matrix)
+    return sorted({min(tuple(ordering[vertex] for vertex in automorphism) for automorphism in automorphisms)
+                   for ordering in set(permutations(diagonal))})
+
+def sample(samples, chunk_size):
+    """
+    Collects the samples of the chunked sampling mode, the chunks are drawn before the random state is reset
+    """
+    return samples if chunk_size is None else np.concatenate(list(samples))
+
+def chunk_amounts(amount_samples, chunk_size):
+    if chunk_size is None:
+        return [amount_samples]
+    return [min(chunk_size, amount_samples-start) for start in range(0, amount_samples, chunk_size)]
+
+def reference_homogeneous_samples(triu_vector, amount_samples):
+    """
+    The homogeneous samples as they were constructed one system at a time from the same random numbers
+    """
+    sites = int(np.sqrt(2*len(triu_vector)))
+    diagonal_samples = np.random.uniform(-5, 0.001, amount_samples)
+    off_diagonal_samples = np.random.uniform(-5, -0.001, amount_samples)
+    rows, columns = np.triu_indices(sites)
+    return np.array([np.where(rows==columns, diagonal, np.where(triu_vector==1, off_diagonal, 0))
+                     for diagonal, off_diagonal in zip(diagonal_samples, off_diagonal_samples)])
+
+def reference_inhomogeneous_samples(diagonal_vector, triu_vector, amount_samples):
+    """
+    The inhomogeneous samples as they were constructed one system at a time: an edge is the average of the samples
+    of the types of its vertices
+    """
+    sites = len(diagonal_vector)
+    types = np.array(diagonal_vector)-1
+    off_diagonal_samples = np.random.uniform(-5, -0.001, (max(diagonal_vector), amount_samples))
+    diagonal_samples = np.random.uniform(-5, 0.001, (max(diagonal_vector), amount_samples))
+    samples = []
+    for off_diagonal, diagonal in zip(off_diagonal_samples.T, diagonal_samples.T):
+        matrix = 0.5*(off_diagonal[types][None, :]+off_diagonal[types][:, None])
+        matrix[np.diag_indices(sites)] = diagonal[types]
+        samples.append(np.where(triu_vector!=0, triu(matrix), 0))
+    return np.array(samples)
+
+@pytest.mark.parametrize("chunk_size", [None, 16])
+def test_sample_homogeneous_matrix(ring, chunk_size):
+    triu_vector = triu(ring(6, chord=True))
+    np.random.seed(0)
+    samples = sample(graph_sampler(6).sample_homogeneous_matrix(triu_vector, 50, chunk_size=chunk_size), chunk_size)
+    np.random.seed(0)
+    #Every chunk draws its own random numbers
+    reference = np.concatenate([reference_homogeneous_samples(triu_vector, amount_samples)
+                                for amount_samples in chunk_amounts(50, chunk_size)])
+    assert np.array_equal(samples, reference)
+
+@pytest.mark.parametrize("chunk_size", [None, 16])
+@pytest.mark.parametrize("diagonal_vector", [[1,2,1,2,1,2], [1,1,3,2,2,3], [1,1,1,1,1,1]])
+def test_sample_inhomogeneous_matrix(ring, diagonal_vector, chunk_size):
+    triu_vector = triu(ring(6, chord=True))
+    np.random.seed(0)
+    samples = sample(graph_sampler(6).sample_inhomogeneous_matrix(diagonal_vector, triu_vector, 50, chunk_size=chunk_size),
+                     chunk_size)
+    np.random.seed(0)
+    reference = np.concatenate([reference_inhomogeneous_samples(diagonal_vector, triu_vector, amount_samples)
+                                for amount_samples in chunk_amounts(50, chunk_size)])
+    assert np.array_equal(samples, reference)
+
+@pytest.mark.parametrize("nmb_el_type", [[2,2], [3,1,2], [1,1,1,1,1,1]])
+def test_generate_diagonal_vector(nmb_el_type):
+    diagonal = sum([[idx+1]*nmb for idx, nmb in enumerate(nmb_el_type)], [])
+    reference = sorted(list(ordering) for ordering in set(permutations(diagonal)))
+    sampler = graph_sampler(len(diagonal))
+    assert sampler.generate_diagonal_vector(nmb_el_type)==reference
+    assert list(sampler.generate_diagonal_vector(nmb_el_type, lazy=True))==reference
+
+@pytest.mark.parametrize("sites, chord, nmb_el_type", [(6, False, [3,3]), (6, True, [2,2,2]), (7, False, [3,2,2]),
+                                                       (7, True, [1,2,2,2])])
+@pytest.mark.parametrize("max_automorphisms", [5000, 0])
+def test_canonical_diagonals(ring, sites, chord, nmb_el_type, max_automorphisms):
+    matrix = ring(sites, chord=chord)
+    sampler = graph_sampler(sites)
+    assert sorted(map(tuple, sampler.automorphisms(triu(matrix))))==reference_automorphisms(matrix)
+    #Without enumerating the automorphisms the smaller prefixes are searched for
+    diagonals = sampler._graph_sampler__canonical_diagonals(nmb_el_type, triu(matrix), max_automorphisms=max_automorphisms)
+    assert list(map(tuple, diagonals))==reference_canonical_diagonals(nmb_el_type, matrix)
+    if max_automorphisms:
+        assert list(map(tuple, sampler.generate_diagonal_vector(nmb_el_type, triu(matrix))))==\
+               reference_canonical_diagonals(nmb_el_type, matrix)
+
+def test_twin_diagonals():
+    #Vertices 1-3 are twins: the permutations of their values are automorphisms
+    matrix = np.eye(6)
+    matrix[0, 1:4] = matrix[1:4, 0] = matrix[4, 1:4] = matrix[1:4, 4] = matrix[4, 5] = matrix[5, 4] = 1
+    sampler = graph_sampler(6)
+    for max_automorphisms in [5000, 0]:
+        diagonals = sampler._graph_sampler__canonical_diagonals([2,2,2], triu(matrix), max_automorphisms=max_automorphisms)
+        assert list(map(tuple, diagonals))==reference_canonical_diagonals([2,2,2], matrix)
+
+@pytest.mark.parametrize("graph", ["complete", "star"])
+def test_large_automorphism_groups(graph):
+    #The 12! and 11! automorphisms are neither enumerated nor are the 369600 orderings visited
+    matrix = np.ones((12, 12)) if graph=="complete" else np.eye(12)
+    matrix[0] = matrix[:, 0] = 1
+    sampler = graph_sampler(12)
+    with pytest.raises(ValueError):
+        sampler.automorphisms(triu(matrix), max_automorphisms=1000)
+    start = time.perf_counter()
+    diagonals = sampler.generate_diagonal_vector([3,3,3,3], triu(matrix))
+    assert time.perf_counter()-start<5
+    if graph=="complete":
+        assert diagonals==[[1,1,1,2,2,2,3,3,3,4,4,4]]
+    else:
+        #Only the value of the center matters
+        assert [diagonal[0] for diagonal in diagonals]==[1,2,3,4]
+        assert all(diagonal[1:]==sorted(diagonal[1:]) for diagonal in diagonals)
+
+def test_permutate_matrices(rng):
+    matrices = rng.uniform(-5, 0, (4, 5, 5))
+    orderings = [list(ordering) for ordering in permutations(range(5))][::7]
+    sampler = graph_sampler(5)
+    permutated_matrices = sampler.permutate_matrices(matrices, orderings)
+    assert permutated_matrices.shape==(4, len(orderings), 5, 5)
+    for matrix, permutated in zip(matrices, permutated_matrices):
+        reference = [np.take(np.take(matrix, ordering, axis=0), ordering, axis=1) for ordering in orderings]
+        assert np.array_equal(sampler.permutate_matrix(matrix, orderings), reference)
+        assert np.array_equal(permutated, reference)
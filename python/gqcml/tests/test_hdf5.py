@@ -0,0 +1,91 @@
+import gc
+import os
+import pickle
+import numpy as np
+import pytest
+import torch
+from h5py import File as f
+from gqcml.datasets import HDF5Dataset, DataLoader_constructor
+
+@pytest.fixture
+def rows(rng):
+    return {"node_features":rng.uniform(size=(100, 6, 2)), "adjacency_matrices":rng.uniform(size=(100, 6, 6)),
+            "targets":rng.uniform(size=100)}
+
+@pytest.fixture
+def hdf5_file(tmp_path, rows):
+    filepath = str(tmp_path/"dataset.h5")
+    with f(filepath, "w") as h5_file:
+        for key, values in rows.items():
+            h5_file.create_dataset(key, data=values, chunks=(16,)+values.shape[1:])
+    return filepath
+
+def assert_datapoint(datapoint, rows, idx):
+    assert len(datapoint)==3
+    for tensor, key in zip(datapoint, ["node_features", "adjacency_matrices", "targets"]):
+        assert torch.equal(tensor, torch.as_tensor(rows[key][idx]).reshape(tensor.shape))
+
+@pytest.fixture
+def dataset(hdf5_file):
+    return HDF5Dataset(hdf5_file, ["node_features", "adjacency_matrices"], "targets", read_ahead=1)
+
+def test_sequential_reads(dataset, rows):
+    assert len(dataset)==100 and dataset.chunk_size==16
+    for idx in range(len(dataset)):
+        assert_datapoint(dataset[idx], rows, idx)
+        #The chunk containing the datapoint is read together with the following chunk
+        assert dataset._block_start==(idx//32)*32
+        assert len(dataset._block[-1])==min(32, 100-dataset._block_start)
+
+def test_random_reads(dataset, rows):
+    assert_datapoint(dataset[0], rows, 0)
+    block = dataset._block
+    #A random access reads the requested row only and leaves the block intact
+    for idx in [70, 3, 99, -1, 40]:
+        assert_datapoint(dataset[idx], rows, idx)
+        assert dataset._block is block
+
+@pytest.mark.parametrize("indices", [[10, 11, 12, 13], [5, 3, 3, 90, 5], [42]])
+def test_read_batch(dataset, rows, indices):
+    for batch in [dataset.read_batch(indices), dataset[indices], dataset[np.array(indices)]]:
+        assert_datapoint(batch, rows, indices)
+
+def test_reopen(dataset, rows, monkeypatch):
+    assert_datapoint(dataset[0], rows, 0)
+    h5_file = dataset._file
+    #A process with another id, e.g. a forked worker, opens its own file and leaves the inherited handle open
+    monkeypatch.setattr(os, "getpid", lambda: -1)
+    assert_datapoint(dataset[1], rows, 1)
+    assert dataset._file is not h5_file and h5_file
+    monkeypatch.undo()
+    copy = pickle.loads(pickle.dumps(dataset))
+    assert copy._file is None
+    assert_datapoint(copy[5], rows, 5)
+    h5_file = copy._file
+    del copy
+    gc.collect()
+    assert not h5_file
+
+def loader_batches(loader):
+    return [[tensor.clone() for tensor in batch] for batch in loader]
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+@pytest.mark.parametrize("shuffle", [False, True])
+@pytest.mark.parametrize("batch_fetch", [None, True, False])
+@pytest.mark.parametrize("drop_last", [False, True])
+def test_DataLoader_constructor(hdf5_file, rows, num_workers, shuffle, batch_fetch, drop_last):
+    #The batches read from the file are equal to the batches of the data in memory
+    torch.manual_seed(0)
+    loader = DataLoader_constructor(["node_features", "adjacency_matrices"], "targets", 32, shuffle=shuffle,
+                                    num_workers=num_workers, hdf5_file=hdf5_file, read_ahead=1,
+                                    batch_fetch=batch_fetch, drop_last=drop_last)
+    batches = loader_batches(loader)
+    torch.manual_seed(0)
+    memory_loader = DataLoader_constructor([rows["node_features"], rows["adjacency_matrices"]], rows["targets"], 32,
+                                           shuffle=shuffle, batch_fetch=batch_fetch is not False and shuffle,
+                                           drop_last=drop_last)
+    memory_batches = loader_batches(memory_loader)
+    assert [len(batch[-1]) for batch in batches]==([32]*3 if drop_last else [32]*3+[4])
+    for batch, memory_batch in zip(batches, memory_batches):
+        for tensor, memory_tensor in zip(batch, memory_batch):
+            assert torch.equal(tensor, memory_tensor)
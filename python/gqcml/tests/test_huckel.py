@@ -0,0 +1,78 @@
+import numpy as np
+import scipy.linalg
+import pytest
+from gqcml.data_generators import HuckelSolver, density_matrix, occupation_numbers
+
+def reference_occupations(eigenvals, electrons):
+    """
+    The occupations as they were constructed per system from the (N x N) matrix of degenerate eigenvalue pairs
+    """
+    degenerate = np.isclose(eigenvals[:, None], eigenvals[None, :])
+    return (np.arange(len(eigenvals))<electrons).dot(degenerate/np.sum(degenerate, 0)[:, None])
+
+def reference_density_matrix(eigenvecs, ONV):
+    """
+    The density matrix as it was accumulated orbital by orbital
+    """
+    return sum(occupation*np.outer(MO, MO) for occupation, MO in zip(ONV, eigenvecs.T))
+
+def reference_solve(H, N_a, N_b, S=None):
+    """
+    Solves a single system as the per-system solver did
+    """
+    eigenvals, eigenvecs = np.linalg.eigh(H) if S is None else scipy.linalg.eigh(H, S)
+    ONV_a, ONV_b = reference_occupations(eigenvals, N_a), reference_occupations(eigenvals, N_b)
+    E = eigenvals.dot(ONV_a)+eigenvals.dot(ONV_b)
+    return E, reference_density_matrix(eigenvecs, ONV_a)+reference_density_matrix(eigenvecs, ONV_b)
+
+def test_density_matrix(hamiltonians):
+    eigenvals, eigenvecs = np.linalg.eigh(hamiltonians)
+    ONV = occupation_numbers(eigenvals, 3)
+    P = density_matrix(eigenvecs, ONV)
+    P_exact = density_matrix(eigenvecs, ONV, exact=True)
+    P_single = density_matrix(eigenvecs, ONV, dtype=np.float32)
+    assert P_single.dtype==np.float32
+    for idx in range(len(hamiltonians)):
+        reference_P = reference_density_matrix(eigenvecs[idx], ONV[idx])
+        assert np.array_equal(P_exact[idx], reference_P)
+        assert np.allclose(P[idx], reference_P)
+        assert np.allclose(P_single[idx], reference_P, atol=1e-5)
+    assert np.array_equal(density_matrix(eigenvecs[0], ONV[0], exact=True), P_exact[0])
+
+@pytest.mark.parametrize("overlap", [False, True])
+@pytest.mark.parametrize("N_a, N_b", [(3, 2), (3, 3)])
+def test_solve_batch(hamiltonians, overlap, N_a, N_b):
+    S = np.eye(6)+0.1*(np.ones((6, 6))-np.eye(6)) if overlap else None
+    E, P = HuckelSolver().solve_batch(hamiltonians, N_a, N_b, S=S)
+    for idx in range(len(hamiltonians)):
+        reference_E, reference_P = reference_solve(hamiltonians[idx], N_a, N_b, S=S)
+        assert np.isclose(E[idx], reference_E)
+        assert np.allclose(P[idx], reference_P)
+
+def test_single_system(hamiltonians):
+    solver = HuckelSolver()
+    solver.solve_ndo(hamiltonians[1])
+    E = solver.compute_energy(3, 2)
+    P = solver.compute_density_matrix(3, 2, exact=True)
+    reference_E, reference_P = reference_solve(hamiltonians[1], 3, 2)
+    assert np.isclose(E, reference_E)
+    assert np.array_equal(P, reference_P)
+
+@pytest.mark.parametrize("N_a, N_b", [(3, 2), (1, 0), (4, 4), (6, 5)])
+def test_occupation_numbers(hamiltonians, N_a, N_b):
+    eigenvals = np.linalg.eigh(hamiltonians)[0]
+    ONV_a, ONV_b = occupation_numbers(eigenvals, [N_a, N_b])
+    assert np.array_equal(occupation_numbers(eigenvals, N_a), ONV_a)
+    for idx in range(len(hamiltonians)):
+        assert np.allclose(ONV_a[idx], reference_occupations(eigenvals[idx], N_a))
+        assert np.allclose(ONV_b[idx], reference_occupations(eigenvals[idx], N_b))
+
+def test_cached_occupations(hamiltonians):
+    #The ONVs of the previous system are not reused for a system of a different size with the same electrons
+    solver = HuckelSolver()
+    solver.solve_ndo(hamiltonians[0])
+    solver.compute_energy(2, 2)
+    solver.eigenvals, solver.eigenvecs = np.linalg.eigh(hamiltonians[1, :4, :4])
+    reference_E, reference_P = reference_solve(hamiltonians[1, :4, :4], 2, 2)
+    assert np.isclose(solver.compute_energy(2, 2), reference_E)
+    assert np.allclose(solver.compute_density_matrix(2, 2), reference_P)
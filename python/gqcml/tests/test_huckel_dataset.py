@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from h5py import File as f
+from gqcml.data import Preprocessor
+from gqcml.data_generators import HuckelSolver, generate_huckel_dataset
+
+def generate(filepath, ring, **kwargs):
+    settings = dict(sites=6, triu_vector=ring(6)[np.triu_indices(6)], amount_samples=250, N_a=3, N_b=3,
+                    diagonal_vector=[1,2,1,2,1,2], shard_size=60, processes=2, density=True)
+    settings.update(kwargs)
+    generate_huckel_dataset(filepath, **settings)
+    with f(filepath, "r") as h5_file:
+        return {name:np.array(h5_file[name]) for name in ["train_input", "train_energy", "train_density"]
+                if name in h5_file}
+
+def test_generate_huckel_dataset(tmp_path, ring):
+    dataset = generate(str(tmp_path/"huckel.h5"), ring)
+    assert dataset["train_input"].shape==(250, 21)
+    preprocessor = Preprocessor(6)
+    solver = HuckelSolver()
+    solver.solve_ndo(preprocessor.trius_to_matrices(dataset["train_input"]))
+    assert np.allclose(dataset["train_energy"], solver.compute_energy(3, 3))
+    assert np.allclose(dataset["train_density"], preprocessor.matrices_to_trius(solver.compute_density_matrix(3, 3)))
+    #Every shard has its own seed, so the dataset does not depend on the number of processes
+    for processes in [1, 3]:
+        other = generate(str(tmp_path/("huckel_"+str(processes)+".h5")), ring, processes=processes)
+        for name in dataset:
+            assert np.array_equal(dataset[name], other[name])
+
+def test_resume(tmp_path, ring):
+    dataset = generate(str(tmp_path/"complete.h5"), ring)
+    filepath = str(tmp_path/"interrupted.h5")
+    generate(filepath, ring)
+    #Interrupt the generation after two shards while the third shard was partially written
+    with f(filepath, "a") as h5_file:
+        h5_file["train_input"].attrs["completed_shards"] = 2
+        for name in dataset:
+            h5_file[name].resize(150, axis=0)
+            h5_file[name][120:] = 0
+    resumed = generate(filepath, ring)
+    for name in dataset:
+        assert np.array_equal(dataset[name], resumed[name])
+
+@pytest.mark.parametrize("settings", [{"seed":1}, {"N_a":2}, {"shard_size":50}, {"diagonal_vector":None},
+                                      {"density":False}])
+def test_resume_mismatch(tmp_path, ring, settings):
+    filepath = str(tmp_path/"huckel.h5")
+    generate(filepath, ring)
+    with pytest.raises(ValueError):
+        generate(filepath, ring, **settings)
+
+def test_resume_missing_density(tmp_path, ring):
+    filepath = str(tmp_path/"huckel.h5")
+    generate(filepath, ring, density=False)
+    with pytest.raises(ValueError):
+        generate(filepath, ring, density=True)
@@ -0,0 +1,25 @@
+import time
+from multiprocessing import Pool
+import pytest
+from gqcml.utils import imap_bounded
+
+def delayed_square(task):
+    #The earlier tasks finish last
+    time.sleep(0.01*(5-task%5))
+    return task**2
+
+@pytest.mark.parametrize("max_pending", [1, 3, 100])
+def test_imap_bounded(max_pending):
+    drawn = []
+    def tasks():
+        for task in range(12):
+            drawn.append(task)
+            yield task
+    results = []
+    with Pool(2) as pool:
+        for result in imap_bounded(pool, delayed_square, tasks(), max_pending):
+            #The tasks are only drawn when a result has been retrieved
+            assert len(drawn)<=len(results)+max_pending
+            results.append(result)
+        assert list(imap_bounded(pool, delayed_square, [], max_pending))==[]
+    assert results==[task**2 for task in range(12)]
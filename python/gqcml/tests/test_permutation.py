@@ -0,0 +1,27 @@
+import numpy as np
+import torch
+from gqcml.transforms import permute, RandomPermutation
+
+def test_permute(rng):
+    node_features = torch.tensor(rng.uniform(size=(3, 5, 2)))
+    adjacency_matrices = torch.tensor(rng.uniform(size=(3, 5, 5)))
+    orderings = torch.stack([torch.randperm(5) for _ in range(3)])
+    permuted_features, permuted_matrices = permute(node_features, adjacency_matrices, orderings)
+    for idx, ordering in enumerate(orderings):
+        assert torch.equal(permuted_features[idx], node_features[idx][ordering])
+        assert torch.equal(permuted_matrices[idx], adjacency_matrices[idx][ordering][:, ordering])
+
+def test_random_permutation(rng):
+    node_features = torch.tensor(rng.uniform(size=(4, 5, 2)))
+    adjacency_matrices = torch.tensor(rng.uniform(size=(4, 5, 5)))
+    targets = torch.arange(4)
+    dataset = RandomPermutation(torch.utils.data.TensorDataset(node_features, adjacency_matrices, targets))
+    assert len(dataset)==4
+    torch.manual_seed(0)
+    permuted_features, permuted_matrix, target = dataset[2]
+    torch.manual_seed(0)
+    ordering = torch.randperm(5)
+    #The same ordering is applied to the node features and to the rows and columns of the adjacency matrix
+    assert torch.equal(permuted_features, node_features[2][ordering])
+    assert torch.equal(permuted_matrix, adjacency_matrices[2][ordering][:, ordering])
+    assert target==2
@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+from gqcml.data import Preprocessor
+
+def edges(matrix):
+    """
+    The pairs of vertices (i, j) that share an edge, in both directions and without the self loops
+    """
+    return [(i, j) for i in range(len(matrix)) for j in range(len(matrix)) if i!=j and matrix[i, j]!=0]
+
+def compare(feature, reference, matrices):
+    """
+    Compares the features of a stack of matrices with the reference that is computed one graph at a time. A single
+    matrix gives the same result as the stack
+    """
+    features = feature(matrices)
+    for matrix, matrix_features in zip(matrices, features):
+        assert np.allclose(matrix_features, reference(matrix))
+    assert np.allclose(feature(matrices[0]), features[0])
+
+def reference_weights_nf(matrix, edge_weights=False):
+    return np.array([[matrix[i, i]]+[np.mean([matrix[i, j] for k, j in edges(matrix) if k==i])]*edge_weights
+                     for i in range(len(matrix))])
+
+@pytest.mark.parametrize("edge_weights", [False, True])
+def test_weights_nf(weighted_graphs, edge_weights):
+    preprocessor = Preprocessor(6)
+    compare(lambda matrix: preprocessor.weights_nf(matrix, edge_weights),
+            lambda matrix: reference_weights_nf(matrix, edge_weights), weighted_graphs())
+
+def reference_vdegree_nf(matrix, categorical=True, num_degrees=3):
+    degrees = np.array([sum(i==vertex for i, j in edges(matrix)) for vertex in range(len(matrix))])
+    return np.eye(num_degrees)[degrees-1] if categorical else degrees.reshape(-1, 1)
+
+@pytest.mark.parametrize("categorical, num_degrees", [(False, 3), (True, 3), (True, 4)])
+def test_vdegree_nf(weighted_graphs, categorical, num_degrees):
+    preprocessor = Preprocessor(6)
+    compare(lambda matrix: preprocessor.vdegree_nf(matrix, categorical, num_degrees),
+            lambda matrix: reference_vdegree_nf(matrix, categorical, num_degrees), weighted_graphs())
+
+def neighbourhood_features(matrix, self_loop_features, edge_classes, num_classes):
+    """
+    The self loop weighted classes followed by the average self loop of the neighbours and the average edge weight,
+    both per class, where every edge (i, j) is accumulated edge by edge in the row of vertex i and in the class
+    edge_classes(i, j)
+    """
+    count, vertex_sum, edge_sum = np.zeros((3, len(matrix), num_classes))
+    for i, j in edges(matrix):
+        count[i] += edge_classes(i, j)
+        vertex_sum[i] += edge_classes(i, j)*matrix[j, j]
+        edge_sum[i] += edge_classes(i, j)*matrix[i, j]
+    average = lambda total: np.divide(total, count, out=np.zeros(count.shape), where=count!=0)
+    return np.concatenate([self_loop_features, average(vertex_sum), average(edge_sum)], 1)
+
+def reference_vdegree_weighted_nf(matrix, neighbourhood=False, weight_method="average"):
+    #The neighbours are counted in the degree class of the central vertex or in their own degree class
+    degrees = reference_vdegree_nf(matrix)
+    self_loop_features = np.diag(matrix)[:, None]*degrees
+    if not neighbourhood:
+        return self_loop_features
+    edge_classes = (lambda i, j: degrees[i]) if weight_method=="average" else (lambda i, j: degrees[j])
+    return neighbourhood_features(matrix, self_loop_features, edge_classes, 3)
+
+@pytest.mark.parametrize("neighbourhood, weight_method", [(False, "average"), (True, "average"),
+                                                          (True, "linear combination")])
+def test_vdegree_weighted_nf(weighted_graphs, neighbourhood, weight_method):
+    preprocessor = Preprocessor(6)
+    compare(lambda matrix: preprocessor.vdegree_weighted_nf(matrix, neighbourhood, weight_method),
+            lambda matrix: reference_vdegree_weighted_nf(matrix, neighbourhood, weight_method), weighted_graphs())
+
+def reference_pdegree_weighted_nf(matrix, num_degrees):
+    #The neighbours are counted in the class of the pair (degree of the central vertex, degree of the neighbour),
+    #the self loops always weight the three default degree classes
+    degrees = reference_vdegree_nf(matrix, num_degrees=num_degrees)
+    pairs = lambda i, j: np.outer(degrees[i], degrees[j]).flatten()
+    return neighbourhood_features(matrix, np.diag(matrix)[:, None]*reference_vdegree_nf(matrix), pairs, num_degrees**2)
+
+@pytest.mark.parametrize("num_degrees", [3, 4])
+def test_pdegree_weighted_nf(weighted_graphs, num_degrees):
+    preprocessor = Preprocessor(6)
+    compare(lambda matrix: preprocessor.pdegree_weighted_nf(matrix, num_degrees),
+            lambda matrix: reference_pdegree_weighted_nf(matrix, num_degrees), weighted_graphs())
+
+def test_pdegree_weighted_nf_degree_bound(weighted_graphs):
+    #The vertices 0 and 3 have a degree of 3
+    with pytest.raises(ValueError):
+        Preprocessor(6).pdegree_weighted_nf(weighted_graphs(), 2)
+
+def test_triu_to_matrix(weighted_graphs):
+    preprocessor = Preprocessor(6)
+    matrices = weighted_graphs()
+    #The upper triangle is stored row by row
+    trius = np.array([[matrix[i, j] for i in range(6) for j in range(i, 6)] for matrix in matrices])
+    assert np.array_equal(preprocessor.triu_to_matrix(trius), matrices)
+    assert np.array_equal(preprocessor.triu_to_matrix(trius[0]), matrices[0])
+    assert np.array_equal(preprocessor.matrices_to_trius(matrices), trius)
+    #The output buffers are overwritten completely
+    out = np.full(matrices.shape, np.nan)
+    assert preprocessor.trius_to_matrices(trius, out=out) is out
+    assert np.array_equal(out, matrices)
+    out = np.full(trius.shape, np.nan)
+    preprocessor.matrices_to_trius(matrices, out=out)
+    assert np.array_equal(out, trius)
+
+def reference_adjacency_matrix(matrix, diagonal=None, normalize=False, negative_weights=False):
+    """
+    The adjacency matrix of a single graph, normalized with the diagonal degree matrix. With diagonal="ones" the
+    self loops are added after the normalization
+    """
+    adjacency_matrix = np.copy(matrix)
+    if diagonal is not None:
+        adjacency_matrix[np.diag_indices(len(matrix))] = 0
+    if normalize:
+        degree_matrix = np.diag(np.sum(np.abs(adjacency_matrix) if negative_weights else adjacency_matrix, 0))
+        normalization_factor = np.linalg.inv(np.sqrt(degree_matrix))
+        adjacency_matrix = normalization_factor.dot(adjacency_matrix).dot(normalization_factor)
+    return adjacency_matrix+np.eye(len(matrix))*(diagonal=="ones")
+
+@pytest.mark.parametrize("diagonal", [None, "ones", "zeros"])
+@pytest.mark.parametrize("normalize", [False, True])
+def test_adjacency_matrix(weighted_graphs, diagonal, normalize):
+    preprocessor = Preprocessor(6)
+    compare(lambda matrix: preprocessor.adjacency_matrix(matrix, diagonal, normalize),
+            lambda matrix: reference_adjacency_matrix(matrix, diagonal, normalize), weighted_graphs(positive=True))
+    compare(lambda matrix: preprocessor.adjacency_matrix(matrix, diagonal, normalize, negative_weights=True),
+            lambda matrix: reference_adjacency_matrix(matrix, diagonal, normalize, negative_weights=True),
+            weighted_graphs())
+    matrices = weighted_graphs()
+    reference = preprocessor.adjacency_matrix(matrices, diagonal, normalize, negative_weights=True)
+    assert preprocessor.adjacency_matrix(matrices, diagonal, normalize, negative_weights=True, inplace=True) is matrices
+    assert np.array_equal(matrices, reference)
+
+def test_normalize_isolated_vertex(ring):
+    #The rows and columns of a vertex without edges are zero instead of nan
+    matrix = ring(6)
+    matrix[5] = matrix[:, 5] = 0
+    matrix[0, 4] = matrix[4, 0] = 1
+    normalized = Preprocessor(6).adjacency_matrix(matrix.astype(int), diagonal="zeros", normalize=True)
+    assert np.allclose(normalized[:5, :5], reference_adjacency_matrix(matrix[:5, :5], "zeros", True))
+    assert not np.any(normalized[5]) and not np.any(normalized[:, 5])
@@ -0,0 +1,160 @@
+import os
+import tarfile
+import numpy as np
+import pytest
+from h5py import File as f
+from scipy.spatial.distance import cdist
+from gqcml.data import format_dataset, parse_xyz, parse_xyz_batch, radius_graph, scalar_keys, xyz_to_graph
+
+def qm9_text(index, rng, num_atoms=None):
+    """
+    The content of a random xyz file in the format of the QM9 dataset, the small values are written with the Mathematica
+    exponents of the dataset (e.g. 1.5*^-6). The property and smiles lines end with a tab
+    """
+    num_atoms = rng.integers(1, 10) if num_atoms is None else num_atoms
+    number = lambda value: (str(round(value*1e6, 4))+"*^-6") if abs(value)<1e-3 else str(value)
+    lines = [str(num_atoms), "\t".join(["gdb "+str(index)]+[number(value) for value in rng.normal(0, 1e-2, 15)])+"\t"]
+    for atom in rng.choice(["H", "C", "N", "O", "F"], num_atoms):
+        lines.append("\t".join([atom]+[number(value) for value in rng.normal(0, 2, 4)]))
+    lines.append("\t".join(str(value) for value in rng.uniform(100, 4000, max(3*num_atoms-6, 1)).round(4)))
+    lines.append("C"*num_atoms+"\t"+"C"*num_atoms+"\t")
+    lines.append("InChI=1S/"+str(index)+"\tInChI=1S/"+str(index))
+    return "\n".join(lines)+"\n"
+
+def reference_parse_xyz(text):
+    """
+    The molecule parsed line by line and field by field
+    """
+    lines = text.replace("*^", "e").splitlines()
+    atom_lines = [line.split("\t") for line in lines[2:2+int(lines[0])]]
+    return {"atoms":[{"H":1, "C":6, "N":7, "O":8, "F":9}[fields[0]] for fields in atom_lines],
+            "positions":[[float(value) for value in fields[1:4]] for fields in atom_lines],
+            "charges":[float(fields[4]) for fields in atom_lines],
+            "vibrational frequencies":lines[-3].split("\t"),
+            "scalar properties":dict(zip(scalar_keys, [float(value) for value in lines[1].split("\t")[1:16]])),
+            "smiles":dict(zip(["GDB17", "B3LYP"], lines[-2].split("\t"))),
+            "inchi":dict(zip(["Corina", "B3LYP"], lines[-1].split("\t")))}
+
+def pairwise_distances(positions):
+    """
+    The distances between all pairs of atoms, the distance of an atom to itself is infinite
+    """
+    distances = cdist(positions, positions)
+    distances[np.diag_indices(len(positions))] = np.inf
+    return distances
+
+def assert_edges(positions, edge_index, distances):
+    #The edges are sorted by source and target and the distances belong to the edges
+    assert edge_index.dtype==np.int64 and len(set(map(tuple, edge_index.T)))==edge_index.shape[1]
+    assert np.array_equal(np.lexsort((edge_index[1], edge_index[0])), np.arange(edge_index.shape[1]))
+    assert np.allclose(distances, pairwise_distances(positions)[edge_index[0], edge_index[1]])
+
+@pytest.fixture
+def positions(rng):
+    return rng.uniform(0, 6, (40, 3))
+
+@pytest.mark.parametrize("cutoff", [None, 1.5, 3.0])
+def test_radius_graph(positions, cutoff):
+    edge_index, distances = radius_graph(positions, cutoff=cutoff)
+    assert_edges(positions, edge_index, distances)
+    reference = np.argwhere(pairwise_distances(positions)<(np.inf if cutoff is None else cutoff)).T
+    assert np.array_equal(edge_index, reference)
+
+@pytest.mark.parametrize("cutoff", [None, 2.0])
+@pytest.mark.parametrize("max_neighbours", [1, 4, 60])
+def test_max_neighbours(positions, cutoff, max_neighbours):
+    #Triplicated atoms and a grid of atoms have several neighbours at the same distance, the duplicates of an atom
+    #can be found before the atom itself
+    grid = np.stack(np.meshgrid(*[np.arange(3.)]*3), -1).reshape(-1, 3)
+    for atoms in [positions, np.concatenate([positions]*3), grid]:
+        edge_index, distances = radius_graph(atoms, cutoff=cutoff, max_neighbours=max_neighbours)
+        assert_edges(atoms, edge_index, distances)
+        pair_distances = pairwise_distances(atoms)
+        within_cutoff = pair_distances<(np.inf if cutoff is None else cutoff)
+        for target in range(len(atoms)):
+            sources = edge_index[0, edge_index[1]==target]
+            #Every atom receives messages from its nearest neighbours within the cutoff, ties are broken arbitrarily
+            assert len(sources)==min(max_neighbours, within_cutoff[target].sum())
+            if len(sources)>0:
+                nearest = np.sort(pair_distances[target][within_cutoff[target]])[len(sources)-1]
+                assert np.all(pair_distances[target, sources]<=nearest)
+
+def test_single_atom():
+    for max_neighbours in [None, 3]:
+        edge_index, distances = radius_graph(np.zeros((1, 3)), cutoff=2.0, max_neighbours=max_neighbours)
+        assert edge_index.shape==(2, 0) and distances.shape==(0,)
+    edge_index, distances = radius_graph(np.zeros((1, 3)))
+    assert edge_index.shape==(2, 0) and distances.shape==(0,)
+
+def test_funcgroup_vector():
+    pybel = pytest.importorskip("openbabel.pybel")
+    from gqcml.data import funcgroup_smarts, funcgroup_vector
+    for smiles in ["COCC(=NC1C(O1)C)CCC(N)C(N(C))CC=O", "CC(OO)CN=NCC(F)CC(=O)F", "CC(=O)CC(=O)OC(=O)CC(=O)O", "C"]:
+        molecule = pybel.readstring("smi", smiles)
+        #A group is present when any atom matches its pattern
+        reference = [len(pybel.Smarts(smarts).findall(molecule))>0 for smarts in funcgroup_smarts]
+        assert funcgroup_vector(molecule).tolist()==reference
+
+def test_load_funcgroups(tmp_path, monkeypatch):
+    pybel = pytest.importorskip("openbabel.pybel")
+    from gqcml.data import QM9, funcgroup_vector, load_funcgroups
+    os.makedirs(tmp_path/"raw")
+    texts = []
+    for idx, smiles in enumerate(["CC(=O)CC(=O)OC(=O)CC(=O)O", "CC(OO)CN=NCC(F)CC(=O)F", "C#CC=C", "OCC1CO1", "N#CC"]):
+        molecule = pybel.readstring("smi", smiles)
+        molecule.make3D()
+        lines = molecule.write("xyz").splitlines()
+        lines[1] = "gdb "+str(idx+1)+"\t0.0"
+        texts.append("\n".join(lines)+"\n")
+        with open(tmp_path/"raw"/("dsgdb9nsd_"+str(idx+1).zfill(6)+".xyz"), "w") as xyz_file:
+            xyz_file.write(texts[-1])
+    indices, groups = load_funcgroups(str(tmp_path), batch_size=2, processes=2)
+    assert indices.tolist()==[1, 2, 3, 4, 5]
+    #The bit-packed vectors are unpacked to the vectors of the molecules
+    assert np.array_equal(groups, [funcgroup_vector(pybel.readstring("xyz", text)) for text in texts])
+    #The annotations are loaded from the file afterwards
+    monkeypatch.setattr(QM9, "annotate_dataset", None)
+    loaded_indices, loaded_groups = load_funcgroups(str(tmp_path))
+    assert np.array_equal(loaded_indices, indices) and np.array_equal(loaded_groups, groups)
+
+def test_format_dataset(tmp_path, rng):
+    texts = [qm9_text(index, rng) for index in range(1, 12)]
+    os.makedirs(tmp_path/"raw")
+    for index, text in enumerate(texts):
+        with open(tmp_path/"raw"/("dsgdb9nsd_"+str(index+1).zfill(6)+".xyz"), "w") as xyz_file:
+            xyz_file.write(text)
+    with tarfile.open(str(tmp_path/"dsgdb9nsd.xyz.tar.bz2"), "w:bz2") as archive:
+        archive.add(str(tmp_path/"raw"), arcname=".")
+    stores = []
+    for descr, settings in [("1", {"processes":1}), ("2", {"processes":2, "batch_size":2}),
+                            ("tar", {"processes":2, "batch_size":3, "archive":str(tmp_path/"dsgdb9nsd.xyz.tar.bz2")})]:
+        assert format_dataset(str(tmp_path), "U_0", descr, cutoff=3.0, **settings)==11
+        with f(str(tmp_path/"processed"/("QM9_"+descr+".h5")), "r") as h5_file:
+            stores.append({key:np.array(h5_file[key]) for key in h5_file})
+    #The molecules are stored in order, independent of the batches and the number of processes
+    graphs = [xyz_to_graph(parse_xyz(text), "U_0", cutoff=3.0) for text in texts]
+    assert np.array_equal(stores[0]["y"], np.concatenate([graph["y"] for graph in graphs]))
+    assert np.array_equal(stores[0]["edge_index"], np.concatenate([graph["edge_index"].T for graph in graphs]))
+    for store in stores[1:]:
+        assert store.keys()==stores[0].keys()
+        for key in store:
+            assert np.array_equal(store[key], stores[0][key])
+
+def test_parse_xyz_batch(rng):
+    #A molecule with a single atom is parsed as a (1 x 3) array of positions
+    texts = [qm9_text(1, rng, num_atoms=1)]+[qm9_text(index, rng) for index in range(2, 9)]
+    assert "*^" in "".join(texts)
+    mol_dicts = parse_xyz_batch(texts)
+    assert len(mol_dicts)==len(texts)
+    for text, mol_dict in zip(texts, mol_dicts):
+        reference = reference_parse_xyz(text)
+        assert mol_dict.keys()==reference.keys()
+        for key in ["atoms", "positions", "charges"]:
+            assert np.array_equal(mol_dict[key], reference[key])
+        assert mol_dict["positions"].shape==(len(reference["atoms"]), 3)
+        for key in ["vibrational frequencies", "scalar properties", "smiles", "inchi"]:
+            assert mol_dict[key]==reference[key]
+    #A single file is parsed with the distance matrix
+    mol_dict = parse_xyz(texts[3])
+    assert np.allclose(mol_dict["distances"], cdist(mol_dict["positions"], mol_dict["positions"]))
+    assert np.array_equal(parse_xyz(texts[0])["distances"], np.zeros((1, 1)))